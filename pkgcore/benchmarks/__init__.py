@@ -0,0 +1,10 @@
+# License: GPL2/BSD
+
+"""
+benchmarks of pkgcore internals against synthetic repositories
+
+:obj:`pkgcore.benchmarks.synthetic` generates ebuild repositories and vdbs
+of configurable size and shape, :obj:`pkgcore.benchmarks.suite` times
+resolution, queries, cache reads and visibility filtering against them.
+Run ``python -m pkgcore.benchmarks --help`` for usage.
+"""
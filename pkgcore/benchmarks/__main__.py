@@ -0,0 +1,103 @@
+# License: GPL2/BSD
+
+"""run the benchmark suite against a synthetic repository"""
+
+import os
+import shutil
+import tempfile
+
+from pkgcore.benchmarks import suite, synthetic
+from pkgcore.util import commandline
+
+argparser = commandline.mk_argparser(
+    config=False, domain=False, color=False, description=__doc__,
+    prog="python -m pkgcore.benchmarks")
+argparser.add_argument(
+    '-o', '--output', metavar='FILE',
+    help="write the results as JSON to FILE")
+argparser.add_argument(
+    '-c', '--compare', metavar='FILE',
+    help="compare the results against those of a prior run stored in FILE")
+argparser.add_argument(
+    '-b', '--benchmark', action='append', dest='benchmarks',
+    choices=[name for name, func in suite.benchmarks],
+    help="benchmark to run; may be given multiple times, defaults to all")
+argparser.add_argument(
+    '-r', '--repeat', type=int, default=3,
+    help="runs per benchmark; the fastest is compared. Defaults to 3.")
+argparser.add_argument(
+    '-d', '--dir', metavar='DIR',
+    help="generate the synthetic repository in DIR, reusing the one "
+         "already there if generated with the same params; by default a "
+         "temporary directory is used")
+generation = argparser.add_argument_group("synthetic repository params")
+for attr, default in synthetic.tree_params.defaults:
+    generation.add_argument(
+        '--%s' % (attr.replace('_', '-'),), type=type(default),
+        default=default, help="defaults to %s" % (default,))
+
+
+def _prepare(location, params, out):
+    marker = os.path.join(location, "params.json")
+    try:
+        if suite.read_results(marker) == params.to_dict():
+            return
+    except EnvironmentError:
+        pass
+    out.write("generating synthetic repository in %s" % (location,))
+    for x in ("repo", "cache", "vdb"):
+        shutil.rmtree(os.path.join(location, x), ignore_errors=True)
+    synthetic.generate(params, location)
+    suite.write_results(marker, params.to_dict())
+
+
+@argparser.bind_main_func
+def main(options, out, err):
+    params = synthetic.tree_params(**dict(
+        (attr, getattr(options, attr))
+        for attr, default in synthetic.tree_params.defaults))
+    prior = None
+    if options.compare:
+        try:
+            prior = suite.read_results(options.compare)
+        except (EnvironmentError, ValueError) as e:
+            err.write("failed reading %r: %s" % (options.compare, e))
+            return 1
+
+    location = options.dir
+    if location is None:
+        location = tempfile.mkdtemp(prefix="pkgcore-bench-")
+    try:
+        _prepare(location, params, out)
+
+        def observer(name, result):
+            out.write("%s: %.3fs, peak rss %i KiB" % (
+                name, result["time"], result["peak_rss_kb"]))
+        try:
+            results = suite.run_suite(
+                location, params, names=options.benchmarks,
+                repeat=max(options.repeat, 1), observer=observer)
+        except ValueError as e:
+            err.write("benchmark failed: %s" % (e,))
+            return 1
+    finally:
+        if options.dir is None:
+            shutil.rmtree(location, ignore_errors=True)
+
+    if options.output:
+        suite.write_results(options.output, results)
+    if prior is not None:
+        if prior.get("params") != results["params"]:
+            err.write("warning: compared results were generated with "
+                      "different params")
+        out.write()
+        out.write("%-12s %10s %10s %8s %12s" % (
+            "benchmark", "old", "new", "ratio", "rss delta"))
+        for name, old, new, old_rss, new_rss in suite.compare(prior, results):
+            out.write("%-12s %9.3fs %9.3fs %7.2fx %+9i KiB" % (
+                name, old, new, new / old if old else 0, new_rss - old_rss))
+    return 0
+
+
+if __name__ == '__main__':
+    commandline.main(argparser)
@@ -0,0 +1,212 @@
+# License: GPL2/BSD
+
+"""
+benchmark suite run against synthetic repositories
+
+Each benchmark is a function taking the generation location and
+:obj:`pkgcore.benchmarks.synthetic.tree_params`, doing any setup that
+shouldn't be timed, and returning the callable to time.  The callable may
+return a dict of extra info to record, e.g. the number of pkgs it handled.
+
+Every run happens in a forked process, so runs start from the same state
+and the peak memory usage recorded isn't inflated by prior runs.
+"""
+
+__all__ = ("benchmarks", "run_benchmark", "run_suite", "compare",
+           "write_results", "read_results")
+
+import json
+import os
+import platform
+import resource
+import time
+
+from snakeoil.demandload import demandload
+
+from pkgcore.benchmarks import synthetic
+from pkgcore.ebuild.atom import atom
+
+demandload(
+    'traceback',
+    'pkgcore.ebuild:resolver',
+    'pkgcore.repository:visibility',
+    'pkgcore.restrictions:packages,values',
+)
+
+
+def _targets(params):
+    # the first keys pull in the most, since deps only point at later keys.
+    keys = params.keys
+    return [atom(key) for key in keys[:max(1, len(keys) // 10)]]
+
+
+def bench_resolve(location, params):
+    repo, vdb = synthetic.load_repos(location)
+    resolver_inst = resolver.upgrade_resolver(
+        [vdb], [synthetic.configured_repo(repo)])
+    targets = _targets(params)
+
+    def f():
+        ret = resolver_inst.add_atoms(targets, finalize=True)
+        if ret:
+            raise ValueError("resolution failed: %s" % (ret[0],))
+        return {"targets": len(targets),
+                "ops": len(list(resolver_inst.state.iter_ops()))}
+    return f
+
+
+def bench_vdb_preload(location, params):
+    repo, vdb = synthetic.load_repos(location)
+    resolver_inst = resolver.upgrade_resolver(
+        [vdb], [synthetic.configured_repo(repo)])
+
+    def f():
+        resolver_inst.load_vdb_state()
+        return {"installed": len(resolver_inst.state.plan)}
+    return f
+
+
+def bench_itermatch(location, params):
+    repo, vdb = synthetic.load_repos(location)
+    atoms = [atom(key) for key in params.keys]
+
+    def f():
+        return {"matches": sum(len(repo.match(a)) for a in atoms)}
+    return f
+
+
+def bench_cache_read(location, params):
+    repo, vdb = synthetic.load_repos(location)
+
+    def f():
+        count = 0
+        for pkg in repo:
+            pkg.depends, pkg.rdepends, pkg.slot, pkg.keywords
+            count += 1
+        return {"pkgs": count}
+    return f
+
+
+def bench_visibility(location, params):
+    repo, vdb = synthetic.load_repos(location)
+    restrict = packages.PackageRestriction(
+        "keywords", values.ContainmentMatch("amd64"))
+
+    def f():
+        return {"visible": len(list(
+            visibility.filterTree(repo, restrict, sentinel_val=True)))}
+    return f
+
+
+benchmarks = (
+    ("resolve", bench_resolve),
+    ("vdb_preload", bench_vdb_preload),
+    ("itermatch", bench_itermatch),
+    ("cache_read", bench_cache_read),
+    ("visibility", bench_visibility),
+)
+
+
+def _run(func, location, params):
+    timed = func(location, params)
+    start = time.time()
+    info = timed() or {}
+    elapsed = time.time() - start
+    return {"time": elapsed, "info": info,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run_benchmark(func, location, params):
+    """Run a benchmark once in a forked process.
+
+    :return: dict holding the wall time, the peak RSS in KiB, and the
+        extra info the benchmark returned
+    :raise ValueError: if the benchmark failed
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        status = 0
+        try:
+            try:
+                data = _run(func, location, params)
+            except Exception as e:
+                data = {"error": "%s\n%s" % (e, traceback.format_exc())}
+                status = 1
+            with os.fdopen(wfd, "w") as f:
+                json.dump(data, f)
+        finally:
+            os._exit(status)
+    os.close(wfd)
+    with os.fdopen(rfd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    try:
+        data = json.loads(data)
+    except ValueError:
+        raise ValueError("benchmark process died")
+    if "error" in data:
+        raise ValueError(data["error"])
+    return data
+
+
+def run_suite(location, params, names=None, repeat=3, observer=None):
+    """Run benchmarks against a generated location.
+
+    :param names: benchmarks to run; defaults to all
+    :param repeat: runs per benchmark
+    :param observer: if not None, invoked with the benchmark name and the
+        result of each run
+    :return: JSON serializable results; see :obj:`compare`
+    """
+    results = {}
+    for name, func in benchmarks:
+        if names is not None and name not in names:
+            continue
+        runs = []
+        for x in xrange(repeat):
+            runs.append(run_benchmark(func, location, params))
+            if observer is not None:
+                observer(name, runs[-1])
+        times = sorted(run["time"] for run in runs)
+        results[name] = {
+            "times": [run["time"] for run in runs],
+            "min": times[0],
+            "median": times[len(times) // 2],
+            "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+            "info": runs[-1]["info"],
+        }
+    return {
+        "params": params.to_dict(),
+        "python": platform.python_version(),
+        "created": time.time(),
+        "benchmarks": results,
+    }
+
+
+def compare(old, new):
+    """Compare two suite results.
+
+    :return: list of (name, old min time, new min time, old peak RSS,
+        new peak RSS) tuples for benchmarks present in both
+    """
+    l = []
+    for name, result in sorted(new["benchmarks"].iteritems()):
+        prior = old["benchmarks"].get(name)
+        if prior is None:
+            continue
+        l.append((name, prior["min"], result["min"],
+                  prior["peak_rss_kb"], result["peak_rss_kb"]))
+    return l
+
+
+def write_results(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,210 @@
+# License: GPL2/BSD
+
+"""
+synthetic ebuild repository and vdb generation
+
+Generated repositories carry a md5-cache entry per ebuild, so they're
+usable without sourcing anything.  Generation is seeded, so the same
+parameters always yield the same trees.
+"""
+
+__all__ = ("tree_params", "generate", "configured_repo", "load_repos")
+
+import random
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import ensure_dirs, pjoin
+
+from pkgcore.cache.flat_hash import md5_cache
+from pkgcore.ebuild import eclass_cache, repository
+from pkgcore.package.mutated import MutatedPkg
+from pkgcore.repository import wrapper
+from pkgcore.vdb import ondisk
+
+
+class tree_params(object):
+
+    """Shape of a synthetic repository.
+
+    :ivar packages: number of package keys
+    :ivar versions: versions per package
+    :ivar fanout: dependencies per version
+    :ivar slot_density: fraction of packages whose versions are each in
+        their own slot
+    :ivar blocker_density: fraction of versions blocking another package
+    :ivar use_depth: maximal nesting of USE conditionals dependencies are
+        wrapped in
+    :ivar installed: fraction of packages with a version installed
+    :ivar seed: seed of the random generator
+    """
+
+    defaults = (
+        ("packages", 1000), ("versions", 3), ("fanout", 4),
+        ("slot_density", 0.1), ("blocker_density", 0.05), ("use_depth", 2),
+        ("installed", 0.5), ("seed", 0),
+    )
+
+    def __init__(self, **kwds):
+        for attr, default in self.defaults:
+            setattr(self, attr, kwds.pop(attr, default))
+        if kwds:
+            raise TypeError("unknown params: %s" % ', '.join(sorted(kwds)))
+
+    def to_dict(self):
+        return dict((attr, getattr(self, attr)) for attr, _ in self.defaults)
+
+    @property
+    def keys(self):
+        """List of the generated package keys."""
+        categories = max(1, self.packages // 100)
+        return ["synth-cat%i/pkg%i" % (idx % categories, idx)
+                for idx in xrange(self.packages)]
+
+
+# the USE flags packages have; the even ones are enabled.
+use_flags = tuple("flag%i" % x for x in xrange(8))
+enabled_use = frozenset(use_flags[::2])
+
+
+def _wrap_use(rand, depth, dep):
+    for x in xrange(rand.randint(0, depth)):
+        flag = rand.choice(use_flags)
+        if rand.random() < 0.3:
+            flag = "!" + flag
+        dep = "%s? ( %s )" % (flag, dep)
+    return dep
+
+
+def _evaluate_use(rand_state, depth, deps):
+    # mirror _wrap_use to find which deps an installed pkg was built with.
+    rand = random.Random()
+    rand.setstate(rand_state)
+    l = []
+    for dep in deps:
+        enabled = True
+        for x in xrange(rand.randint(0, depth)):
+            flag = rand.choice(use_flags)
+            if rand.random() < 0.3:
+                enabled = enabled and flag not in enabled_use
+            else:
+                enabled = enabled and flag in enabled_use
+        if enabled:
+            l.append(dep)
+    return l
+
+
+def _gen_versions(params, rand, keys, idx):
+    slotted = rand.random() < params.slot_density
+    versions = []
+    for ver in xrange(1, params.versions + 1):
+        slot = str(ver) if slotted else "0"
+        deps = []
+        # dependencies only point at later keys, keeping the graph acyclic.
+        if idx + 1 < len(keys):
+            for target in rand.sample(xrange(idx + 1, len(keys)),
+                                      min(params.fanout, len(keys) - idx - 1)):
+                if rand.random() < 0.5:
+                    deps.append(keys[target])
+                else:
+                    deps.append(">=%s-1" % (keys[target],))
+        blockers = []
+        if rand.random() < params.blocker_density:
+            blockers.append("!<%s-1" % (rand.choice(keys),))
+        use_state = rand.getstate()
+        wrapped = [_wrap_use(rand, params.use_depth, dep) for dep in deps]
+        versions.append({
+            "version": str(ver), "SLOT": slot, "EAPI": "5",
+            "KEYWORDS": "~amd64" if ver == params.versions and ver > 1
+                        else "amd64",
+            "IUSE": " ".join(use_flags),
+            "DEPEND": " ".join(wrapped + blockers),
+            "RDEPEND": " ".join(wrapped + blockers),
+            "_built_deps": " ".join(
+                _evaluate_use(use_state, params.use_depth, deps) + blockers),
+        })
+    return versions
+
+
+def generate(params, location):
+    """Generate a repository and vdb.
+
+    :param params: :obj:`tree_params` instance
+    :param location: directory to generate in; the repository ends up in
+        the repo subdirectory, its md5-cache in cache and the vdb in vdb
+    """
+    rand = random.Random(params.seed)
+    repo_dir = pjoin(location, "repo")
+    vdb_dir = pjoin(location, "vdb")
+    ensure_dirs(pjoin(repo_dir, "profiles"))
+    ensure_dirs(pjoin(repo_dir, "eclass"))
+    ensure_dirs(pjoin(repo_dir, "metadata"))
+    ensure_dirs(vdb_dir)
+    with open(pjoin(repo_dir, "profiles", "repo_name"), "w") as f:
+        f.write("synthetic\n")
+    with open(pjoin(repo_dir, "metadata", "layout.conf"), "w") as f:
+        f.write("masters =\n")
+    cache = md5_cache(pjoin(location, "cache"))
+
+    keys = params.keys
+    for idx, key in enumerate(keys):
+        category, package = key.split("/")
+        pkgdir = pjoin(repo_dir, category, package)
+        ensure_dirs(pkgdir)
+        versions = _gen_versions(params, rand, keys, idx)
+        for data in versions:
+            cpvstr = "%s-%s" % (key, data["version"])
+            path = pjoin(pkgdir, "%s-%s.ebuild" % (package, data["version"]))
+            with open(path, "w") as f:
+                f.write("EAPI=5\n")
+            entry = dict((k, v) for k, v in data.iteritems()
+                         if not k.startswith("_") and k != "version")
+            entry["_chf_"] = LazilyHashedPath(path)
+            cache[cpvstr] = entry
+
+        if rand.random() < params.installed:
+            data = rand.choice(versions)
+            entry = pjoin(vdb_dir, category,
+                          "%s-%s" % (package, data["version"]))
+            ensure_dirs(entry)
+            metadata = {
+                "SLOT": data["SLOT"], "EAPI": data["EAPI"],
+                "KEYWORDS": data["KEYWORDS"], "IUSE": data["IUSE"],
+                "USE": " ".join(sorted(enabled_use)),
+                "DEPEND": data["_built_deps"], "RDEPEND": data["_built_deps"],
+                "CONTENTS": "", "repository": "synthetic",
+            }
+            for k, v in metadata.iteritems():
+                with open(pjoin(entry, k), "w") as f:
+                    f.write(v + "\n")
+
+
+def _configure_pkg(pkg):
+    return MutatedPkg(pkg, overrides={
+        "depends": pkg.depends.evaluate_depset(enabled_use),
+        "rdepends": pkg.rdepends.evaluate_depset(enabled_use),
+        "post_rdepends": pkg.post_rdepends.evaluate_depset(enabled_use),
+        "use": enabled_use.intersection(pkg.iuse),
+    })
+
+
+def configured_repo(repo):
+    """Wrap a repository, evaluating USE conditionals of its pkgs.
+
+    The even numbered USE flags are enabled, the rest disabled.
+    """
+    return wrapper.tree(repo, package_class=_configure_pkg)
+
+
+def load_repos(location):
+    """Instantiate the repository and vdb generated in a location.
+
+    :return: (unconfigured repository, vdb) tuple; new instances are
+        returned each time, so no metadata is held in memory.
+    """
+    repo_dir = pjoin(location, "repo")
+    repo = repository._UnconfiguredTree(
+        repo_dir, eclass_cache.cache(pjoin(repo_dir, "eclass")),
+        cache=(md5_cache(pjoin(location, "cache"), readonly=True),),
+        allow_missing_manifests=True)
+    vdb = ondisk.tree(pjoin(location, "vdb"), disable_cache=True)
+    return repo, vdb
@@ -130,6 +130,30 @@ class base(object):
         """
         raise NotImplementedError
 
+    def project(self, cpv, keys):
+        """get a subset of cpv's values
+
+        The returned mapping holds at least the requested keys that are
+        set for the entry, along with those needed by :obj:`validate_entry`;
+        backends unable to skip the others may return them too.
+
+        :param keys: iterable of the keys to pull
+        """
+        self._sync_if_needed()
+        keys = frozenset(keys).union((self._chf_key, "_eclasses_"))
+        d = self._project(cpv, keys)
+        if "_eclasses_" in d:
+            d["_eclasses_"] = self.reconstruct_eclasses(cpv, d["_eclasses_"])
+        return d
+
+    def _project(self, cpv, keys):
+        """get a subset of cpv's values.
+
+        override this in derived classes able to skip unwanted keys;
+        by default the full entry is pulled.
+        """
+        return self._getitem(cpv)
+
     def __setitem__(self, cpv, values):
         """set a cpv to values
 
@@ -38,19 +38,23 @@ class database(fs_template.FsBased):
     mtime_in_entry = True
     eclass_chf_types = ('eclassdir', 'mtime')
 
-    def _getitem(self, cpv):
+    def _getitem(self, cpv, keys=None):
         path = pjoin(self.location, cpv)
         try:
             data = readlines_ascii(path, True, True, True)
             if data is None:
                 raise KeyError(cpv)
-            return self._parse_data(data, data.mtime)
+            return self._parse_data(data, data.mtime, keys)
         except (EnvironmentError, ValueError) as e:
             raise_from(errors.CacheCorruption(cpv, e))
 
-    def _parse_data(self, data, mtime):
+    _project = _getitem
+
+    def _parse_data(self, data, mtime, keys=None):
         d = self._cdict_kls()
         known = self._known_keys
+        if keys is not None:
+            known = known.intersection(keys)
         for x in data:
             k, v = x.split("=", 1)
             if k in known:
@@ -77,10 +77,14 @@ class database(flat_hash.database):
     __init__.__doc__ = flat_hash.database.__init__.__doc__.replace(
         "@keyword location", "@param location")
 
-    def _parse_data(self, data, mtime):
+    def _parse_data(self, data, mtime, keys=None):
         i = iter(self.hardcoded_auxdbkeys_processing)
-        d = self._cdict_kls([(key, val) for (key, val) in
-            izip(i, data) if key])
+        if keys is None:
+            d = self._cdict_kls([(key, val) for (key, val) in
+                izip(i, data) if key])
+        else:
+            d = self._cdict_kls([(key, val) for (key, val) in
+                izip(i, data) if key in keys])
         # sadly, this is faster then doing a .next() and snagging the
         # exception
         for x in i:
@@ -173,11 +177,11 @@ class paludis_flat_list(database):
 
 class protective_database(database):
 
-    def _parse_data(self, data, mtime):
+    def _parse_data(self, data, mtime, keys=None):
         # easy attempt first.
         data = list(data)
         if len(data) != self.magic_line_count:
-            return flat_hash.database._parse_data(self, data, mtime)
+            return flat_hash.database._parse_data(self, data, mtime, keys)
 
         # this one's interesting.
         d = self._cdict_kls()
@@ -24,6 +24,15 @@ class domain(object):
 
     fetcher = None
     _triggers = ()
+    #: if set, :obj:`pkgcore.merge.triggers.trigger_session` running the
+    #: deferrable triggers of the merges done through this domain
+    trigger_session = None
+    #: number of threads merging and unmerging files and running triggers,
+    #: for the merges done through this domain
+    merge_jobs = 1
+    #: if True, files are hardlinked from build images into place rather
+    #: than copied, where possible
+    link_image = False
 
     def _mk_nonconfig_triggers(self):
         return ()
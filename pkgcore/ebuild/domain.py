@@ -35,6 +35,7 @@ from pkgcore.ebuild.repo_objs import OverlayedLicenses
 from pkgcore.repository import multiplex, visibility
 from pkgcore.restrictions import packages, values
 from pkgcore.restrictions.delegated import delegate
+from pkgcore.restrictions.util import collect_package_attrs
 from pkgcore.util.parserestrict import parse_match
 
 demandload(
@@ -75,6 +76,20 @@ def apply_mask_filter(globs, atoms, pkg, mode):
     return False
 
 
+def _restricts_attrs(restricts, *attrs):
+    """Collect the package attrs matched by restricts, plus any passed in.
+
+    Returns None if they can't be determined.
+    """
+    attrs = set(attrs)
+    for r in restricts:
+        l = collect_package_attrs(r)
+        if l is None:
+            return None
+        attrs.update(l)
+    return attrs
+
+
 def _mask_filter(masks, negate=False):
     atoms = defaultdict(list)
     globs = []
@@ -83,7 +98,8 @@ def _mask_filter(masks, negate=False):
             atoms[m.key].append(m)
         else:
             globs.append(m)
-    return delegate(partial(apply_mask_filter, globs, atoms), negate=negate)
+    return delegate(partial(apply_mask_filter, globs, atoms), negate=negate,
+                    attrs=_restricts_attrs(masks, "key"))
 
 make_mask_filter = partial(_mask_filter, negate=True)
 make_unmask_filter = partial(_mask_filter, negate=False)
@@ -396,7 +412,10 @@ class domain(pkgcore.config.domain.domain):
 
     def make_license_filter(self, master_license, pkg_licenses):
         """Generates a restrict that matches iff the licenses are allowed."""
-        return delegate(partial(self.apply_license_filter, master_license, pkg_licenses))
+        return delegate(
+            partial(self.apply_license_filter, master_license, pkg_licenses),
+            attrs=_restricts_attrs(
+                (x[0] for x in pkg_licenses), "license", "repo"))
 
     def apply_license_filter(self, master_licenses, pkg_licenses, pkg, mode):
         """Determine if a package's license is allowed."""
@@ -462,7 +481,10 @@ class domain(pkgcore.config.domain.domain):
             #f = self.incremental_apply_keywords_filter
         else:
             f = self.apply_keywords_filter
-        return delegate(partial(f, data, profile_keywords))
+        return delegate(partial(f, data, profile_keywords),
+            attrs=_restricts_attrs(
+                chain((x[0] for x in accept_keywords),
+                      (x[0] for x in profile_keywords)), "keywords"))
 
     @staticmethod
     def incremental_apply_keywords_filter(data, pkg, mode):
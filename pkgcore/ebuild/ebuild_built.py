@@ -187,6 +187,9 @@ def generic_format_triggers(self, pkg, op_inst, format_op_inst, engine_inst):
         # this isn't perfect for binpkgs since if the binpkg is already
         # screwed, the target is in place already
         triggers.FixImageSymlinks(format_op_inst).register(engine_inst)
+        # the image is discarded once merged.
+        if getattr(op_inst.domain, 'link_image', False):
+            engine_inst.relocatable_paths.append(format_op_inst.env["D"])
 
 def _generic_format_install_op(self, domain, newpkg, observer):
     return ebd.install_op(domain, newpkg, observer)
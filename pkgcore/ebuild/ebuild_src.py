@@ -9,8 +9,10 @@ from __future__ import with_statement
 
 __all__ = ("base", "package", "package_factory", "virtual_ebuild")
 
+from collections import deque
 from itertools import imap, chain
 import os
+import weakref
 
 from pkgcore.cache import errors as cache_errors
 from pkgcore.ebuild import conditionals
@@ -30,6 +32,7 @@ from snakeoil.compatibility import intern
 from snakeoil.currying import partial
 from snakeoil.demandload import demandload, demand_compile_regexp
 from snakeoil.mappings import IndeterminantDict
+from snakeoil.weakrefs import WeakValCache
 
 demandload(
     "snakeoil:chksum",
@@ -43,9 +46,50 @@ demand_compile_regexp(
 )
 
 
+class _DepSetCache(object):
+
+    """
+    cache of parsed DepSets, keyed by the raw string and how it's parsed
+
+    Versions of a package, and packages using the same eclasses, commonly
+    share dependency strings; since DepSets are immutable they can share
+    the parsed result too.  Entries are weakly referenced so a DepSet stays
+    cached while any package uses it; the most recently parsed ones are
+    additionally kept alive, bounding what's held beyond that.
+    """
+
+    def __init__(self, size=1024):
+        self._cache = WeakValCache()
+        self._recent = deque(maxlen=size)
+
+    def parse(self, key, dep_str, element_class, **kwds):
+        """
+        :param key: hashable identifying the parsing options not derivable
+            from element_class and kwds, for example operators
+        :param dep_str: DepSet string to parse
+        :param element_class: see :obj:`conditionals.DepSet.parse`; any
+            additional keywords are passed to it as well
+        """
+        key = (dep_str, element_class, key)
+        depset = self._cache.get(key)
+        if depset is None:
+            depset = self._cache[key] = conditionals.DepSet.parse(
+                dep_str, element_class, **kwds)
+            self._recent.append(depset)
+        return depset
+
+    def clear(self):
+        self._cache.clear()
+        self._recent.clear()
+
+
+_depset_cache = _DepSetCache()
+
+
 def generate_depset(c, key, non_package_type, s, **kwds):
     if non_package_type:
-        return conditionals.DepSet.parse(s.data.pop(key, ""), c,
+        return _depset_cache.parse(tuple(sorted(kwds.iteritems())),
+            s.data.pop(key, ""), c,
             operators={"||":boolean.OrRestriction,
             "":boolean.AndRestriction}, **kwds)
     eapi_obj = s.eapi_obj
@@ -53,7 +97,8 @@ def generate_depset(c, key, non_package_type, s, **kwds):
         raise metadata_errors.MetadataException(s, "eapi", "unsupported eapi: %s" % eapi_obj.magic)
     kwds['element_func'] = eapi_obj.atom_kls
     kwds['transitive_use_atoms'] = eapi_obj.options.transitive_use_atoms
-    return conditionals.DepSet.parse(s.data.pop(key, ""), c, **kwds)
+    return _depset_cache.parse(tuple(sorted(kwds.iteritems())),
+        s.data.pop(key, ""), c, **kwds)
 
 def _mk_required_use_node(data):
     if data[0] == '!':
@@ -69,10 +114,11 @@ def generate_required_use(self):
         "":boolean.AndRestriction,
         "^^":boolean.JustOneRestriction
     }
-    if self.eapi_obj.options.required_use_one_of:
+    one_of = self.eapi_obj.options.required_use_one_of
+    if one_of:
         operators['??'] = boolean.AtMostOneOfRestriction
 
-    return conditionals.DepSet.parse(data,
+    return _depset_cache.parse(("required_use", one_of), data,
         values.ContainmentMatch, operators=operators,
         element_func=_mk_required_use_node,
         )
@@ -184,6 +230,124 @@ def rewrite_restrict(restrict):
 def get_repo_id(self):
     return self.repo.repo_id
 
+
+# metadata keys each package attribute is generated from; attributes
+# mapped to an empty tuple don't need metadata at all.
+_attr_metadata_keys = {
+    "depends": ("DEPEND",),
+    "rdepends": ("RDEPEND",),
+    "post_rdepends": ("PDEPEND",),
+    "license": ("LICENSE",),
+    "fullslot": ("SLOT",),
+    "slot": ("SLOT",),
+    "subslot": ("SLOT",),
+    "slotted_atom": ("SLOT",),
+    "fetchables": ("SRC_URI", "RESTRICT"),
+    "description": ("DESCRIPTION",),
+    "keywords": ("KEYWORDS",),
+    "restrict": ("RESTRICT",),
+    "iuse": ("IUSE",),
+    "iuse_effective": ("IUSE",),
+    "use": ("IUSE",),
+    "properties": ("PROPERTIES",),
+    "defined_phases": ("DEFINED_PHASES",),
+    "mandatory_phases": ("DEFINED_PHASES",),
+    "homepage": ("HOMEPAGE",),
+    "required_use": ("REQUIRED_USE",),
+    "provides": ("PROVIDE",),
+    "inherited": ("_eclasses_",),
+}
+_attr_metadata_keys.update((x, ()) for x in (
+    "category", "package", "version", "revision", "fullver", "key",
+    "cpvstr", "versioned_atom", "unversioned_atom", "repo", "repo_id",
+    "source_repository", "eapi", "eapi_obj", "is_supported", "path",
+    "ebuild", "maintainers", "herds", "longdescription", "local_use",
+    "manifest", "P", "PF", "PR", "PN"))
+
+
+def _keyed_access(name):
+    meth = getattr(dict, name)
+    def f(self, key, *args):
+        self._require(key)
+        return meth(self, key, *args)
+    f.__name__ = name
+    return f
+
+
+def _full_access(name):
+    meth = getattr(dict, name)
+    def f(self, *args):
+        self._require()
+        return meth(self, *args)
+    f.__name__ = name
+    return f
+
+
+class _ProjectedMetadata(dict):
+
+    """
+    package metadata pulled lazily, limited to a subset of keys
+
+    Accessing a key outside of that subset pulls the full metadata, merging
+    in whatever wasn't pulled already.
+    """
+
+    __slots__ = ("_pkg", "_keys", "_loaded")
+
+    def __init__(self, pkg, keys):
+        dict.__init__(self)
+        self._pkg = weakref.ref(pkg)
+        self._keys = frozenset(keys)
+        self._loaded = False
+
+    def _require(self, key=None):
+        keys = self._keys
+        if keys is None:
+            return
+        if key in keys:
+            if not self._loaded:
+                self._load(keys)
+        else:
+            self._load(None)
+
+    def _load(self, keys):
+        pkg = self._pkg()
+        data = pkg._parent._get_metadata(pkg, keys=keys)
+        if self._loaded:
+            loaded = self._keys
+            for k, v in data.iteritems():
+                if k not in loaded:
+                    dict.__setitem__(self, k, v)
+        else:
+            for k, v in data.iteritems():
+                dict.__setitem__(self, k, v)
+        if keys is None:
+            self._keys = None
+        else:
+            self._keys = keys.union(data)
+            self._loaded = True
+
+    __getitem__ = _keyed_access("__getitem__")
+    __contains__ = _keyed_access("__contains__")
+    has_key = _keyed_access("has_key")
+    get = _keyed_access("get")
+    pop = _keyed_access("pop")
+    setdefault = _keyed_access("setdefault")
+
+    __iter__ = _full_access("__iter__")
+    __len__ = _full_access("__len__")
+    __repr__ = _full_access("__repr__")
+    __eq__ = _full_access("__eq__")
+    __ne__ = _full_access("__ne__")
+    keys = _full_access("keys")
+    values = _full_access("values")
+    items = _full_access("items")
+    iterkeys = _full_access("iterkeys")
+    itervalues = _full_access("itervalues")
+    iteritems = _full_access("iteritems")
+    copy = _full_access("copy")
+    popitem = _full_access("popitem")
+
 def get_inherited(self):
     return tuple(sorted(self.data.get('_eclasses_', {})))
 
@@ -217,7 +381,7 @@ class base(metadata.package):
     _get_attr["description"] = lambda s:s.data.pop("DESCRIPTION", "").strip()
     _get_attr["keywords"] = lambda s:tuple(map(intern,
         s.data.pop("KEYWORDS", "").split()))
-    _get_attr["restrict"] = lambda s:conditionals.DepSet.parse(
+    _get_attr["restrict"] = lambda s:_depset_cache.parse("restrict",
         s.data.pop("RESTRICT", ''), str, operators={},
         element_func=rewrite_restrict)
     _get_attr["eapi_obj"] = get_parsed_eapi
@@ -346,7 +510,7 @@ class package_factory(metadata.factory):
     def _get_ebuild_mtime(self, pkg):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
-    def _get_metadata(self, pkg, ebp=None, force_regen=False):
+    def _get_metadata(self, pkg, ebp=None, force_regen=False, keys=None):
         caches = self._cache
         if force_regen:
             caches = ()
@@ -354,7 +518,10 @@ class package_factory(metadata.factory):
         for cache in caches:
             if cache is not None:
                 try:
-                    data = cache[pkg.cpvstr]
+                    if keys is None:
+                        data = cache[pkg.cpvstr]
+                    else:
+                        data = cache.project(pkg.cpvstr, keys)
                     if cache.validate_entry(data, ebuild_hash, self._ecache):
                         return data
                     if not cache.readonly:
@@ -418,6 +585,24 @@ class package_factory(metadata.factory):
 
         return mydata
 
+    def project_metadata(self, pkg, attrs):
+        keys = set()
+        for attr in attrs:
+            l = _attr_metadata_keys.get(attr)
+            if l is None:
+                return
+            keys.update(l)
+        if not keys:
+            return
+        try:
+            object.__getattribute__(pkg, "data")
+            return
+        except AttributeError:
+            pass
+        object.__setattr__(pkg, "data", _ProjectedMetadata(pkg, keys))
+
+    project_metadata.__doc__ = metadata.factory.project_metadata.__doc__
+
     def new_package(self, *args):
         inst = self._cached_instances.get(args)
         if inst is None:
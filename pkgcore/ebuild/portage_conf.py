@@ -252,7 +252,8 @@ def add_profile(config, base_path, user_profile_path=None, profile_override=None
         })
 
 
-def add_fetcher(config, conf_dict, distdir):
+def add_fetcher(config, conf_dict, distdir, native=False,
+                cache_location=None):
     fetchcommand = conf_dict.pop("FETCHCOMMAND")
     resumecommand = conf_dict.pop("RESUMECOMMAND", fetchcommand)
 
@@ -262,12 +263,20 @@ def add_fetcher(config, conf_dict, distdir):
     if "FETCH_ATTEMPTS" in fetcher_dict:
         fetcher_dict["attempts"] = fetcher_dict.pop("FETCH_ATTEMPTS")
     fetcher_dict.pop("readonly", None)
-    fetcher_dict.update({
-        "class": "pkgcore.fetch.custom.fetcher",
-        "distdir": distdir,
-        "command": fetchcommand,
-        "resume_command": resumecommand,
-    })
+    if cache_location is not None:
+        fetcher_dict["cache_location"] = cache_location
+    if native:
+        fetcher_dict.update({
+            "class": "pkgcore.fetch.native.fetcher",
+            "distdir": distdir,
+        })
+    else:
+        fetcher_dict.update({
+            "class": "pkgcore.fetch.custom.fetcher",
+            "distdir": distdir,
+            "command": fetchcommand,
+            "resume_command": resumecommand,
+        })
     config["fetcher"] = basics.AutoConfigSection(fetcher_dict)
 
 
@@ -641,7 +650,11 @@ def config_from_make_conf(location="/etc/", profile_override=None):
     # *everything* in the conf_dict must be str values also.
     distdir = normpath(os.environ.get(
         "DISTDIR", conf_dict.pop("DISTDIR", pjoin(main_repo, "distdir"))))
-    add_fetcher(new_config, conf_dict, distdir)
+    # the chksum cache vouches for distfiles, so it's kept out of the
+    # portage writable DISTDIR.
+    add_fetcher(new_config, conf_dict, distdir,
+                native='native-fetch' in features,
+                cache_location=pjoin(config_root, 'var', 'cache', 'edb'))
 
     # finally... domain.
     conf_dict.update({
@@ -75,9 +75,15 @@ class repo_operations(_repo_ops.operations):
                         observer.error("failed fetching for pkg %s" % (pkg,))
                         return False
 
+                    # share the checksums the fetcher cached, if any.
+                    chksum_cache = getattr(
+                        pkg_ops._mirror_op.fetcher, 'chksum_cache', None)
+                    chksummer = get_chksums
+                    if chksum_cache is not None:
+                        chksummer = chksum_cache.get_chksums
                     fetchables = pkg_ops._mirror_op.verified_files
                     for path, fetchable in fetchables.iteritems():
-                        d = dict(zip(required, get_chksums(path, *required)))
+                        d = dict(zip(required, chksummer(path, *required)))
                         fetchable.chksums = d
                     # should report on conflicts here...
                     pkgdir_fetchables.update(fetchables.iteritems())
@@ -148,6 +148,7 @@ class env_update(triggers.base):
     required_csets = ()
     priority = 5
     _hooks = ('post_unmerge', 'post_merge')
+    deferrable = True
 
     def trigger(self, engine):
         perform_env_update(engine.offset)
@@ -456,14 +457,24 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
         collisions = {}
 
-        # TODO: worth parallelizing this vdb scanning?
-        for pkg in real_pkgs:
-            pkg_file_collisions = pkg.contents.intersection(colliding)
-            if pkg_file_collisions:
-                collisions[pkg.cpvstr] = pkg_file_collisions
+        for repo in self.vdb:
+            owners = getattr(repo, 'owners', None)
+            if owners is not None:
+                # indexed vdb; a probe per colliding path.
+                by_location = {x.location: x for x in colliding}
+                for location, cpvstr in owners.iter_owners(by_location):
+                    collisions.setdefault(cpvstr, []).append(
+                        by_location[location])
+                continue
+            for pkg in repo:
+                if not pkg.package_is_real:
+                    continue
+                pkg_file_collisions = pkg.contents.intersection(colliding)
+                if pkg_file_collisions:
+                    collisions.setdefault(pkg.cpvstr, []).extend(
+                        pkg_file_collisions)
 
         if collisions:
             pkg_collisions = [
@@ -552,6 +563,7 @@ class InfoRegen(triggers.InfoRegen):
 
 class SFPerms(triggers.base):
     required_csets = ('new_cset',)
+    modified_csets = ('new_cset',)
     _hooks = ('pre_merge',)
     _engine_types = triggers.INSTALLING_MODES
 
@@ -0,0 +1,121 @@
+# License: GPL2/BSD
+
+"""
+fetching the distfiles of a whole plan in the background
+
+Rather than downloading each pkg's distfiles right before building it,
+:obj:`background_fetcher` downloads those of every pkg of a plan in a pool
+of threads, in plan order, while the pkgs are being built.  Building a pkg
+then only waits on its own distfiles.
+"""
+
+__all__ = ("background_fetcher",)
+
+import Queue
+import threading
+
+from snakeoil.lists import iflatten_instance
+
+from pkgcore.fetch import fetchable as _fetchable
+
+
+class _fetch_job(object):
+
+    __slots__ = ("fetchable", "fetcher", "done", "error", "path")
+
+    def __init__(self, fetchable, fetcher):
+        self.fetchable = fetchable
+        self.fetcher = fetcher
+        self.done = threading.Event()
+        self.error = None
+        self.path = None
+
+
+class background_fetcher(object):
+
+    """Fetch the distfiles of pkgs in a pool of threads.
+
+    Each distfile is fetched once, however many pkgs need it; they're
+    fetched in the order of the pkgs needing them.
+    """
+
+    def __init__(self, domain, pkgs, threads=4):
+        """
+        :param domain: domain whose fetcher is used for pkgs whose
+            repository doesn't have one
+        :param pkgs: pkgs to fetch the distfiles of, in the order they're
+            needed
+        :param threads: number of distfiles fetched concurrently
+        """
+        self.domain = domain
+        self.threads = max(threads, 1)
+        self._queue = Queue.Queue()
+        self._jobs = {}
+        self._pkg_jobs = {}
+        self._workers = []
+        self._stopped = False
+        for pkg in pkgs:
+            self._pkg_jobs[pkg] = jobs = []
+            fetcher = self._find_fetcher(pkg)
+            if fetcher is None:
+                continue
+            for fetchable in iflatten_instance(pkg.fetchables, _fetchable):
+                job = self._jobs.get(fetchable.filename)
+                if job is None:
+                    job = self._jobs[fetchable.filename] = _fetch_job(
+                        fetchable, fetcher)
+                    self._queue.put(job)
+                jobs.append(job)
+
+    def _find_fetcher(self, pkg):
+        # mirrors pkgcore.operations.format.operations._find_fetcher
+        fetcher = getattr(pkg.repo, 'fetcher', None)
+        if fetcher is None:
+            return getattr(self.domain, 'fetcher', None)
+        return fetcher
+
+    def start(self):
+        for x in xrange(min(self.threads, len(self._jobs))):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def _work(self):
+        while not self._stopped:
+            try:
+                job = self._queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                job.path = job.fetcher(job.fetchable)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.done.set()
+
+    def wait(self, pkg):
+        """Wait for the distfiles of a pkg to be fetched.
+
+        Pkgs that weren't passed in at creation have nothing to wait on.
+
+        :return: list of (fetchable, exception) pairs for the distfiles that
+            failed fetching; exception is None if the fetcher just returned
+            None
+        """
+        failures = []
+        for job in self._pkg_jobs.get(pkg, ()):
+            # poll, so interrupts are seen.
+            while not job.done.wait(1):
+                if self._stopped:
+                    return failures
+            if job.path is None:
+                failures.append((job.fetchable, job.error))
+        return failures
+
+    def shutdown(self):
+        """Stop fetching; fetches already running are finished first."""
+        self._stopped = True
+        for t in self._workers:
+            t.join()
+        self._workers = []
@@ -8,16 +8,26 @@ prototype fetcher class, all fetchers should derive from this
 __all__ = ("fetcher",)
 
 import os
+import sys
 
 from snakeoil import compatibility
 from snakeoil.chksum import get_handlers, get_chksums
 from snakeoil.compatibility import cmp
+from snakeoil.demandload import demandload
 
 from pkgcore.fetch import errors
 
+demandload(
+    'pkgcore.util.thread_pool:map_async',
+)
+
 
 class fetcher(object):
 
+    #: :obj:`pkgcore.fetch.chksum_cache.chksum_cache` used by
+    #: :obj:`_verify`, if any
+    chksum_cache = None
+
     def _verify(self, file_location, target, all_chksums=True, handlers=None):
         """
         Internal function for derivatives.
@@ -77,7 +87,10 @@ class fetcher(object):
                         x, target.chksums[x], val))
         else:
             desired_vals = [target.chksums[x] for x in chfs]
-            calced = get_chksums(file_location, *chfs)
+            if self.chksum_cache is None:
+                calced = get_chksums(file_location, *chfs)
+            else:
+                calced = self.chksum_cache.get_chksums(file_location, *chfs)
             for desired, got, chf in zip(desired_vals, calced, chfs):
                 if desired != got:
                     raise errors.FetchFailed(file_location,
@@ -98,6 +111,40 @@ class fetcher(object):
         """
         raise NotImplementedError(self.get_path)
 
+    def get_paths(self, fetchables, threads=None):
+        """
+        return the on disk paths of several fetchables, verifying them
+        concurrently
+
+        Hashing releases the GIL, so verifying large distfiles scales with
+        the number of threads.
+
+        :param threads: number of files verified at once, defaults to the
+            number of cpus
+        :return: list of the paths in the order of fetchables, holding None
+            for those that aren't available or fully fetched
+        """
+        fetchables = list(fetchables)
+        paths = [None] * len(fetchables)
+        failures = []
+
+        def verify(queue):
+            for idx, fetchable in queue:
+                if failures:
+                    # drain the queue.
+                    continue
+                try:
+                    paths[idx] = self.get_path(fetchable)
+                except errors.base:
+                    pass
+                except Exception:
+                    failures.append(sys.exc_info())
+
+        map_async(list(enumerate(fetchables)), verify, threads=threads)
+        if failures:
+            raise failures[0][0], failures[0][1], failures[0][2]
+        return paths
+
     def get_storage_path(self):
         """return the directory files are stored in
         returns None if not applicable
@@ -0,0 +1,203 @@
+# License: GPL2/BSD
+
+"""
+persistent cache of distfile checksums
+
+Hashing big distfiles is slow, and they rarely change once fetched;
+:obj:`chksum_cache` remembers the checksums of files, trusting them for as
+long as the device, inode, size, mtime and ctime of the file are unchanged.
+
+The cache is a text file that's only appended to, so concurrent processes
+can share it; it's rewritten once it has grown mostly stale.
+
+Since cached checksums stand in for verifying distfiles, the cache has to
+live somewhere only the user running pkgcore can write, not next to the
+distfiles; a cache file owned by anyone else, or writable by group or
+world, is ignored.
+"""
+
+__all__ = ("chksum_cache", "CACHE_FILENAME")
+
+import errno
+import os
+import threading
+
+from snakeoil.chksum import get_chksums
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+
+demandload(
+    'pkgcore.log:logger',
+)
+
+#: name of the cache file fetchers keep in their cache_location
+CACHE_FILENAME = 'distfiles.chksums'
+
+
+def _stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+
+def _safe(st):
+    # only what no one else could have written is trusted.
+    return st.st_uid == os.getuid() and not st.st_mode & 022
+
+
+class chksum_cache(object):
+
+    """Checksums of files, trusted while the files are unchanged.
+
+    :ivar trusted: if False, cached checksums are ignored; freshly
+        calculated ones are still stored
+    """
+
+    def __init__(self, location, trusted=True):
+        """
+        :param location: path of the cache file
+        :param trusted: whether cached checksums are used
+        """
+        self.location = location
+        self.trusted = trusted
+        self._entries = None
+        self._writable = True
+        self._lock = threading.Lock()
+
+    def _load(self):
+        entries = {}
+        lines = 0
+        try:
+            with open(self.location) as f:
+                if not _safe(os.fstat(f.fileno())):
+                    logger.warning(
+                        "ignoring chksum cache %s: not owned by uid %i, or "
+                        "group/world writable", self.location, os.getuid())
+                    self._writable = False
+                    return entries
+                for line in f:
+                    lines += 1
+                    try:
+                        path, key, chksums = self._parse(line)
+                    except ValueError:
+                        continue
+                    # later lines win.
+                    if entries.get(path, (None,))[0] == key:
+                        entries[path][1].update(chksums)
+                    else:
+                        entries[path] = (key, chksums)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading chksum cache %s: %s",
+                               self.location, e)
+        if lines > 2 * len(entries) + 100:
+            self._compact(entries)
+        return entries
+
+    @staticmethod
+    def _parse(line):
+        path, dev, ino, size, mtime, ctime, chksums = \
+            line.rstrip("\n").split("\t", 6)
+        key = (int(dev), int(ino), int(size), float(mtime), float(ctime))
+        chksums = dict((chf, long(val, 16)) for chf, val in
+                       (x.split(":", 1) for x in chksums.split()))
+        return path, key, chksums
+
+    @staticmethod
+    def _format(path, key, chksums):
+        return "%s\t%i\t%i\t%i\t%r\t%r\t%s\n" % (
+            (path,) + key + (" ".join(
+                "%s:%x" % (chf, val)
+                for chf, val in sorted(chksums.iteritems())),))
+
+    def _compact(self, entries):
+        # drop entries for files that are gone or changed.
+        for path, (key, chksums) in entries.items():
+            try:
+                if _stat_key(os.stat(path)) == key:
+                    continue
+            except EnvironmentError:
+                pass
+            del entries[path]
+        f = None
+        try:
+            f = AtomicWriteFile(self.location, perms=0644)
+            for path, (key, chksums) in sorted(entries.iteritems()):
+                f.write(self._format(path, key, chksums))
+            f.close()
+        except EnvironmentError as e:
+            logger.debug("failed rewriting chksum cache %s: %s",
+                         self.location, e)
+        finally:
+            if f is not None:
+                f.discard()
+
+    def _get_entries(self):
+        # must be called holding the lock.
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def get(self, path, key):
+        """
+        :param key: device, inode, size, mtime and ctime of the file
+        :return: dict of the cached checksums of path, empty if the file
+            changed since or the cache isn't trusted
+        """
+        if not self.trusted:
+            return {}
+        with self._lock:
+            entry = self._get_entries().get(path)
+            if entry is None or entry[0] != key:
+                return {}
+            return dict(entry[1])
+
+    def update(self, path, key, chksums):
+        """Add checksums of the file at path with the given stat identity."""
+        with self._lock:
+            entries = self._get_entries()
+            entry = entries.get(path)
+            if entry is not None and entry[0] == key:
+                entry[1].update(chksums)
+            else:
+                entries[path] = (key, dict(chksums))
+            if not self._writable:
+                return
+            try:
+                fd = os.open(self.location,
+                             os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+                try:
+                    if not _safe(os.fstat(fd)):
+                        self._writable = False
+                        return
+                    # a single write, so concurrent appenders don't interleave.
+                    os.write(fd, self._format(path, key, chksums))
+                finally:
+                    os.close(fd)
+            except EnvironmentError as e:
+                self._writable = False
+                logger.debug("failed writing chksum cache %s: %s",
+                             self.location, e)
+
+    def get_chksums(self, path, *chksums):
+        """Caching version of :obj:`snakeoil.chksum.get_chksums`.
+
+        Only file paths are supported.
+
+        :return: list of the chksums, in the order requested
+        """
+        try:
+            key = _stat_key(os.stat(path))
+        except EnvironmentError:
+            return get_chksums(path, *chksums)
+        known = self.get(path, key)
+        missing = [x for x in chksums if x not in known]
+        if missing:
+            calced = dict(zip(missing, get_chksums(path, *missing)))
+            known.update(calced)
+            try:
+                changed = _stat_key(os.stat(path)) != key
+            except EnvironmentError:
+                changed = True
+            # don't cache what was hashed from a file modified meanwhile.
+            if not changed:
+                self.update(path, key, calced)
+        return [known[x] for x in chksums]
@@ -16,6 +16,7 @@ from snakeoil.compatibility import raise_from
 from pkgcore.spawn import spawn_bash, is_userpriv_capable
 from pkgcore.os_data import portage_uid, portage_gid
 from pkgcore.fetch import errors, base, fetchable
+from pkgcore.fetch import chksum_cache as _chksum_cache
 from pkgcore.config import ConfigHint
 
 
@@ -31,12 +32,14 @@ class fetcher(base.fetcher):
 
     pkgcore_config_type = ConfigHint(
         {'userpriv': 'bool', 'required_chksums': 'list',
-         'distdir': 'str', 'command': 'str', 'resume_command': 'str'},
+         'distdir': 'str', 'command': 'str', 'resume_command': 'str',
+         'chksum_cache': 'bool', 'cache_location': 'str'},
          allow_unknowns=True)
 
     def __init__(self, distdir, command, resume_command=None,
                  required_chksums=None, userpriv=True, attempts=10,
-                 readonly=False, **extra_env):
+                 readonly=False, chksum_cache=True, cache_location=None,
+                 **extra_env):
         """
         :param distdir: directory to download files to
         :type distdir: string
@@ -50,9 +53,16 @@ class fetcher(base.fetcher):
         :param userpriv: depriv for fetching?
         :param attempts: max number of attempts before failing the fetch
         :param readonly: controls whether fetching is allowed
+        :param chksum_cache: if True, checksums of verified files are
+            cached in cache_location, see :obj:`pkgcore.fetch.chksum_cache`
+        :param cache_location: directory only the user running pkgcore can
+            write, to keep the chksum cache in; if None, nothing is cached
         """
         base.fetcher.__init__(self)
         self.distdir = distdir
+        if chksum_cache and cache_location is not None:
+            self.chksum_cache = _chksum_cache.chksum_cache(
+                pjoin(cache_location, _chksum_cache.CACHE_FILENAME))
         if required_chksums is not None:
             required_chksums = [x.lower() for x in required_chksums]
         else:
@@ -0,0 +1,507 @@
+# License: GPL2/BSD
+
+"""
+fetcher downloading via python's http and ftp support
+
+Unlike :obj:`pkgcore.fetch.custom.fetcher`, no external program is run per
+uri.  Connections are pooled per host, several uris of a file are raced,
+keeping the one delivering the first bytes, and the rest of large files
+of known size is split into range requests downloaded concurrently.
+
+Resuming works as with the custom fetcher: a partially fetched file
+always holds a prefix of the distfile, and is continued from its end.
+"""
+
+__all__ = ("fetcher",)
+
+import errno
+import ftplib
+import httplib
+from itertools import islice
+import os
+import Queue
+import socket
+import threading
+import urlparse
+
+from snakeoil.compatibility import raise_from
+from snakeoil.demandload import demandload
+from snakeoil.osutils import ensure_dirs, pjoin
+
+from pkgcore.config import ConfigHint
+from pkgcore.fetch import base, errors, fetchable
+from pkgcore.fetch import chksum_cache as _chksum_cache
+from pkgcore.os_data import portage_uid, portage_gid
+
+demandload(
+    'pkgcore.log:logger',
+    'pkgcore.spawn:is_userpriv_capable',
+)
+
+_redirects = frozenset((301, 302, 303, 307, 308))
+
+
+class _request_failed(Exception):
+    pass
+
+
+class _connection_pool(object):
+
+    """Idle connections per scheme and host."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme, netloc, fresh=False):
+        if not fresh:
+            with self._lock:
+                idle = self._idle.get((scheme, netloc))
+                if idle:
+                    return idle.pop()
+        if scheme == 'http':
+            return httplib.HTTPConnection(netloc, timeout=self.timeout)
+        elif scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == 'ftp':
+            return self._ftp_connect(netloc)
+        raise _request_failed("unsupported uri scheme %r" % (scheme,))
+
+    def _ftp_connect(self, netloc):
+        parsed = urlparse.urlsplit("ftp://" + netloc)
+        conn = ftplib.FTP(timeout=self.timeout)
+        conn.connect(parsed.hostname, parsed.port or ftplib.FTP_PORT)
+        conn.login(parsed.username or 'anonymous',
+                   parsed.password or 'anonymous@')
+        conn.voidcmd('TYPE I')
+        return conn
+
+    def release(self, scheme, netloc, conn):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.itervalues():
+            for conn in conns:
+                try:
+                    conn.close()
+                except EnvironmentError:
+                    pass
+
+
+class _http_stream(object):
+
+    def __init__(self, pool, scheme, netloc, conn, response, offset):
+        self._pool = pool
+        self._key = (scheme, netloc)
+        self._conn = conn
+        self._response = response
+        self.offset = offset
+        self.ranged = response.status == 206 or (
+            response.getheader('accept-ranges', '').lower() == 'bytes')
+
+    def read(self, size):
+        return self._response.read(size)
+
+    def close(self):
+        response = self._response
+        if response.isclosed() and not response.will_close:
+            # fully read; the connection is reusable.
+            self._pool.release(self._key[0], self._key[1], self._conn)
+        else:
+            self._conn.close()
+
+
+class _ftp_stream(object):
+
+    ranged = True
+
+    def __init__(self, pool, netloc, conn, sock, offset):
+        self._pool = pool
+        self._netloc = netloc
+        self._conn = conn
+        self._sock = sock
+        self._eof = False
+        self.offset = offset
+
+    def read(self, size):
+        data = self._sock.recv(size)
+        if not data:
+            self._eof = True
+        return data
+
+    def close(self):
+        self._sock.close()
+        if self._eof:
+            try:
+                self._conn.voidresp()
+            except (ftplib.Error, EnvironmentError):
+                self._conn.close()
+            else:
+                self._pool.release('ftp', self._netloc, self._conn)
+        else:
+            self._conn.close()
+
+
+class fetcher(base.fetcher):
+
+    pkgcore_config_type = ConfigHint(
+        {'distdir': 'str', 'required_chksums': 'list', 'userpriv': 'bool',
+         'attempts': 'int', 'connections': 'int', 'race': 'int',
+         'segment_threshold': 'int', 'timeout': 'int', 'readonly': 'bool',
+         'chksum_cache': 'bool', 'cache_location': 'str'},
+        allow_unknowns=True)
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, distdir, required_chksums=None, userpriv=True,
+                 attempts=10, connections=4, race=3,
+                 segment_threshold=16 * 1024 * 1024, timeout=60,
+                 readonly=False, chksum_cache=True, cache_location=None,
+                 **kwds):
+        """
+        :param distdir: directory to download files to
+        :param required_chksums: if None, all chksums must be verified,
+            else only chksums listed
+        :param userpriv: if running as root, hand downloaded files to the
+            portage user
+        :param attempts: max number of attempts before failing the fetch
+        :param connections: max number of concurrent range requests a file
+            is split into
+        :param race: number of uris of a file tried at once; the first to
+            deliver data is used
+        :param segment_threshold: files with at least this many bytes left
+            to fetch are split into range requests
+        :param timeout: socket timeout, in seconds
+        :param readonly: controls whether fetching is allowed
+        :param chksum_cache: if True, checksums of verified files are
+            cached in cache_location, see :obj:`pkgcore.fetch.chksum_cache`
+        :param cache_location: directory only the user running pkgcore can
+            write, to keep the chksum cache in; if None, nothing is cached
+        """
+        base.fetcher.__init__(self)
+        self.distdir = distdir
+        if chksum_cache and cache_location is not None:
+            self.chksum_cache = _chksum_cache.chksum_cache(
+                pjoin(cache_location, _chksum_cache.CACHE_FILENAME))
+        if required_chksums is not None:
+            required_chksums = [x.lower() for x in required_chksums]
+        else:
+            required_chksums = []
+        if len(required_chksums) == 1 and required_chksums[0] == "all":
+            self.required_chksums = None
+        else:
+            self.required_chksums = required_chksums
+        self.userpriv = userpriv
+        self.attempts = attempts
+        self.connections = max(connections, 1)
+        self.race = max(race, 1)
+        self.segment_threshold = segment_threshold
+        self.readonly = readonly
+        self._pool = _connection_pool(timeout)
+
+    def fetch(self, target):
+        """
+        fetch a file
+
+        :type target: :obj:`pkgcore.fetch.fetchable` instance
+        :return: on disk location of the fetched file
+        :raise errors.FetchFailed: if fetching failed
+        """
+        if not isinstance(target, fetchable):
+            raise TypeError(
+                "target must be fetchable instance/derivative: %s" % target)
+
+        kw = {"mode": 0775}
+        if self.readonly:
+            kw["mode"] = 0555
+        if self.userpriv:
+            kw["gid"] = portage_gid
+        kw["minimal"] = True
+        if not ensure_dirs(self.distdir, **kw):
+            raise errors.distdirPerms(
+                self.distdir, "if userpriv, uid must be %i, gid must be %i. "
+                "if not readonly, directory must be 0775, else 0555" % (
+                    portage_uid, portage_gid))
+
+        fp = pjoin(self.distdir, target.filename)
+        uris = iter(target.uri)
+        attempts = self.attempts
+        last_exc = None
+        while attempts >= 0:
+            try:
+                self._verify(fp, target)
+                return fp
+            except errors.MissingDistfile as e:
+                resume = False
+                last_exc = e
+            except errors.FetchFailed as e:
+                last_exc = e
+                resume = e.resumable
+                if not resume:
+                    try:
+                        os.unlink(fp)
+                    except OSError as oe:
+                        raise_from(errors.UnmodifiableFile(fp, oe))
+
+            if attempts > 0:
+                batch = list(islice(uris, self.race))
+                if not batch:
+                    raise errors.FetchFailed(
+                        fp, "Ran out of urls to fetch from; last failure: %s"
+                        % (last_exc.message,))
+                # as with the custom fetcher, failures are left for the
+                # verification to notice.
+                self._fetch(batch, fp, target, resume)
+            attempts -= 1
+        raise last_exc
+
+    def _fetch(self, uris, fp, target, resume):
+        offset = 0
+        if resume:
+            try:
+                offset = os.stat(fp).st_size
+            except OSError:
+                pass
+        winner = self._race(uris, offset)
+        if winner is None:
+            return
+        uri, stream, chunk = winner
+        if stream.offset and stream.offset != offset:
+            # appending would leave something other than a prefix of the
+            # distfile.
+            logger.warning(
+                "fetching %s from %s failed: asked for data from offset %i, "
+                "got it from %i", target.filename, uri, offset, stream.offset)
+            stream.close()
+            return
+        try:
+            with open(fp, 'ab' if stream.offset else 'wb') as f:
+                f.write(chunk)
+                pos = stream.offset + len(chunk)
+                size = target.chksums.get('size')
+                if (size is not None and stream.ranged and
+                        self.connections > 1 and chunk and
+                        size - pos >= self.segment_threshold):
+                    self._fetch_segments(uri, stream, f, fp, pos, size)
+                else:
+                    self._copy(stream, f)
+        except (EnvironmentError, httplib.HTTPException, ftplib.Error,
+                _request_failed) as e:
+            logger.warning("fetching %s from %s failed: %s",
+                           target.filename, uri, e)
+        finally:
+            stream.close()
+        self._chown(fp)
+
+    def _chown(self, fp):
+        if self.userpriv and is_userpriv_capable():
+            try:
+                os.chown(fp, portage_uid, portage_gid)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _copy(self, stream, handle, length=None, cancel=None):
+        while length is None or length > 0:
+            if cancel is not None and cancel.is_set():
+                raise _request_failed("cancelled")
+            size = self.chunk_size
+            if length is not None:
+                size = min(size, length)
+            data = stream.read(size)
+            if not data:
+                if length is not None:
+                    raise _request_failed(
+                        "connection closed with %i bytes missing" % (length,))
+                return
+            handle.write(data)
+            if length is not None:
+                length -= len(data)
+
+    def _fetch_segments(self, uri, stream, handle, fp, pos, size):
+        count = min(self.connections,
+                    (size - pos) // max(self.segment_threshold // 4, 1) or 1)
+        step = -(-(size - pos) // count)
+        bounds = [(start, min(start + step, size))
+                  for start in xrange(pos, size, step)]
+        paths = ["%s.__segment%i__" % (fp, idx)
+                 for idx in xrange(len(bounds))]
+        failures = []
+        threads = []
+        cancel = threading.Event()
+        for (start, end), path in zip(bounds[1:], paths[1:]):
+            t = threading.Thread(
+                target=self._fetch_segment,
+                args=(uri, start, end, path, failures, cancel))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        try:
+            # the racing connection delivers the first segment, so the
+            # file only ever holds a prefix of the distfile.
+            self._copy(stream, handle, bounds[0][1] - pos)
+            for t in threads:
+                t.join()
+            if failures:
+                raise failures[0]
+            for path in paths[1:]:
+                with open(path, 'rb') as f:
+                    self._copy(f, handle)
+        finally:
+            # segments still running would write their files after they're
+            # removed.
+            cancel.set()
+            for t in threads:
+                t.join()
+            for path in paths[1:]:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def _fetch_segment(self, uri, start, end, path, failures, cancel):
+        try:
+            if cancel.is_set():
+                return
+            stream = self._request(uri, start, end - 1)
+            try:
+                if stream.offset != start or not stream.ranged:
+                    raise _request_failed(
+                        "%s didn't honor range request" % (uri,))
+                with open(path, 'wb') as f:
+                    self._copy(stream, f, end - start, cancel)
+            finally:
+                stream.close()
+        except Exception as e:
+            failures.append(e)
+
+    def _race(self, uris, offset):
+        """Start fetching uris concurrently, keeping the first delivering.
+
+        :return: None if all failed, else a (uri, stream, first chunk) tuple
+        """
+        results = Queue.Queue()
+        for uri in uris:
+            t = threading.Thread(
+                target=self._start, args=(uri, offset, results))
+            t.daemon = True
+            t.start()
+        for pending in xrange(len(uris), 0, -1):
+            uri, stream, chunk, e = results.get()
+            if stream is not None:
+                if pending > 1:
+                    t = threading.Thread(
+                        target=self._close_losers, args=(results, pending - 1))
+                    t.daemon = True
+                    t.start()
+                return uri, stream, chunk
+            logger.warning("fetching from %s failed: %s", uri, e)
+        return None
+
+    def _start(self, uri, offset, results):
+        try:
+            stream = self._request(uri, offset)
+        except Exception as e:
+            results.put((uri, None, None, e))
+            return
+        try:
+            chunk = stream.read(self.chunk_size)
+        except Exception as e:
+            stream.close()
+            results.put((uri, None, None, e))
+            return
+        results.put((uri, stream, chunk, None))
+
+    @staticmethod
+    def _close_losers(results, count):
+        for x in xrange(count):
+            uri, stream, chunk, e = results.get()
+            if stream is not None:
+                stream.close()
+
+    def _request(self, uri, start=0, end=None, redirects=5):
+        """Open a uri, asking for the bytes from start to end inclusive.
+
+        The server may ignore the range; the offset of the returned stream
+        is where its data starts.
+        """
+        for x in xrange(redirects + 1):
+            parsed = urlparse.urlsplit(uri)
+            scheme = parsed.scheme.lower()
+            if scheme == 'ftp':
+                return self._request_ftp(parsed, start)
+            elif scheme not in ('http', 'https'):
+                raise _request_failed("unsupported uri scheme %r" % (scheme,))
+            path = parsed.path or '/'
+            if parsed.query:
+                path += '?' + parsed.query
+            headers = {'User-Agent': 'pkgcore'}
+            if start or end is not None:
+                headers['Range'] = 'bytes=%i-%s' % (
+                    start, '' if end is None else end)
+            for fresh in (False, True):
+                # pooled connections may have been closed by the server.
+                conn = self._pool.acquire(scheme, parsed.netloc, fresh=fresh)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (httplib.HTTPException, socket.error):
+                    conn.close()
+                    if fresh:
+                        raise
+            if response.status in _redirects:
+                location = response.getheader('location')
+                response.read()
+                _http_stream(self._pool, scheme, parsed.netloc, conn,
+                             response, 0).close()
+                if not location:
+                    raise _request_failed("%s: redirect without location"
+                                          % (uri,))
+                uri = urlparse.urljoin(uri, location)
+                continue
+            offset = 0
+            if response.status == 206:
+                content_range = response.getheader('content-range', '')
+                try:
+                    offset = int(content_range.split()[1].split('-')[0])
+                except (IndexError, ValueError):
+                    conn.close()
+                    raise _request_failed("%s: invalid content-range %r" % (
+                        uri, content_range))
+            elif response.status != 200:
+                conn.close()
+                raise _request_failed("%s: HTTP %i %s" % (
+                    uri, response.status, response.reason))
+            return _http_stream(self._pool, scheme, parsed.netloc, conn,
+                                response, offset)
+        raise _request_failed("%s: too many redirects" % (uri,))
+
+    def _request_ftp(self, parsed, start):
+        for fresh in (False, True):
+            conn = self._pool.acquire('ftp', parsed.netloc, fresh=fresh)
+            try:
+                sock = conn.transfercmd(
+                    'RETR ' + parsed.path, rest=start or None)
+                return _ftp_stream(
+                    self._pool, parsed.netloc, conn, sock, start)
+            except (ftplib.error_temp, EOFError, socket.error):
+                conn.close()
+                if fresh:
+                    raise
+            except ftplib.Error:
+                conn.close()
+                raise
+
+    def get_path(self, fetchable):
+        fp = pjoin(self.distdir, fetchable.filename)
+        if self._verify(fp, fetchable) is None:
+            return fp
+        return None
+
+    def get_storage_path(self):
+        return self.distdir
@@ -10,8 +10,11 @@ Shouldn't be accessed directly for the most part, use
 
 import errno
 import os
+import sys
 
 from snakeoil.currying import partial
+from snakeoil.data_source import local_source
+from snakeoil.demandload import demandload
 from snakeoil.osutils import ensure_dirs, pjoin, unlink_if_exists
 
 from pkgcore.const import COPY_BINARY
@@ -20,6 +23,15 @@ from pkgcore.fs.livefs import gen_obj
 from pkgcore.plugin import get_plugin
 from pkgcore.spawn import spawn
 
+demandload(
+    'fcntl',
+    'pkgcore.util.thread_pool:map_async',
+)
+
+# ioctl cloning a file's extents into another, on filesystems supporting
+# reflinks (btrfs, xfs, ...).
+_FICLONE = 0x40049409 if sys.platform.startswith('linux') else None
+
 
 __all__ = [
     "merge_contents", "unmerge_contents", "default_ensure_perms",
@@ -115,6 +127,24 @@ class CannotOverwrite(FailedCopy):
             self.obj, self.existing)
 
 
+def _transfer(source, path):
+    # reflink local files where possible, sharing their data rather than
+    # copying it; other sources with a path, like bz2_source, transform
+    # what's stored there.
+    if isinstance(source, local_source) and _FICLONE is not None:
+        try:
+            with open(source.path, 'rb') as src:
+                with open(path, 'wb') as trg:
+                    fcntl.ioctl(trg.fileno(), _FICLONE, src.fileno())
+            return
+        except EnvironmentError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL,
+                               errno.ENOTTY, errno.ENOSYS, errno.EBADF,
+                               errno.EPERM):
+                raise
+    source.transfer_to_path(path)
+
+
 def default_copyfile(obj, mkdirs=False):
     """
     copy a :class:`pkgcore.fs.fs.fsBase` to its stated location.
@@ -154,7 +184,7 @@ def default_copyfile(obj, mkdirs=False):
         fp = existent_fp = obj.location + "#new"
 
     if fs.isreg(obj):
-        obj.data.transfer_to_path(fp)
+        _transfer(obj.data, fp)
     elif fs.issym(obj):
         os.symlink(obj.target, fp)
     elif fs.isfifo(obj):
@@ -196,9 +226,9 @@ def do_link(src, trg):
         return False
     try:
         os.rename(path, trg.location)
-    except EnvironmentError:
+    except EnvironmentError as e:
         unlink_if_exists(path)
-        if e.eerrno != errno.EXDEV:
+        if e.errno != errno.EXDEV:
             # weird error, broken FS codes, perms, or someone is screwing with us.
             raise
         # this is only possible on overlay fs's; while annoying, you can have two
@@ -207,7 +237,26 @@ def do_link(src, trg):
     return True
 
 
-def merge_contents(cset, offset=None, callback=None):
+def _relocate(obj, ensure_perms, relocate):
+    # files of images discarded after the merge are hardlinked into place
+    # rather than copied.
+    data = obj.data
+    if not isinstance(data, local_source) or \
+            not data.path.startswith(relocate):
+        return False
+    src = obj.change_attributes(location=data.path)
+    try:
+        # the image file becomes the merged one, so give it its final
+        # attributes before it's visible.
+        ensure_perms(src)
+        return do_link(src, obj)
+    except EnvironmentError:
+        # leave it to copyfile to fail properly, if it must.
+        return False
+
+
+def merge_contents(cset, offset=None, callback=None, threads=1,
+                   relocate=()):
 
     """
     merge a :class:`pkgcore.fs.contents.contentsSet` instance to the livefs
@@ -217,6 +266,12 @@ def merge_contents(cset, offset=None, callback=None):
         Think of it as target dir.
     :param callback: callable to report each entry being merged; given a single arg,
         the fs object being merged.
+    :param threads: number of regular files copied concurrently; callback
+        is still invoked for each entry, in order, from the calling thread.
+    :param relocate: directories, like build images, that are discarded
+        after the merge; regular files whose data lies in them are
+        hardlinked into place rather than copied if on the same filesystem,
+        their attributes changed to the merged ones.
     :raise EnvironmentError: Thrown for permission failures.
     """
 
@@ -269,6 +324,12 @@ def merge_contents(cset, offset=None, callback=None):
             ensure_perms(x)
     del d
 
+    relocate = tuple(pjoin(x, '') for x in relocate)
+    if threads > 1:
+        _merge_nondirs(iterate(cset.iterdirs(invert=True)), callback,
+                       copyfile, ensure_perms, threads, relocate)
+        return True
+
     # might look odd, but what this does is minimize the try/except cost
     # to one time, assuming everything behaves, rather then per item.
     i = iterate(cset.iterdirs(invert=True))
@@ -286,7 +347,11 @@ def merge_contents(cset, offset=None, callback=None):
                         if do_link(link_target, x):
                             continue
                         # TODO: should notify that hardlinking failed.
-                    merged_inodes.setdefault(key, x)
+                    # relocating changes the image file itself, so only
+                    # the first entry of an inode may be.
+                    if merged_inodes.setdefault(key, x) is x and relocate \
+                            and _relocate(x, ensure_perms, relocate):
+                        continue
 
                 copyfile(x, mkdirs=True)
             break
@@ -304,7 +369,66 @@ def merge_contents(cset, offset=None, callback=None):
     return True
 
 
-def unmerge_contents(cset, offset=None, callback=None):
+def _copy_nondir(x, copyfile):
+    try:
+        copyfile(x, mkdirs=True)
+    except CannotOverwrite as cf:
+        if not fs.issym(x):
+            raise
+        # symlinks to directories over directories are fine.
+        try:
+            if not fs.isdir(gen_obj(pjoin(x.location, x.target))):
+                raise cf
+        except OSError:
+            raise cf
+
+
+def _merge_nondirs(entries, callback, copyfile, ensure_perms, threads,
+                   relocate):
+    # regular files are copied in a pool of threads; everything else, and
+    # hardlinks to files copied, is done in this thread once they are.
+    merged_inodes = {}
+    copies = []
+    links = []
+    for x in entries:
+        callback(x)
+        if not x.is_reg:
+            _copy_nondir(x, copyfile)
+            continue
+        key = (x.dev, x.inode)
+        link_target = merged_inodes.get(key)
+        if link_target is not None and link_target._can_be_hardlinked(x):
+            links.append((link_target, x))
+            continue
+        # relocating changes the image file itself, so only the first
+        # entry of an inode may be.
+        copies.append((x, merged_inodes.setdefault(key, x) is x))
+
+    failures = []
+
+    def copy(queue):
+        for x, first in queue:
+            if failures:
+                # drain the queue.
+                continue
+            try:
+                if not (relocate and first and
+                        _relocate(x, ensure_perms, relocate)):
+                    copyfile(x, mkdirs=True)
+            except Exception:
+                failures.append(sys.exc_info())
+
+    map_async(copies, copy, threads=threads)
+    if failures:
+        raise failures[0][0], failures[0][1], failures[0][2]
+
+    for link_target, x in links:
+        if not do_link(link_target, x):
+            # TODO: should notify that hardlinking failed.
+            copyfile(x, mkdirs=True)
+
+
+def unmerge_contents(cset, offset=None, callback=None, threads=1):
 
     """
     unmerge a :obj:`pkgcore.fs.contents.contentsSet` instance to the livefs
@@ -313,6 +437,8 @@ def unmerge_contents(cset, offset=None, callback=None):
     :param offset: if not None, offset to prefix all locations with.
         Think of it as target dir.
     :param callback: callable to report each entry being unmerged
+    :param threads: number of directories whose entries are removed
+        concurrently; callback is still invoked from the calling thread.
     :return: True, or an exception is thrown on failure
         (OSError, although see default_copyfile for specifics).
     :raise EnvironmentError: see :func:`default_copyfile` and :func:`default_mkdir`
@@ -325,6 +451,11 @@ def unmerge_contents(cset, offset=None, callback=None):
     if offset is not None:
         iterate = partial(contents.offset_rewriter, offset.rstrip(os.path.sep))
 
+    if threads > 1:
+        _unmerge_threaded(iterate(cset.iterdirs(invert=True)),
+                          iterate(cset.iterdirs()), callback, threads)
+        return True
+
     for x in iterate(cset.iterdirs(invert=True)):
         callback(x)
         unlink_if_exists(x.location)
@@ -333,16 +464,73 @@ def unmerge_contents(cset, offset=None, callback=None):
     l = list(iterate(cset.iterdirs()))
     l.sort(reverse=True)
     for x in l:
-        try:
-            os.rmdir(x.location)
-        except OSError as e:
-            if not e.errno in (errno.ENOTEMPTY, errno.ENOENT, errno.ENOTDIR,
-                               errno.EBUSY, errno.EEXIST):
-                raise
-        else:
+        if _rmdir(x.location):
             callback(x)
     return True
 
+
+def _rmdir(path):
+    try:
+        os.rmdir(path)
+    except OSError as e:
+        if not e.errno in (errno.ENOTEMPTY, errno.ENOENT, errno.ENOTDIR,
+                           errno.EBUSY, errno.EEXIST):
+            raise
+        return False
+    return True
+
+
+def _unmerge_threaded(entries, dirs, callback, threads):
+    # non-dirs are sharded by parent directory, so each directory is only
+    # modified by a single thread; directories are then removed a level at a
+    # time, deepest first, since a parent can only go once its children did.
+    shards = {}
+    for x in entries:
+        callback(x)
+        shards.setdefault(os.path.dirname(x.location), []).append(x.location)
+
+    failures = []
+
+    def unlink(queue):
+        for paths in queue:
+            if failures:
+                # drain the queue.
+                continue
+            try:
+                for path in paths:
+                    unlink_if_exists(path)
+            except Exception:
+                failures.append(sys.exc_info())
+
+    map_async(shards.values(), unlink, threads=threads)
+    if failures:
+        raise failures[0][0], failures[0][1], failures[0][2]
+
+    levels = {}
+    for x in dirs:
+        levels.setdefault(
+            x.location.rstrip(os.path.sep).count(os.path.sep), []).append(x)
+
+    for depth in sorted(levels, reverse=True):
+        level = sorted(levels[depth], reverse=True)
+        removed = [False] * len(level)
+
+        def rmdir(queue):
+            for idx, x in queue:
+                if failures:
+                    continue
+                try:
+                    removed[idx] = _rmdir(x.location)
+                except Exception:
+                    failures.append(sys.exc_info())
+
+        map_async(list(enumerate(level)), rmdir, threads=threads)
+        if failures:
+            raise failures[0][0], failures[0][1], failures[0][2]
+        for x, was_removed in zip(level, removed):
+            if was_removed:
+                callback(x)
+
 # Plugin system priorities
 for func in [default_copyfile, default_ensure_perms, default_mkdir,
              merge_contents, unmerge_contents]:
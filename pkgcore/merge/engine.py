@@ -13,7 +13,9 @@ __all__ = ("alias_cset", "map_new_cset_livefs", "MergeEngine")
 # post merge triggers
 # ordering?
 
+import itertools
 import operator
+import sys
 
 from pkgcore.fs import contents, livefs
 from pkgcore.merge import errors
@@ -29,8 +31,8 @@ from snakeoil.osutils import normpath
 demandload(
     "tempfile",
     "traceback",
-    "snakeoil.process:get_proc_count",
     "snakeoil:stringio",
+    "pkgcore.util:thread_pool",
 )
 
 
@@ -50,6 +52,16 @@ def map_new_cset_livefs(engine, csets, cset_name='new_cset'):
     return ret
 
 
+def _csets_conflict(access1, access2):
+    if access1 is None or access2 is None:
+        return True
+    reads1, writes1, derived1 = access1
+    reads2, writes2, derived2 = access2
+    if writes1 & (reads2 | writes2) or writes2 & reads1:
+        return True
+    return bool((writes1 and derived2) or (writes2 and derived1))
+
+
 class MergeEngine(object):
 
     install_hooks = {x: [] for x in
@@ -89,17 +101,25 @@ class MergeEngine(object):
     def __init__(self, mode, tempdir, hooks, csets, preserves, observer,
                  offset=None, disable_plugins=False, parallelism=None):
         if observer is None:
-            observer = observer_mod.repo_observer(observer_mod.null_output)
+            observer = observer_mod.repo_observer(observer_mod.null_output())
         self.observer = observer
         self.mode = mode
         if tempdir is not None:
             tempdir = normpath(tempdir) + '/'
         self.tempdir = tempdir
 
+        # number of threads merging files and running triggers; serial
+        # unless asked for.
         if parallelism is None:
-            parallelism = get_proc_count()
+            parallelism = 1
 
         self.parallelism = parallelism
+        # directories discarded after the merge, like build images; the
+        # files merged from them may be hardlinked rather than copied.
+        self.relocatable_paths = []
+        # if set, deferrable triggers are left to this
+        # pkgcore.merge.triggers.trigger_session to run.
+        self.trigger_session = None
 
         self.hooks = ImmutableDict((x, []) for x in hooks)
 
@@ -320,41 +340,137 @@ class MergeEngine(object):
     def execute_hook(self, hook):
         """
         execute any triggers bound to a hook point
+
+        Triggers run in priority order; of the triggers sharing a priority,
+        those declaring the csets they modify run concurrently with the
+        ones they don't conflict with, see :obj:`_trigger_waves`.
         """
         try:
             self.phase = hook
             self.regenerate_csets()
-            for trigger in sorted(self.hooks[hook],
-                key=operator.attrgetter("priority")):
-                # error checking needed here.
-                self.observer.trigger_start(hook, trigger)
-                try:
-                    try:
-                        trigger(self, self.csets)
-                    except compatibility.IGNORED_EXCEPTIONS:
-                        raise
-                    except errors.BlockModification as e:
-                        self.observer.error("modification was blocked by "
-                            "trigger %r: %s" % (trigger, e))
-                        raise
-                    except errors.ModificationError as e:
-                        self.observer.error("modification error occurred "
-                            "during trigger %r: %s" % (trigger,e))
-                        raise
-                    except Exception as e:
-                        if not trigger.suppress_exceptions:
-                            raise
-
-                        handle = stringio.text_writable()
-                        traceback.print_exc(file=handle)
-
-                        self.observer.warn("unhandled exception caught and "
-                            "suppressed:\n%s" % (handle.getvalue(),))
-                finally:
-                    self.observer.trigger_end(hook, trigger)
+            triggers = sorted(self.hooks[hook],
+                key=operator.attrgetter("priority"))
+            if self.parallelism <= 1:
+                for trigger in triggers:
+                    self._execute_trigger(hook, trigger)
+                return
+            for priority, level in itertools.groupby(
+                    triggers, operator.attrgetter("priority")):
+                for wave in self._trigger_waves(list(level)):
+                    if len(wave) == 1:
+                        self._execute_trigger(hook, wave[0])
+                    else:
+                        self._execute_concurrently(hook, wave)
         finally:
             self.phase = None
 
+    def _execute_trigger(self, hook, trigger):
+        # error checking needed here.
+        self.observer.trigger_start(hook, trigger)
+        try:
+            try:
+                trigger(self, self.csets)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except errors.BlockModification as e:
+                self.observer.error("modification was blocked by "
+                    "trigger %r: %s" % (trigger, e))
+                raise
+            except errors.ModificationError as e:
+                self.observer.error("modification error occurred "
+                    "during trigger %r: %s" % (trigger,e))
+                raise
+            except Exception as e:
+                if not trigger.suppress_exceptions:
+                    raise
+
+                handle = stringio.text_writable()
+                traceback.print_exc(file=handle)
+
+                self.observer.warn("unhandled exception caught and "
+                    "suppressed:\n%s" % (handle.getvalue(),))
+        finally:
+            self.observer.trigger_end(hook, trigger)
+
+    def _execute_concurrently(self, hook, triggers):
+        # the csets are generated lazily, so do it up front rather than
+        # racing for them.
+        for trigger in triggers:
+            for cset in trigger.get_required_csets(self.mode):
+                self.csets[cset]
+
+        failures = {}
+
+        def run(queue):
+            for trigger in queue:
+                try:
+                    self._execute_trigger(hook, trigger)
+                except BaseException:
+                    failures[trigger] = sys.exc_info()
+
+        observer = self.observer
+        self.observer = observer_mod.threadsafe_repo_observer(observer)
+        try:
+            thread_pool.map_async(triggers, run, threads=self.parallelism)
+        finally:
+            self.observer = observer
+
+        # raise what the first of the failed triggers would have serially.
+        for trigger in triggers:
+            if trigger in failures:
+                exc = failures[trigger]
+                raise exc[0], exc[1], exc[2]
+
+    def _resolve_cset(self, name):
+        # follow aliases to the cset actually holding the contents; csets
+        # that aren't preserved are derived from others afresh per hook.
+        names = [name]
+        source = self.cset_sources.get(name)
+        while getattr(source, 'func', None) is alias_cset and source.args:
+            name = source.args[0]
+            names.append(name)
+            source = self.cset_sources.get(name)
+        return name, not any(x in self.preserve_csets for x in names)
+
+    def _trigger_csets(self, trigger):
+        get_modified = getattr(trigger, 'get_modified_csets', None)
+        if get_modified is None:
+            return None
+        reads = trigger.get_required_csets(self.mode)
+        writes = get_modified(self.mode)
+        if reads is None or writes is None:
+            return None
+        reads = [self._resolve_cset(x) for x in reads]
+        writes = [self._resolve_cset(x) for x in writes]
+        derived = any(x[1] for x in reads)
+        return (frozenset(x[0] for x in reads),
+                frozenset(x[0] for x in writes), derived)
+
+    def _trigger_waves(self, triggers):
+        """
+        split triggers into waves run one after another, the triggers of a
+        wave concurrently
+
+        A trigger waits for each earlier one that modifies a cset it uses,
+        or uses a cset it modifies; triggers not declaring the csets they
+        modify, or requiring all csets, wait for and are waited on by all.
+        Reading a cset derived from others conflicts with any modification,
+        since it may have been derived after it serially.
+        """
+        access = [self._trigger_csets(x) for x in triggers]
+        waves = []
+        trigger_wave = []
+        for idx, trigger in enumerate(triggers):
+            wave = 0
+            for prior in xrange(idx):
+                if _csets_conflict(access[prior], access[idx]):
+                    wave = max(wave, trigger_wave[prior] + 1)
+            trigger_wave.append(wave)
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(trigger)
+        return waves
+
     @staticmethod
     def generate_offset_cset(engine, csets, cset_generator):
         """generate a cset with offset applied"""
@@ -23,6 +23,7 @@ __all__ = (
     "merge",
     "unmerge",
     "InfoRegen",
+    "trigger_session",
 )
 
 from snakeoil import compatibility
@@ -63,13 +64,22 @@ class base(object):
     :ivar priority: range of 0 to 100, order of execution for triggers per hook
     :ivar _engine_types: if None, trigger works for all engine modes, else it's
         limited to that mode, and must be a sequence
+    :ivar deferrable: if True, and the engine has a :obj:`trigger_session`,
+        the trigger is run once by the session rather than after each merge
+    :ivar modified_csets: If None, the trigger may modify anything and is run
+        alone, else it must be a sequence (or a dict by mode, like
+        required_csets) of the csets it modifies; it's then run concurrently
+        with the triggers of the same priority it doesn't conflict with, so
+        any other side effects mustn't interfere with them
     """
 
     required_csets = None
+    modified_csets = None
     _label = None
     _hooks = None
     _engine_types = None
     priority = 50
+    deferrable = False
 
     suppress_exceptions = True
 
@@ -113,6 +123,14 @@ class base(object):
                 csets = csets.get(mode)
         return csets
 
+    def get_modified_csets(self, mode):
+        csets = self.modified_csets
+        if csets is not None:
+            if not isinstance(csets, tuple):
+                # has to be a dict.
+                csets = csets.get(mode)
+        return csets
+
     def localize(self, engine):
         """
         'localize' a trigger to a specific merge engine process
@@ -130,6 +148,11 @@ class base(object):
     def __call__(self, engine, csets):
         """execute the trigger"""
 
+        if self.deferrable:
+            session = getattr(engine, 'trigger_session', None)
+            if session is not None and session.defer(self, engine):
+                return
+
         required_csets = self.get_required_csets(engine.mode)
 
         if required_csets is None:
@@ -282,6 +305,86 @@ class mtime_watcher(object):
                 yield x
 
 
+class _session_engine(object):
+
+    # what deferred triggers see of an engine when a session runs them.
+    phase = 'sync'
+    mode = None
+    trigger_session = None
+
+    def __init__(self, offset, observer):
+        self.offset = offset
+        self.observer = observer
+
+
+class trigger_session(object):
+
+    """
+    run deferrable triggers once across the merges of a session
+
+    Triggers like :obj:`ldconfig` and :obj:`InfoRegen` regenerate state
+    covering the whole livefs; when merging many packages, running them
+    after every merge is wasted work.  Set on the engines of those merges
+    (see :obj:`pkgcore.config.domain.domain.trigger_session`), deferrable
+    triggers collect their state before the first merge only, and their
+    work is done once per trigger and offset by :obj:`sync`.
+    """
+
+    def __init__(self):
+        self._triggers = {}
+
+    def __nonzero__(self):
+        """whether any deferred trigger is waiting on :obj:`sync`"""
+        return any(x[3] for x in self._triggers.itervalues())
+
+    def defer(self, trigger, engine):
+        """
+        record a deferrable trigger being executed by an engine
+
+        :return: True if the trigger was deferred, False if it must be
+            executed now, collecting the state a later :obj:`sync` uses
+        """
+        key = (trigger.label, engine.offset)
+        state = self._triggers.get(key)
+        if engine.phase.startswith('pre_'):
+            if state is not None:
+                return True
+            self._triggers[key] = [trigger, engine.offset, engine.observer,
+                                   False]
+            return False
+        if state is None:
+            state = self._triggers[key] = [
+                trigger, engine.offset, engine.observer, False]
+        state[3] = True
+        return True
+
+    def sync(self):
+        """
+        execute the deferred triggers, in priority order
+
+        State is collected anew by the merges following.
+        """
+        pending = sorted((x for x in self._triggers.itervalues() if x[3]),
+                         key=lambda x: x[0].priority)
+        self._triggers.clear()
+        for trigger, offset, observer, _ in pending:
+            if observer is not None:
+                observer.trigger_start('sync', trigger)
+            try:
+                trigger(_session_engine(offset, observer), {})
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                if not trigger.suppress_exceptions:
+                    raise
+                if observer is not None:
+                    observer.warn("deferred trigger %r failed: %s" %
+                                  (trigger, e))
+            finally:
+                if observer is not None:
+                    observer.trigger_end('sync', trigger)
+
+
 def update_elf_hints(root):
     return spawn.spawn(["/sbin/ldconfig", "-r", root], fd_pipes={1:1, 2:2})
 
@@ -292,6 +395,8 @@ class ldconfig(base):
     priority = 10
     _engine_types = None
     _hooks = ('pre_merge', 'post_merge', 'pre_unmerge', 'post_unmerge')
+    deferrable = True
+    modified_csets = ()
 
     default_ld_path = ['usr/lib', 'usr/lib64', 'usr/lib32', 'lib', 'lib64', 'lib32']
 
@@ -355,6 +460,8 @@ class InfoRegen(base):
     _hooks = ('pre_merge', 'post_merge', 'pre_unmerge', 'post_unmerge')
     _engine_types = None
     _label = "gnu info regen"
+    deferrable = True
+    modified_csets = ()
 
     locations = ('/usr/share/info',)
 
@@ -439,7 +546,9 @@ class merge(base):
 
     def trigger(self, engine, merging_cset):
         op = get_plugin('fs_ops.merge_contents')
-        return op(merging_cset, callback=engine.observer.installing_fs_obj)
+        return op(merging_cset, callback=engine.observer.installing_fs_obj,
+                  threads=engine.parallelism,
+                  relocate=engine.relocatable_paths)
 
 
 class unmerge(base):
@@ -452,7 +561,8 @@ class unmerge(base):
 
     def trigger(self, engine, unmerging_cset):
         op = get_plugin('fs_ops.unmerge_contents')
-        return op(unmerging_cset, callback=engine.observer.removing_fs_obj)
+        return op(unmerging_cset, callback=engine.observer.removing_fs_obj,
+                  threads=engine.parallelism)
 
 
 class BaseSystemUnmergeProtection(base):
@@ -486,6 +596,7 @@ class BaseSystemUnmergeProtection(base):
 class fix_uid_perms(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ('new_cset',)
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -505,6 +616,7 @@ class fix_uid_perms(base):
 class fix_gid_perms(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ('new_cset',)
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -525,6 +637,7 @@ class fix_gid_perms(base):
 class fix_set_bits(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ('new_cset',)
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -559,6 +672,7 @@ class detect_world_writable(base):
     def __init__(self, fix_perms=False):
         base.__init__(self)
         self.fix_perms = fix_perms
+        self.modified_csets = ('new_cset',) if fix_perms else ()
 
     def trigger(self, engine, cset):
         if not engine.observer and not self.fix_perms:
@@ -577,6 +691,7 @@ class detect_world_writable(base):
 class PruneFiles(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ('new_cset',)
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -601,6 +716,7 @@ class PruneFiles(base):
 class CommonDirectoryModes(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ()
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -628,6 +744,7 @@ class CommonDirectoryModes(base):
 class BlockFileType(base):
 
     required_csets = ('new_cset',)
+    modified_csets = ()
     _hooks = ('pre_merge',)
     _engine_types = INSTALLING_MODES
 
@@ -743,6 +860,7 @@ class SavePkgUnmergingIfInPkgset(SavePkgUnmerging):
 class BinaryDebug(ThreadedTrigger):
 
     required_csets = ('install',)
+    modified_csets = ('install',)
     _engine_types = INSTALLING_MODES
 
     _hooks = ('pre_merge',)
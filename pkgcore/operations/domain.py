@@ -86,6 +86,8 @@ class base(object):
         """start the transaction"""
         self._create_tempspace()
         self.me = engine = self.create_engine()
+        engine.trigger_session = getattr(self.domain, 'trigger_session', None)
+        engine.parallelism = getattr(self.domain, 'merge_jobs', 1)
         self.format_op.add_triggers(self, engine)
         self._add_triggers(engine)
         self.customize_engine(engine)
@@ -33,6 +33,16 @@ class fetch_base(object):
         self.fetcher = fetcher
 
     def fetch_all(self, observer):
+        # verify the distfiles already on disk concurrently; only the rest
+        # go through the fetcher, one at a time.
+        get_paths = getattr(self.fetcher, 'get_paths', None)
+        if get_paths is not None:
+            fetchables = [x for x in self.fetchables
+                          if x.filename not in self._basenames]
+            for fetchable, fp in zip(fetchables, get_paths(fetchables)):
+                if fp is not None:
+                    self.verified_files[fp] = fetchable
+                    self._basenames.add(fetchable.filename)
         for fetchable in self.fetchables:
             if not self.fetch_one(fetchable, observer):
                 return False
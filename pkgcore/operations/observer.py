@@ -2,7 +2,7 @@
 # License: GPL2/BSD
 
 __all__ = (
-    "null_output", "formatter_output", "file_handle_output",
+    "null_output", "formatter_output", "file_handle_output", "prefixed_output",
     "phase_observer", "build_observer", "repo_observer",
     "decorate_build_method",
 )
@@ -95,6 +95,42 @@ class file_handle_output(null_output):
         self._out.write(_convert(msg, args, kwds))
 
 
+class prefixed_output(null_output):
+
+    """Prefix every message written to another output.
+
+    Access to the wrapped output is serialized by a lock, which outputs
+    shared by concurrent jobs should share.
+    """
+
+    def __init__(self, output, prefix='', lock=None):
+        self._output = output
+        self._prefix = prefix
+        if lock is None:
+            lock = threading.Lock()
+        self._lock = lock
+
+    def _invoke(self, attr, msg, args, kwds):
+        msg = self._prefix + _convert(msg, args, kwds)
+        with self._lock:
+            getattr(self._output, attr)("%s", msg)
+
+    def error(self, msg, *args, **kwds):
+        self._invoke("error", msg, args, kwds)
+
+    def info(self, msg, *args, **kwds):
+        self._invoke("info", msg, args, kwds)
+
+    def warn(self, msg, *args, **kwds):
+        self._invoke("warn", msg, args, kwds)
+
+    def write(self, msg, *args, **kwds):
+        self._invoke("write", msg, args, kwds)
+
+    def debug(self, msg, *args, **kwds):
+        self._invoke("debug", msg, args, kwds)
+
+
 class phase_observer(object):
 
     def __init__(self, output, semiquiet=True):
@@ -0,0 +1,307 @@
+# License: GPL2/BSD
+
+"""
+concurrent execution of resolved plans
+
+Fetching and building ops runs in threads, several at a time; merging
+into the livefs happens one op at a time in the calling thread.  Which ops
+may run when is decided by the dependency graph of the plan, see
+:obj:`pkgcore.resolver.dag.plan_dag`:
+
+- an op starts building once its build dependencies are merged
+- a built op is merged once its build and runtime dependencies are merged
+
+Removals aren't part of the graph, so they act as barriers: they wait for
+every op the plan puts before them, and ops after them wait for them.
+"""
+
+__all__ = ("merge_scheduler",)
+
+import os
+import Queue
+import threading
+
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.currying import partial
+from snakeoil.demandload import demandload
+
+from pkgcore.operations import observer
+
+demandload(
+    'pkgcore.merge:errors@merge_errors',
+    'pkgcore.operations:format',
+)
+
+
+class _job_failure(Exception):
+
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+
+class merge_scheduler(object):
+
+    """Run the ops of a plan, building independent ops concurrently.
+
+    :ivar failed: ops that failed
+    :ivar done: ops that finished, successfully or not
+    """
+
+    def __init__(self, domain, dag, out, jobs=1, load_average=None,
+                 fetchonly=False, ignore_failures=False, debug=False,
+                 merged=None, background=None):
+        """
+        :param domain: domain whose pkg operations and livefs are used
+        :param dag: :obj:`pkgcore.resolver.dag.plan_dag` of the ops to run
+        :param out: formatter progress is written to
+        :param jobs: maximal number of ops fetching or building at once
+        :param load_average: if not None, don't start new jobs while
+            another is running and the load average is at least this
+        :param fetchonly: only fetch the distfiles of the ops
+        :param ignore_failures: if False, stop starting new jobs after the
+            first failure
+        :param debug: if True, observers report every phase
+        :param merged: if not None, called with every op once it's merged;
+            it's called holding the lock of the output, so it may write to
+            out directly
+        :param background: if not None,
+            :obj:`pkgcore.fetch.background.background_fetcher` fetching the
+            distfiles of the ops; jobs wait on it before fetching
+        """
+        self.domain = domain
+        self.dag = dag
+        self.out = out
+        self.jobs = max(jobs, 1)
+        self.load_average = load_average
+        self.fetchonly = fetchonly
+        self.ignore_failures = ignore_failures
+        self.merged = merged
+        self.background = background
+        self.failed = []
+        self.done = set()
+        self._semiquiet = not debug
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._output = observer.prefixed_output(
+            observer.formatter_output(out), lock=self._lock)
+        self._repo_observer = observer.repo_observer(
+            self._output, self._semiquiet)
+
+    def _job_observer(self, op):
+        return observer.build_observer(observer.prefixed_output(
+            observer.formatter_output(self.out), "[%s] " % (op.pkg.cpvstr,),
+            self._lock), self._semiquiet)
+
+    def _barriers(self):
+        # ops each op waits on besides its dependencies: the removals
+        # before it, or for removals, every op before them.
+        barriers = {}
+        prior = []
+        removals = []
+        for op in self.dag:
+            if op.desc == 'remove':
+                barriers[op] = tuple(prior)
+                removals.append(op)
+            else:
+                barriers[op] = tuple(removals)
+            prior.append(op)
+        return barriers
+
+    def _can_build(self, op):
+        return all(dep in self.done for dep in self._barrier[op]) and all(
+            dep in self.done for dep in self.dag.prerequisites(op, ('build',)))
+
+    def _can_merge(self, op):
+        return all(dep in self.done for dep in self._barrier[op]) and all(
+            dep in self.done for dep in self.dag.prerequisites(op))
+
+    def _load_ok(self, running):
+        if self.load_average is None or not running:
+            return True
+        try:
+            return os.getloadavg()[0] < self.load_average
+        except OSError:
+            return True
+
+    def run(self):
+        """Run the ops.
+
+        :return: True if every op ran, and either succeeded or failures are
+            ignored
+        """
+        self._barrier = self._barriers()
+        pending = list(self.dag)
+        if self.fetchonly:
+            self.done.update(op for op in pending if op.desc == 'remove')
+            pending = [op for op in pending if op.desc != 'remove']
+        count = len(pending)
+        built = []
+        running = {}
+        results = Queue.Queue()
+        stopped = False
+
+        while True:
+            if not stopped:
+                # merge whatever is ready, in plan order.
+                for item in built[:]:
+                    if self._can_merge(item[0]):
+                        built.remove(item)
+                        if not self._merge(*item) and not self.ignore_failures:
+                            stopped = True
+                            break
+
+            if not stopped:
+                for op in pending[:]:
+                    if op.desc == 'remove':
+                        if self._can_merge(op):
+                            pending.remove(op)
+                            built.append((op, op.pkg, []))
+                        continue
+                    if len(running) >= self.jobs or not self._load_ok(running):
+                        break
+                    if not self._can_build(op):
+                        continue
+                    pending.remove(op)
+                    if not getattr(op.pkg, 'built', False):
+                        self._sync_triggers()
+                    self._output.info(
+                        "Starting %i of %i: %s", count - len(pending), count,
+                        op.pkg.cpvstr)
+                    t = threading.Thread(target=self._job, args=(op, results))
+                    t.daemon = True
+                    running[op] = t
+                    t.start()
+                if any(self._can_merge(item[0]) for item in built):
+                    continue
+
+            if not running:
+                # finished, stopped, or what's left waits on failed ops.
+                break
+
+            try:
+                # poll, so interrupts are seen and load changes noticed.
+                op, ret = results.get(True, 1)
+            except Queue.Empty:
+                continue
+            running.pop(op).join()
+            if isinstance(ret, BaseException):
+                if isinstance(ret, _job_failure):
+                    self._output.error("%s", ret.msg)
+                else:
+                    self._output.error(
+                        "caught exception processing %s: %s",
+                        op.pkg.cpvstr, ret)
+                self._fail(op)
+                if not self.ignore_failures:
+                    stopped = True
+            elif self.fetchonly:
+                self.done.add(op)
+                for func in ret[1]:
+                    func()
+            else:
+                built.append((op,) + ret)
+
+        # release whatever was built but not merged.
+        for op, pkg, cleanups in built:
+            for func in cleanups:
+                func()
+        return not stopped and not pending and not built
+
+    def _sync_triggers(self):
+        # builds see the livefs as the triggers deferred by merges leave it.
+        session = getattr(self.domain, 'trigger_session', None)
+        if session:
+            session.sync()
+
+    def _fail(self, op):
+        self.failed.append(op)
+        if self.ignore_failures:
+            # mirror the sequential behaviour of carrying on regardless.
+            self.done.add(op)
+
+    def _job(self, op, results):
+        try:
+            ret = self._build(op)
+        except IGNORED_EXCEPTIONS:
+            results.put((op, _job_failure(
+                "interrupted processing %s" % (op.pkg.cpvstr,))))
+            raise
+        except BaseException as e:
+            ret = e
+        results.put((op, ret))
+
+    def _build(self, op):
+        obs = self._job_observer(op)
+        cleanups = [op.pkg.release_cached_data]
+        try:
+            pkg_ops = self.domain.pkg_operations(op.pkg, observer=obs)
+            obs.info("%i files required", len(op.pkg.fetchables))
+            if self.background is not None:
+                # failures are retried and reported by the fetch below.
+                self.background.wait(op.pkg)
+            # fetchers aren't safe against concurrent fetches of a distfile.
+            with self._fetch_lock:
+                ret = pkg_ops.run_if_supported("fetch", or_return=True)
+            if ret is not True:
+                raise _job_failure("fetching failed for %s: %s" % (
+                    op.pkg.cpvstr, ret or "unknown failure"))
+            if self.fetchonly:
+                return op.pkg, cleanups
+
+            buildop = pkg_ops.run_if_supported("build", or_return=None)
+            pkg = op.pkg
+            if buildop is not None:
+                obs.info("building %s", op.pkg.cpvstr)
+                try:
+                    result = buildop.finalize()
+                except format.errors as e:
+                    raise _job_failure("caught exception building %s: %s" % (
+                        op.pkg.cpvstr, e))
+                if result is False:
+                    raise _job_failure("failed building %s" % (op.pkg.cpvstr,))
+                pkg = result
+                cleanups.append(pkg.release_cached_data)
+                pkg_ops = self.domain.pkg_operations(pkg, observer=obs)
+                cleanups.append(buildop.cleanup)
+
+            cleanups.append(partial(pkg_ops.run_if_supported, "cleanup"))
+            pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
+            return pkg, cleanups
+        except BaseException:
+            for func in cleanups:
+                func()
+            raise
+
+    def _merge(self, op, pkg, cleanups):
+        out = self._output
+        domain = self.domain
+        try:
+            if op.desc == "remove":
+                out.info(">>> Removing %s", op.pkg.cpvstr)
+                i = domain.uninstall_pkg(op.pkg, self._repo_observer)
+            elif op.desc == "replace":
+                if op.old_pkg == pkg:
+                    out.info(">>> Reinstalling %s", pkg.cpvstr)
+                else:
+                    out.info(">>> Replacing %s with %s",
+                             op.old_pkg.cpvstr, pkg.cpvstr)
+                i = domain.replace_pkg(op.old_pkg, pkg, self._repo_observer)
+                cleanups.append(op.old_pkg.release_cached_data)
+            else:
+                out.info(">>> Installing %s", pkg.cpvstr)
+                i = domain.install_pkg(pkg, self._repo_observer)
+            try:
+                i.finish()
+            except merge_errors.BlockModification as e:
+                out.error("Failed to merge %s: %s", op.pkg, e)
+                self._fail(op)
+                return False
+        finally:
+            for func in cleanups:
+                func()
+        self.done.add(op)
+        if self.merged is not None:
+            with self._lock:
+                self.merged(op)
+        return True
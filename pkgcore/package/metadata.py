@@ -129,6 +129,18 @@ class factory(object):
         """
         self._cached_instances.clear()
 
+    def project_metadata(self, pkg, attrs):
+        """
+        limit the metadata a package pulls to that needed for some attributes
+
+        This is advisory; factories not supporting it ignore it, and
+        accessing other attributes still works, pulling the rest of the
+        metadata as needed.
+
+        :param pkg: package instance generated by this factory
+        :param attrs: names of the package attributes that will be accessed
+        """
+
     def _get_metadata(self, *args):
         """Pulls metadata from the repo/cache/wherever.
 
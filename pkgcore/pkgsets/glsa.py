@@ -7,10 +7,10 @@ Gentoo Linux Security Advisories (GLSA) support
 
 __all__ = ("GlsaDirSet", "SecurityUpgrades")
 
+from itertools import izip
 import os
 
 from snakeoil.demandload import demandload
-from snakeoil.iterables import caching_iter
 from snakeoil.klass import generic_equality
 from snakeoil.osutils import listdir_files, pjoin
 
@@ -202,12 +202,11 @@ def find_vulnerable_repo_pkgs(glsa_src, repo, grouped=False, arch=None):
         else:
             arch = tuple(arch)
         wrapper = lambda p: mutated.MutatedPkg(p, {"keywords":arch})
-    for restrict in i:
-        matches = caching_iter(wrapper(x)
-                               for x in repo.itermatch(restrict,
-                                                       sorter=sorted))
+    restricts = list(i)
+    for restrict, matches in izip(restricts,
+            repo.itermatch_many(restricts, sorter=sorted)):
         if matches:
-            yield restrict, matches
+            yield restrict, map(wrapper, matches)
 
 
 class SecurityUpgrades(object):
@@ -49,18 +49,28 @@ class tree(prototype.tree):
 
     __getattr__ = GetAttrProxy("raw_repo")
 
-    def itermatch(self, restrict, **kwds):
+    def _setup_match_kwds(self, kwds):
         kwds.setdefault("force", True)
         o = kwds.get("pkg_klass_override")
         if o is not None:
             kwds["pkg_klass_override"] = partial(self.package_class, o)
         else:
             kwds["pkg_klass_override"] = self.package_class
+
+    def itermatch(self, restrict, **kwds):
+        self._setup_match_kwds(kwds)
         return (x for x in self.raw_repo.itermatch(restrict, **kwds) if x.is_supported)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
 
+    def itermatch_many(self, restricts, **kwds):
+        self._setup_match_kwds(kwds)
+        return [[x for x in l if x.is_supported]
+                for l in self.raw_repo.itermatch_many(restricts, **kwds)]
+
+    itermatch_many.__doc__ = prototype.tree.itermatch_many.__doc__
+
     def __getitem__(self, key):
         obj = self.package_class(self.raw_repo[key])
         if not obj.is_supported:
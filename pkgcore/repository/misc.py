@@ -27,16 +27,22 @@ class nodeps_repo(object):
         """
         self.raw_repo = repo
 
-    def itermatch(self, *a, **kwds):
-        return (MutatedPkg(x,
+    def _wrap(self, pkg):
+        return MutatedPkg(pkg,
             overrides={"depends":self.default_depends,
                 "rdepends":self.default_rdepends,
                 "post_rdepends":self.default_post_rdepends})
-                for x in self.raw_repo.itermatch(*a, **kwds))
+
+    def itermatch(self, *a, **kwds):
+        return (self._wrap(x) for x in self.raw_repo.itermatch(*a, **kwds))
 
     def match(self, *a, **kwds):
         return list(self.itermatch(*a, **kwds))
 
+    def itermatch_many(self, *a, **kwds):
+        return [map(self._wrap, l)
+                for l in self.raw_repo.itermatch_many(*a, **kwds)]
+
     __getattr__ = GetAttrProxy("raw_repo")
 
     def __iter__(self):
@@ -88,6 +94,22 @@ class caching_repo(object):
     def itermatch(self, restrict):
         return iter(self.match(restrict))
 
+    def itermatch_many(self, restricts):
+        """
+        match multiple restrictions, batching the uncached ones via
+        the wrapped db's itermatch_many
+
+        :return: list of :obj:`caching_iter` instances, one per restriction
+        """
+        restricts = list(restricts)
+        cache = self.__cache__
+        missing = [x for x in restricts if x not in cache]
+        if missing:
+            for restrict, l in zip(missing, self.__db__.itermatch_many(
+                    missing, sorter=self.__strategy__)):
+                cache[restrict] = caching_iter(l)
+        return [cache[x] for x in restricts]
+
     __getattr__ = GetAttrProxy("__db__")
 
     def clear(self):
@@ -107,6 +129,12 @@ class multiplex_sorting_repo(object):
     def match(self, restrict):
         return list(self.itermatch(restrict))
 
+    def itermatch_many(self, restricts):
+        restricts = list(restricts)
+        per_repo = [repo.itermatch_many(restricts) for repo in self.__repos__]
+        return [list(iter_sort(self.__sorter__, *[iter(x) for x in l]))
+                for l in zip(*per_repo)] or [[] for x in restricts]
+
     def has_match(self, restrict):
         for repo in self.__repos__:
             if repo.has_match(restrict):
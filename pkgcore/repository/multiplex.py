@@ -7,7 +7,7 @@ repository that combines multiple repositories together
 
 __all__ = ("tree", "operations")
 
-from itertools import chain
+from itertools import chain, izip
 from operator import itemgetter
 
 from snakeoil import klass
@@ -149,6 +149,20 @@ class tree(prototype.tree):
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
 
+    def itermatch_many(self, restricts, **kwds):
+        restricts = list(restricts)
+        if not self.trees:
+            return [[] for x in restricts]
+        per_repo = [repo.itermatch_many(restricts, **kwds) for repo in self.trees]
+        results = [list(chain.from_iterable(l)) for l in izip(*per_repo)]
+        sorter = kwds.get("sorter", iter)
+        if sorter is not iter and len(self.trees) > 1:
+            # each repo's matches are already sorted; merge them.
+            results = [list(sorter(l)) for l in results]
+        return results
+
+    itermatch_many.__doc__ = prototype.tree.itermatch_many.__doc__
+
     def __iter__(self):
         return (pkg for repo in self.trees for pkg in repo)
 
@@ -10,13 +10,15 @@ __all__ = (
 )
 
 from snakeoil.compatibility import is_py3k
+from snakeoil.currying import post_curry
 from snakeoil.lists import iflatten_instance
 from snakeoil.mappings import LazyValDict, DictMixin
 
 from pkgcore.ebuild.atom import atom
 from pkgcore.operations import repo
 from pkgcore.restrictions import values, boolean, restriction, packages
-from pkgcore.restrictions.util import collect_package_restrictions
+from pkgcore.restrictions.util import (
+    collect_package_attrs, collect_package_restrictions)
 
 
 class IterValLazyDict(LazyValDict):
@@ -117,6 +119,18 @@ class VersionMapping(DictMixin):
             self._cache.pop(key, None)
 
 
+def _restrict_cp(restrict):
+    """Return the (category, package) a restriction is limited to, if any."""
+    if isinstance(restrict, atom):
+        return restrict.category, restrict.package
+    if isinstance(restrict, packages.KeyedAndRestriction) and \
+            not restrict.negate and restrict.key is not None:
+        cp = tuple(restrict.key.split("/", 1))
+        if len(cp) == 2:
+            return cp
+    return None
+
+
 class tree(object):
     """
     repository template
@@ -199,7 +213,8 @@ class tree(object):
         return list(self.itermatch(atom, **kwds))
 
     def itermatch(self, restrict, restrict_solutions=None, sorter=None,
-                  pkg_klass_override=None, force=None, yield_none=False):
+                  pkg_klass_override=None, force=None, yield_none=False,
+                  attrs=None):
 
         """
         generator that yields packages match a restriction.
@@ -218,6 +233,10 @@ class tree(object):
             packages. If you override this method you should yield
             None in long-running loops, strictly calling it for every package
             is not necessary.
+        :param attrs: if not None, the package attributes the caller will
+            access on the matches.  Repos able to will only pull the
+            metadata needed for those and for restrict, pulling the rest
+            if and when it's accessed.
         """
 
         if not isinstance(restrict, restriction.base):
@@ -241,7 +260,91 @@ class tree(object):
             match = restrict.force_False
         return self._internal_match(
             candidates, match, sorter, pkg_klass_override,
-            yield_none=yield_none)
+            yield_none=yield_none, project=self._get_projector(restrict, attrs))
+
+    def _get_projector(self, restricts, attrs):
+        """Return a callable limiting pkgs metadata, or None if not possible.
+
+        :param restricts: restriction, or sequence of restrictions, that
+            will be matched against the pkgs
+        :param attrs: attributes the caller wants, or None if unknown
+        """
+        if attrs is None:
+            return None
+        project = getattr(self.package_class, "project_metadata", None)
+        if project is None:
+            return None
+        if isinstance(restricts, restriction.base):
+            restricts = (restricts,)
+        attrs = set(attrs)
+        for r in restricts:
+            l = collect_package_attrs(r)
+            if l is None:
+                return None
+            attrs.update(l)
+        return post_curry(project, frozenset(attrs))
+
+    def itermatch_many(self, restricts, **kwds):
+        """
+        match a sequence of restrictions in one pass
+
+        Restrictions limited to a single package key (atoms, and keyed
+        restrictions) are grouped by that key; each key's versions are
+        enumerated and instantiated once for the whole group.  Other
+        restrictions are matched via :obj:`itermatch` individually.
+
+        Keywords are the same as :obj:`itermatch`, although yield_none is
+        ignored.
+
+        :param restricts: sequence of restrictions to match
+        :return: list holding a list of matching pkgs per restriction,
+            in the same order as restricts
+        """
+        kwds.pop("yield_none", None)
+        restricts = list(restricts)
+        results = [None] * len(restricts)
+        grouped = {}
+        for idx, restrict in enumerate(restricts):
+            if not isinstance(restrict, restriction.base):
+                raise TypeError("restrict must be a "
+                    "pkgcore.restriction.restrictions.base instance: "
+                    "got %r" % (restrict,))
+            cp = _restrict_cp(restrict)
+            if cp is None:
+                results[idx] = list(self.itermatch(restrict, **kwds))
+            else:
+                grouped.setdefault(cp, []).append(idx)
+
+        if not grouped:
+            return results
+
+        sorter = kwds.get("sorter")
+        if sorter is None:
+            sorter = iter
+        force = kwds.get("force")
+        if force is None:
+            attr = "match"
+        elif force:
+            attr = "force_True"
+        else:
+            attr = "force_False"
+        pkg_klass_override = kwds.get("pkg_klass_override")
+        attrs = kwds.get("attrs")
+        for cp, idxs in grouped.iteritems():
+            pkgs = self._internal_gen_candidates([cp], sorter)
+            project = self._get_projector(
+                [restricts[idx] for idx in idxs], attrs)
+            if project is not None:
+                pkgs = list(pkgs)
+                for pkg in pkgs:
+                    project(pkg)
+            if pkg_klass_override is not None:
+                pkgs = (pkg_klass_override(pkg) for pkg in pkgs)
+            pkgs = list(pkgs)
+            for idx in idxs:
+                match = getattr(restricts[idx], attr)
+                results[idx] = [pkg for pkg in pkgs if match(pkg)]
+        return results
 
     def _internal_gen_candidates(self, candidates, sorter):
         pkls = self.package_class
@@ -251,8 +354,10 @@ class tree(object):
                 yield pkg
 
     def _internal_match(self, candidates, match_func, sorter,
-                        pkg_klass_override, yield_none=False):
+                        pkg_klass_override, yield_none=False, project=None):
         for pkg in self._internal_gen_candidates(candidates, sorter):
+            if project is not None:
+                project(pkg)
             if pkg_klass_override is not None:
                 pkg = pkg_klass_override(pkg)
 
@@ -66,6 +66,7 @@ class RepositoryGroup(object):
         self.combined = combined
 
     itermatch = klass.alias_attr("combined.itermatch")
+    itermatch_many = klass.alias_attr("combined.itermatch_many")
     has_match = klass.alias_attr("combined.has_match")
     match = klass.alias_attr("combined.match")
 
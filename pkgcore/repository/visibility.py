@@ -15,6 +15,7 @@ from snakeoil.klass import GetAttrProxy
 from pkgcore.operations.repo import operations_proxy
 from pkgcore.repository import prototype, errors
 from pkgcore.restrictions.restriction import base
+from pkgcore.restrictions.util import collect_package_attrs
 
 # these tricks are to keep 2to3 from screwing up.
 if compatibility.is_py3k:
@@ -43,12 +44,21 @@ class filterTree(prototype.tree):
         else:
             self._filterfunc = filterfalse
 
+    def _extend_attrs(self, kwds):
+        attrs = kwds.get("attrs")
+        if attrs is not None:
+            extra = collect_package_attrs(self.restriction)
+            if extra is not None:
+                extra = extra.union(attrs)
+            kwds["attrs"] = extra
+
     def itermatch(self, restrict, **kwds):
         # note that this lets the repo do the initial filtering.
         # better design would to analyze the restrictions, and inspect
         # the repo, determine what can be done without cost
         # (determined by repo's attributes) versus what does cost
         # (metadata pull for example).
+        self._extend_attrs(kwds)
         return self._filterfunc(self.restriction.match,
             self.raw_repo.itermatch(restrict, **kwds))
 
@@ -56,6 +66,14 @@ class filterTree(prototype.tree):
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
 
+    def itermatch_many(self, restricts, **kwds):
+        self._extend_attrs(kwds)
+        match = self.restriction.match
+        return [list(self._filterfunc(match, l))
+                for l in self.raw_repo.itermatch_many(restricts, **kwds)]
+
+    itermatch_many.__doc__ = prototype.tree.itermatch_many.__doc__
+
     def __len__(self):
         count = 0
         for i in self:
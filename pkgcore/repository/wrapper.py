@@ -39,6 +39,10 @@ class tree(prototype.tree):
     def itermatch(self, *args, **kwargs):
         return imap(self.package_class, self.raw_repo.itermatch(*args, **kwargs))
 
+    def itermatch_many(self, *args, **kwargs):
+        return [map(self.package_class, l)
+                for l in self.raw_repo.itermatch_many(*args, **kwargs)]
+
     __getattr__ = GetAttrProxy("raw_repo")
 
     def __len__(self):
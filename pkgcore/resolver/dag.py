@@ -0,0 +1,215 @@
+# License: GPL2/BSD
+
+"""
+dependency graph of resolved plans
+
+:obj:`pkgcore.resolver.state.plan_state.ops` linearizes a plan; this keeps
+the dependencies between its ops, so consumers can tell which ops are
+independent of each other and may run concurrently.
+"""
+
+__all__ = ("plan_dag",)
+
+from snakeoil.lists import iflatten_instance
+
+from pkgcore.ebuild.atom import atom as _atom
+
+# dependency kind, and the pkg attribute it comes from.
+dep_kinds = (
+    ("build", "depends"),
+    ("runtime", "rdepends"),
+    ("post", "post_rdepends"),
+)
+
+# post dependencies only have to be merged at some point, they don't order.
+ordering_kinds = frozenset(("build", "runtime"))
+
+
+def _dep_atoms(pkg, attr):
+    for atom in iflatten_instance(getattr(pkg, attr), _atom):
+        if not atom.blocks:
+            yield atom
+
+
+class plan_dag(object):
+
+    """Dependency graph between the ops of a resolved plan.
+
+    The edges are rebuilt from the final state of the plan: each dependency
+    of an op's pkg points at the ops whose pkgs satisfy it in the plan.
+    Dependencies satisfied by pkgs that aren't ops (installed pkgs left as
+    is) are followed through the runtime dependencies of those pkgs, since
+    using them requires their own dependencies to be merged.
+
+    Cycles the resolver broke are broken the same way it did: an ordering
+    edge pointing at an op the linear plan places after its dependent is
+    kept in :obj:`edges`, but left out of :obj:`prerequisites`, and thus
+    :obj:`levels` and :obj:`critical_path`.
+
+    :ivar nodes: tuple of the ops, in plan order
+    :ivar edges: mapping of op to a tuple of (op depended on, kind) pairs;
+        kind is one of build, runtime or post
+    """
+
+    kinds = tuple(kind for kind, attr in dep_kinds)
+
+    def __init__(self, state, ops=None):
+        """
+        :param state: :obj:`pkgcore.resolver.state.plan_state` instance
+        :param ops: the ops to use as nodes; defaults to the non livefs
+            ops of the state
+        """
+        if ops is None:
+            ops = state.ops()
+        self.nodes = tuple(ops)
+        self._position = dict((op, idx) for idx, op in enumerate(self.nodes))
+        by_pkg = dict((id(op.pkg), op) for op in self.nodes
+                      if op.desc != 'remove')
+        self.edges = {}
+        for op in self.nodes:
+            deps = []
+            if op.desc != 'remove':
+                seen = set()
+                for kind, attr in dep_kinds:
+                    for dep in self._find_ops(state, by_pkg, op.pkg, attr):
+                        if dep is not op and (dep, kind) not in seen:
+                            seen.add((dep, kind))
+                            deps.append((dep, kind))
+            self.edges[op] = tuple(deps)
+
+    @staticmethod
+    def _find_ops(state, by_pkg, pkg, attr):
+        visited = set([id(pkg)])
+        queue = [(pkg, attr)]
+        while queue:
+            pkg, attr = queue.pop()
+            for atom in _dep_atoms(pkg, attr):
+                for match in state.match_atom(atom):
+                    if id(match) in visited:
+                        continue
+                    visited.add(id(match))
+                    op = by_pkg.get(id(match))
+                    if op is not None:
+                        yield op
+                    else:
+                        queue.append((match, "rdepends"))
+                        queue.append((match, "post_rdepends"))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def dependencies(self, op, kinds=None):
+        """Ops the given op depends on.
+
+        :param kinds: if not None, only return dependencies of these kinds
+        """
+        return tuple(dep for dep, kind in self.edges[op]
+                     if kinds is None or kind in kinds)
+
+    def dependents(self, op, kinds=None):
+        """Ops depending on the given op.
+
+        :param kinds: if not None, only return dependents of these kinds
+        """
+        return tuple(node for node in self.nodes
+                     for dep, kind in self.edges[node]
+                     if dep is op and (kinds is None or kind in kinds))
+
+    def prerequisites(self, op, kinds=ordering_kinds):
+        """Ops that have to be done before the given op.
+
+        Those are the ops it depends on via the ordering kinds (build and
+        runtime), minus those of broken cycles.
+
+        :param kinds: restrict to dependencies of these ordering kinds
+        """
+        pos = self._position[op]
+        return tuple(dep for dep, kind in self.edges[op]
+                     if kind in kinds and kind in ordering_kinds and
+                     self._position[dep] < pos)
+
+    def levels(self):
+        """Group the ops into topological levels.
+
+        Each op only depends on ops of prior levels, so the ops of a level
+        may run concurrently once the prior levels finished.
+
+        :return: list of tuples of ops, each in plan order
+        """
+        depth = {}
+        for op in self.nodes:
+            depth[op] = max([depth[dep] + 1 for dep in self.prerequisites(op)]
+                            or [0])
+        levels = [[] for x in xrange(max(depth.itervalues()) + 1
+                                      if depth else 0)]
+        for op in self.nodes:
+            levels[depth[op]].append(op)
+        return [tuple(level) for level in levels]
+
+    def critical_path(self, cost=None):
+        """Find the chain of dependent ops with the highest total cost.
+
+        That's the lower bound on the time needed to run the plan, however
+        many ops run concurrently.
+
+        :param cost: callable returning the cost of an op; defaults to one
+            per op
+        :return: (total cost, tuple of ops in order) pair
+        """
+        if cost is None:
+            cost = lambda op: 1
+        best = {}
+        for op in self.nodes:
+            prior = None
+            for dep in self.prerequisites(op):
+                if prior is None or best[dep][0] > best[prior][0]:
+                    prior = dep
+            if prior is None:
+                best[op] = (cost(op), None)
+            else:
+                best[op] = (best[prior][0] + cost(op), prior)
+        if not best:
+            return 0, ()
+        op = None
+        for node in self.nodes:
+            if op is None or best[node][0] > best[op][0]:
+                op = node
+        total = best[op][0]
+        path = []
+        while op is not None:
+            path.append(op)
+            op = best[op][1]
+        path.reverse()
+        return total, tuple(path)
+
+    def to_dict(self, cost=None):
+        """JSON serializable form of the graph.
+
+        Ops are identified by their position in the plan; every edge is a
+        (op, op it depends on, kind) list.
+
+        :param cost: passed to :obj:`critical_path`
+        """
+        levels = self.levels()
+        level_of = dict((op, idx) for idx, level in enumerate(levels)
+                        for op in level)
+        nodes = []
+        for op in self.nodes:
+            d = {"op": op.desc, "pkg": op.pkg.cpvstr,
+                 "repo": getattr(op.pkg.repo, "repo_id", None),
+                 "level": level_of[op]}
+            if op.desc == 'replace':
+                d["old_pkg"] = op.old_pkg.cpvstr
+            nodes.append(d)
+        pos = self._position
+        total, path = self.critical_path(cost)
+        return {
+            "nodes": nodes,
+            "edges": [[pos[op], pos[dep], kind] for op in self.nodes
+                      for dep, kind in self.edges[op]],
+            "levels": [[pos[op] for op in level] for level in levels],
+            "critical_path": {"cost": total, "ops": [pos[op] for op in path]},
+        }
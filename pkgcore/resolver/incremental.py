@@ -0,0 +1,213 @@
+# License: GPL2/BSD
+
+"""
+reuse of prior resolutions
+
+For each request whose last resolution merged nothing, the package keys
+its resolution involved are recorded along with a fingerprint of their
+candidates: version, repo, slot, USE, ebuild mtime and dependencies, the
+latter covering changes made via eclasses.  Only the candidates the
+resolver prefers over the pkg it chose are fingerprinted, in order, since
+the others are never considered while the chosen one still resolves.
+While those fingerprints stay unchanged, resolving the request again
+would just come to the same conclusion, so it's skipped; only the
+remaining requests are resolved.
+"""
+
+__all__ = ("resolution_state",)
+
+import json
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.iterables import caching_iter
+
+from pkgcore.ebuild.atom import atom as _atom
+from pkgcore.resolver.parallel import _dep_atoms, _pkg_ref
+
+demandload(
+    'errno',
+    'os',
+    'pkgcore.log:logger',
+)
+
+STATE_VERSION = 2
+
+
+def _pkg_fingerprint(pkg):
+    try:
+        mtime = pkg._mtime_
+    except (AttributeError, EnvironmentError):
+        mtime = None
+    return [pkg.cpvstr, getattr(pkg.repo, 'repo_id', None), pkg.repo.livefs,
+            pkg.slot, sorted(getattr(pkg, 'use', ())), mtime] + \
+        [str(getattr(pkg, attr))
+         for attr in ("depends", "rdepends", "post_rdepends")]
+
+
+class resolution_state(object):
+
+    """Record of requests that resolved to nothing to merge.
+
+    :ivar path: file the state is kept in
+    :ivar context: string describing the resolver configuration; a state
+        recorded for a different context is discarded
+    :ivar skipped: requests skipped by the last :obj:`add_atoms` call
+    """
+
+    def __init__(self, path, context):
+        self.path = path
+        self.context = context
+        self.skipped = ()
+        self._targets = self._read()
+        self._fingerprints = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}
+        except ValueError:
+            logger.warning("ignoring corrupted resolver state at %r", self.path)
+            return {}
+        if data.get('version') != STATE_VERSION or \
+                data.get('context') != self.context:
+            return {}
+        return data.get('targets', {})
+
+    def flush(self):
+        """Write the state back to disk."""
+        f = None
+        try:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            f = AtomicWriteFile(self.path)
+            json.dump({'version': STATE_VERSION, 'context': self.context,
+                       'targets': self._targets}, f)
+            f.close()
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            logger.warning("failed writing resolver state to %r: %s",
+                           self.path, e)
+
+    def _candidates(self, resolver, key):
+        # fingerprints of the candidates for a key in order of preference,
+        # only computed as far as they're looked at.
+        fps = self._fingerprints.get(key)
+        if fps is None:
+            fps = self._fingerprints[key] = caching_iter(
+                _pkg_fingerprint(pkg)
+                for pkg in resolver.default_dbs.itermatch(_atom(key)))
+        return fps
+
+    def fingerprint(self, resolver, key, chosen=()):
+        """Return the fingerprint of the candidates for a package key.
+
+        :param chosen: (cpvstr, repo_id, livefs) of the pkgs chosen for the
+            key; candidates less preferred than any of them are left out
+        :return: list of whether every candidate is included, and their
+            fingerprints
+        """
+        fps = []
+        for fp in self._candidates(resolver, key):
+            fps.append(fp)
+            chosen = [x for x in chosen if tuple(fp[:3]) != x]
+            if not chosen:
+                return [False, fps]
+        return [True, fps]
+
+    def is_clean(self, resolver, restrict):
+        """Is the recorded resolution of a request still valid?"""
+        keys = self._targets.get(str(restrict))
+        if keys is None:
+            return False
+        for key, (complete, fps) in keys.iteritems():
+            candidates = self._candidates(resolver, key)
+            try:
+                if any(candidates[idx] != fp for idx, fp in enumerate(fps)):
+                    return False
+            except IndexError:
+                return False
+            if complete:
+                try:
+                    candidates[len(fps)]
+                    return False
+                except IndexError:
+                    pass
+        return True
+
+    def add_atoms(self, resolver, restricts, finalize=False, add_atoms=None):
+        """Resolve requests, skipping those with a valid recorded resolution.
+
+        The recorded state is updated with the outcome, and written back to
+        disk if resolution succeeded.
+
+        :param resolver: :obj:`pkgcore.resolver.plan.merge_plan` instance
+        :param add_atoms: callable used to resolve requests, invoked with the
+            resolver, the requests and finalize; defaults to the resolver's
+            add_atoms method
+        :return: see :obj:`pkgcore.resolver.plan.merge_plan.add_atoms`
+        """
+        if add_atoms is None:
+            add_atoms = lambda resolver, restricts, finalize: \
+                resolver.add_atoms(restricts, finalize=finalize)
+        skipped, remaining = [], []
+        for restrict in restricts:
+            if self.is_clean(resolver, restrict):
+                skipped.append(restrict)
+            else:
+                remaining.append(restrict)
+
+        start = resolver.state.current_state
+        ret = add_atoms(resolver, remaining, finalize=finalize)
+        if not ret and skipped:
+            clean_keys = set()
+            for restrict in skipped:
+                clean_keys.update(self._targets[str(restrict)])
+            touched = set()
+            for op in resolver.state.iter_ops():
+                touched.add(op.pkg.key)
+                if op.desc == 'replace':
+                    touched.add(op.old_pkg.key)
+            if touched.intersection(clean_keys):
+                # the changes reach into the skipped requests' pkgs.
+                logger.debug("resolver state: changes affect skipped "
+                             "requests, resolving everything")
+                resolver.state.backtrack(start)
+                skipped, remaining = [], list(restricts)
+                ret = add_atoms(resolver, remaining, finalize=finalize)
+
+        self.skipped = tuple(skipped)
+        if not ret:
+            for restrict in remaining:
+                self._record(resolver, restrict)
+            self.flush()
+        return ret
+
+    def _record(self, resolver, restrict):
+        state = resolver.state
+        pkgs = {}
+        # key -> refs of the pkgs chosen for it
+        keys = {}
+        queue = list(state.match_atom(restrict))
+        while queue:
+            pkg = queue.pop()
+            if id(pkg) in pkgs:
+                continue
+            pkgs[id(pkg)] = pkg
+            keys.setdefault(pkg.key, set()).add(_pkg_ref(pkg))
+            for atom in _dep_atoms(pkg):
+                keys.setdefault(atom.key, set())
+                queue.extend(state.match_atom(atom))
+
+        if not pkgs or not all(pkg.repo.livefs for pkg in pkgs.itervalues()):
+            self._targets.pop(str(restrict), None)
+            return
+        self._targets[str(restrict)] = dict(
+            (key, self.fingerprint(resolver, key, chosen))
+            for key, chosen in keys.iteritems())
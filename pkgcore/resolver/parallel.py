@@ -0,0 +1,293 @@
+# License: GPL2/BSD
+
+"""
+concurrent resolution of independent requests
+
+Requests are grouped by an estimate of the packages their resolution
+pulls in; groups are resolved concurrently by forked copies of the
+resolver, and the ops they resolved to are then replayed by the original
+resolver, which only resolves groups conflicting with others itself.
+"""
+
+__all__ = ("partition_restricts", "add_atoms")
+
+from snakeoil.demandload import demandload
+from snakeoil.lists import iflatten_instance
+
+from pkgcore.ebuild.atom import atom as _atom
+from pkgcore.resolver import state
+from pkgcore.resolver.choice_point import choice_point
+from pkgcore.restrictions import packages
+
+demandload(
+    'multiprocessing',
+    'pkgcore.log:logger',
+)
+
+# resolver and groups worker processes inherit via fork.
+_worker_state = None
+
+
+def _dep_atoms(pkg):
+    for attr in ("depends", "rdepends", "post_rdepends"):
+        for atom in iflatten_instance(getattr(pkg, attr), _atom):
+            if not atom.blocks:
+                yield atom
+
+
+def partition_restricts(dbs, restricts, livefs_dbs=None):
+    """Group restrictions whose resolutions likely pull in the same pkgs.
+
+    The dependency closure of each restriction is estimated at the
+    package key level by following the dependencies of the preferred match
+    of each atom; dependencies already satisfied by an installed pkg aren't
+    followed, since they're expected to be left as is.
+
+    :param dbs: repo to match against
+    :param restricts: sequence of restrictions
+    :param livefs_dbs: repo of installed pkgs
+    :return: list of lists of restrictions, each in their original order
+    """
+    parents = range(len(restricts))
+
+    def find(idx):
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    owners = {}
+    for idx, restrict in enumerate(restricts):
+        queue = [restrict]
+        while queue:
+            restrict = queue.pop()
+            for pkg in dbs.itermatch(restrict):
+                break
+            else:
+                continue
+            owner = owners.get(pkg.key)
+            if owner is not None:
+                parents[find(owner)] = find(idx)
+                continue
+            owners[pkg.key] = idx
+            for atom in _dep_atoms(pkg):
+                if atom.key in owners:
+                    parents[find(owners[atom.key])] = find(idx)
+                elif livefs_dbs is None or not livefs_dbs.has_match(atom):
+                    queue.append(atom)
+
+    groups, l = {}, []
+    for idx, restrict in enumerate(restricts):
+        group = groups.get(find(idx))
+        if group is None:
+            group = groups[find(idx)] = []
+            l.append(group)
+        group.append(restrict)
+    return l
+
+
+def _pkg_ref(pkg):
+    return (pkg.cpvstr, getattr(pkg.repo, 'repo_id', None), pkg.repo.livefs)
+
+
+def _blocker_ref(blocker):
+    if isinstance(blocker, _atom):
+        return False, blocker
+    # virtual blockers are mangled not to block their provider; see
+    # merge_plan.generate_mangled_blocker.
+    if (isinstance(blocker, packages.AndRestriction) and
+            isinstance(blocker.restrictions[0], _atom)):
+        return True, blocker.restrictions[0]
+    return None
+
+
+def _resolve_group(idx):
+    resolver, groups = _worker_state
+    try:
+        start = resolver.state.current_state
+        if resolver.add_atoms(groups[idx]):
+            return None
+        pkgs = {}
+        for op in resolver.state.iter_ops(True):
+            if op.desc == 'replace':
+                pkgs.pop(id(op.old_pkg), None)
+            if op.desc == 'remove':
+                pkgs.pop(id(op.pkg), None)
+            else:
+                pkgs[id(op.pkg)] = op.pkg
+        # the ops the parent replays; hardrefs are the group's restrictions,
+        # and decrefs are redone by the removals and replacements causing
+        # them.
+        choice_ids = {}
+        ops = []
+        for op in resolver.state[start:]:
+            if isinstance(op, (state.add_op, state.replace_op)):
+                choice_ids[op.choices] = len(choice_ids)
+                ops.append((op.desc, _pkg_ref(op.pkg), op.force,
+                            choice_ids[op.choices]))
+            elif isinstance(op, state.remove_op):
+                ops.append((op.desc, _pkg_ref(op.pkg)))
+            elif isinstance(op, state.incref_forward_block_op):
+                blocker = _blocker_ref(op.blocker)
+                if blocker is None or op.choices not in choice_ids:
+                    logger.debug("can't replay %s", op)
+                    return None
+                ops.append(('block', choice_ids[op.choices], blocker, op.key))
+        return ([_pkg_ref(pkg) + (pkg.key, pkg.slot)
+                 for pkg in pkgs.itervalues()], ops)
+    except Exception:
+        logger.exception("failed resolving %s", ', '.join(map(str, groups[idx])))
+        return None
+
+
+def _find_pkg(resolver, ref):
+    restrict = _atom('=' + ref[0])
+    for repo in resolver.all_raw_dbs:
+        for pkg in repo.itermatch(restrict):
+            if _pkg_ref(pkg) == ref:
+                return pkg
+    return None
+
+
+def _slotted(plan, ref):
+    key = _atom('=' + ref[0]).key
+    for pkg in plan.state.slot_dict.get(key, ()):
+        if _pkg_ref(pkg) == ref:
+            return pkg
+    return None
+
+
+def _replay(resolver, restricts, ops):
+    """Apply the ops a worker resolved a group of restrictions with.
+
+    :return: True if they applied cleanly; else the plan is left as it was
+        and False is returned
+    """
+    plan = resolver.state
+    start = plan.current_state
+    choices, added, blockers = {}, [], []
+    ok = False
+    try:
+        for restrict in restricts:
+            state.add_hardref_op(restrict).apply(plan)
+        for op in ops:
+            if op[0] == 'block':
+                c = choices[op[1]]
+                if c is None:
+                    # the pkg was inserted by another group, with its blockers.
+                    continue
+                mangled, blocker = op[2]
+                if mangled:
+                    blocker = resolver.generate_mangled_blocker(c, blocker)
+                # whether it hits anything is checked once the group's in.
+                plan.add_blocker(c, blocker, key=op[3])
+                blockers.append((blocker, op[3]))
+                continue
+            pkg = _slotted(plan, op[1])
+            if op[0] == 'remove':
+                if pkg is None:
+                    return False
+                state.remove_op(plan.pkg_choices[pkg], pkg).apply(plan)
+                continue
+            if pkg is not None:
+                # other groups pulled in the same pkg.
+                choices[op[3]] = None
+                continue
+            pkg = _find_pkg(resolver, op[1])
+            if pkg is None:
+                return False
+            if (op[0] == 'add' and
+                    plan.state.get_conflicting_slot(pkg) is not None):
+                # even forced, an add can't displace what another group
+                # chose.
+                return False
+            c = choices[op[3]] = choice_point(pkg.versioned_atom, [pkg])
+            kls = state.add_op if op[0] == 'add' else state.replace_op
+            if kls(c, pkg, force=op[2]).apply(plan):
+                return False
+            added.append(pkg)
+        # blockers of other groups may hit pkgs of this one, and vice versa.
+        ok = not (any(plan.state.check_limiters(pkg) for pkg in added) or
+                  any(plan.state.find_atom_matches(blocker, key=key)
+                      for blocker, key in blockers))
+        return ok
+    finally:
+        if not ok:
+            plan.backtrack(start)
+
+
+def _conflicting(choices):
+    """Find the groups that failed, or chose differently for a slot.
+
+    :param choices: per group, None if it failed resolving, else a sequence
+        of (cpvstr, repo_id, livefs, key, slot) of the pkgs it chose
+    :return: set of the indexes of the conflicting groups
+    """
+    chosen_slots = {}
+    conflicting = set()
+    for idx, pkgs in enumerate(choices):
+        if pkgs is None:
+            conflicting.add(idx)
+            continue
+        for cpvstr, repo_id, livefs, key, slot in pkgs:
+            other = chosen_slots.setdefault(
+                (key, slot), (cpvstr, repo_id, livefs, idx))
+            if other[:3] != (cpvstr, repo_id, livefs):
+                conflicting.update((idx, other[3]))
+    return conflicting
+
+
+def add_atoms(resolver, restricts, jobs, finalize=False):
+    """Resolve restrictions, independent groups of them concurrently.
+
+    Groups are resolved by forked copies of the resolver, whose ops are
+    then replayed by the resolver itself; if two groups chose different pkgs
+    for the same slot, or a group failed resolving or replaying, those
+    groups are resolved serially by the resolver instead.  The result and
+    the resulting resolver state match those of
+    :obj:`pkgcore.resolver.plan.merge_plan.add_atoms`.
+
+    :param resolver: :obj:`pkgcore.resolver.plan.merge_plan` instance
+    :param restricts: sequence of restrictions to resolve
+    :param jobs: maximal number of processes to resolve in
+    """
+    global _worker_state
+    if jobs < 2:
+        # don't pay for partitioning what's resolved serially anyway.
+        return resolver.add_atoms(restricts, finalize=finalize)
+    groups = partition_restricts(resolver.default_dbs, restricts,
+                                 resolver.livefs_dbs)
+    if len(groups) < 2:
+        return resolver.add_atoms(restricts, finalize=finalize)
+
+    if resolver.prefetcher is not None:
+        # locks held by its threads would stay held in the workers.
+        resolver.prefetcher.suspend()
+    _worker_state = (resolver, groups)
+    pool = multiprocessing.Pool(min(jobs, len(groups)))
+    try:
+        results = pool.map(_resolve_group, range(len(groups)))
+    finally:
+        pool.terminate()
+        _worker_state = None
+
+    conflicting = _conflicting([x and x[0] for x in results])
+    start = resolver.state.current_state
+    for idx, result in enumerate(results):
+        if idx not in conflicting and not _replay(
+                resolver, groups[idx], result[1]):
+            conflicting.add(idx)
+    ret = ()
+    for idx in sorted(conflicting):
+        logger.debug("resolving %s serially",
+                     ', '.join(map(str, groups[idx])))
+        ret = resolver.add_atoms(groups[idx])
+        if ret:
+            break
+    if ret:
+        # the choices made for the other groups may be what's in the way.
+        resolver.state.backtrack(start)
+        return resolver.add_atoms(restricts, finalize=finalize)
+    if finalize:
+        resolver.process_finalize()
+    return ret
@@ -3,8 +3,142 @@
 
 __all__ = ("PigeonHoledSlots",)
 
+from itertools import chain
+
+from pkgcore.ebuild.cpv import ver_cmp
 from pkgcore.restrictions import restriction
 
+
+def _bisect(bounds, version, revision, right=False):
+    """Return the index of the first bound not lower than a version.
+
+    If right is True, return the index of the first bound higher than it.
+    """
+    lo, hi = 0, len(bounds)
+    threshold = 1 if right else 0
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ver_cmp(bounds[mid][0], bounds[mid][1], version, revision) < threshold:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class _limiter_index(object):
+
+    """Limiters of a single key, indexed by the versions they restrict.
+
+    Atoms with a version operator are filed under their version, so only
+    those with a version range that could include a given obj have to be
+    matched against it; anything else (unversioned atoms, globs, arbitrary
+    restrictions) is always matched.  Lookups return limiters in the order
+    they were added.
+    """
+
+    __slots__ = ("_unindexed", "_exact", "_approx", "_upper", "_lower",
+                 "_counts", "_seq")
+
+    def __init__(self):
+        # entries are (seq, limiter) pairs, seq being the insertion order.
+        self._unindexed = []
+        # (version, revision, seq, limiter) entries sorted by version, as
+        # ver_cmp orders them; for '=', for '~' (revision always None), for
+        # '<', '<=' and for '>', '>=' respectively.
+        self._exact = []
+        self._approx = []
+        self._upper = []
+        self._lower = []
+        # limiter -> number of times it's present
+        self._counts = {}
+        self._seq = 0
+
+    def _bucket(self, limiter):
+        """Return the (list, bound) a limiter is filed under."""
+        op = getattr(limiter, "op", None)
+        if not op or op == "=*" or getattr(limiter, "negate_vers", False):
+            return self._unindexed, None
+        if op == "=":
+            return self._exact, (limiter.version, limiter.revision)
+        if op == "~":
+            return self._approx, (limiter.version, None)
+        if op in ("<", "<="):
+            return self._upper, (limiter.version, limiter.revision)
+        return self._lower, (limiter.version, limiter.revision)
+
+    def add(self, limiter):
+        seq = self._seq
+        self._seq += 1
+        self._counts[limiter] = self._counts.get(limiter, 0) + 1
+        l, bound = self._bucket(limiter)
+        if bound is None:
+            l.append((seq, limiter))
+        else:
+            l.insert(_bisect(l, *bound, right=True),
+                     bound + (seq, limiter))
+
+    def remove(self, limiter):
+        """Remove every occurrence of a limiter."""
+        l, bound = self._bucket(limiter)
+        if bound is None:
+            start, end = 0, len(l)
+        else:
+            start, end = _bisect(l, *bound), _bisect(l, *bound, right=True)
+        kept = [x for x in l[start:end] if x[-1] is not limiter]
+        removed = end - start - len(kept)
+        if not removed:
+            raise KeyError("obj %s isn't slotted" % limiter)
+        l[start:end] = kept
+        count = self._counts[limiter] - removed
+        if count:
+            self._counts[limiter] = count
+        else:
+            del self._counts[limiter]
+
+    def _candidates(self, obj):
+        version = getattr(obj, "version", None)
+        if version is None:
+            return self._entries()
+        revision = obj.revision
+        exact = self._exact
+        approx = self._approx
+        upper = self._upper
+        lower = self._lower
+        return chain(
+            self._unindexed,
+            # versions equal to obj's, however they're spelled
+            (x[2:] for x in exact[_bisect(exact, version, revision):
+                                  _bisect(exact, version, revision, True)]),
+            (x[2:] for x in approx[_bisect(approx, version, None):
+                                   _bisect(approx, version, None, True)]),
+            # bounds at or above obj's version
+            (x[2:] for x in upper[_bisect(upper, version, revision):]),
+            # bounds at or below obj's version
+            (x[2:] for x in lower[:_bisect(lower, version, revision, True)]),
+        )
+
+    def _entries(self):
+        return chain(self._unindexed,
+                     (x[2:] for x in self._exact),
+                     (x[2:] for x in self._approx),
+                     (x[2:] for x in self._upper),
+                     (x[2:] for x in self._lower))
+
+    def match(self, obj):
+        """Return the limiters matching obj, in the order they were added."""
+        return [x[1] for x in sorted(self._candidates(obj))
+                if x[1].match(obj)]
+
+    def __iter__(self):
+        return (x[1] for x in sorted(self._entries()))
+
+    def __contains__(self, limiter):
+        return limiter in self._counts
+
+    def __nonzero__(self):
+        return bool(self._counts)
+
+
 # lil too getter/setter like for my tastes...
 
 
@@ -54,13 +188,18 @@ class PigeonHoledSlots(object):
 
         if key is None:
             key = atom.key
-        self.limiters.setdefault(key, []).append(atom)
+        index = self.limiters.get(key)
+        if index is None:
+            index = self.limiters[key] = _limiter_index()
+        index.add(atom)
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the psased in obj"""
-        key = obj.key
-        return [x for x in self.limiters.get(key, ()) if x.match(obj)]
+        index = self.limiters.get(obj.key)
+        if index is None:
+            return []
+        return index.match(obj)
 
     def remove_slotting(self, obj):
         key = obj.key
@@ -76,13 +215,10 @@ class PigeonHoledSlots(object):
     def remove_limiter(self, atom, key=None):
         if key is None:
             key = atom.key
-        l = [x for x in self.limiters[key] if x is not atom]
-        if len(l) == len(self.limiters[key]):
-            raise KeyError("obj %s isn't slotted" % atom)
-        if not l:
+        index = self.limiters[key]
+        index.remove(atom)
+        if not index:
             del self.limiters[key]
-        else:
-            self.limiters[key] = l
 
     def __contains__(self, obj):
         if isinstance(obj, restriction.base):
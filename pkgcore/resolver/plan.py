@@ -81,6 +81,27 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     return l
 
 
+class _shared_matches(caching_iter):
+
+    """caching_iter that can be iterated over by several consumers at once.
+
+    caching_iter's own iterators pull from the underlying iterable
+    directly, so interleaving them skips pkgs; these go by index.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        idx = 0
+        while True:
+            try:
+                pkg = self[idx]
+            except IndexError:
+                return
+            yield pkg
+            idx += 1
+
+
 class MutableContainmentRestriction(values.base):
 
     __slots__ = ('_blacklist', 'match')
@@ -231,7 +252,8 @@ class merge_plan(object):
                  global_strategy=None,
                  depset_reorder_strategy=None,
                  process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None,
+                 profile=None, prefetcher=None):
 
         if debug_handle is None:
             debug_handle = sys.stdout
@@ -263,6 +285,11 @@ class merge_plan(object):
                 for x in self.all_raw_dbs if x.livefs])
 
         self.insoluble = set()
+        self._unfiltered = None
+        # memoized matches for _viable; see _viable_matches.
+        self._viable_memo = {}
+        self._viable_memo_generation = None
+        self._viable_memo_hits = self._viable_memo_misses = 0
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
@@ -274,6 +301,11 @@ class merge_plan(object):
                 self._rec_add_atom)
             self._debugging_depth = 0
             self._debugging_drop_cycles = False
+        self.profile = profile
+        if profile is not None:
+            profile.attach(self)
+        # see pkgcore.resolver.prefetch.metadata_prefetcher
+        self.prefetcher = prefetcher
 
     @property
     def forced_restrictions(self):
@@ -322,6 +354,11 @@ class merge_plan(object):
         stack.add_event(("viable", viable, pre_solved, atom, msg))
 
     def load_vdb_state(self):
+        for repo in self.all_raw_dbs:
+            # every installed pkg's metadata is about to be accessed;
+            # vdbs supporting it load it all in one go.
+            if repo.livefs and hasattr(repo, 'preload_metadata'):
+                repo.preload_metadata()
         for pkg in self.livefs_dbs:
             self._dprint("inserting %s", (pkg,), "vdb")
             ret = self.add_atom(pkg.versioned_atom)
@@ -350,6 +387,22 @@ class merge_plan(object):
             self.process_finalize()
         return ()
 
+    def filter_dbs(self, restriction):
+        """Limit the pkgs chosen from default_dbs to those matching a restriction.
+
+        :param restriction: restriction pkgs must match, or None to lift a
+            prior limit
+        """
+        if self._unfiltered is not None:
+            self.default_dbs, self.insoluble = self._unfiltered
+            self._unfiltered = None
+        if restriction is not None:
+            self._unfiltered = (self.default_dbs, self.insoluble)
+            self.default_dbs = visibility.filterTree(
+                self.default_dbs, restriction, sentinel_val=True)
+            # atoms insoluble within the filtered dbs needn't be otherwise.
+            self.insoluble = set(self.insoluble)
+
     def process_finalize(self):
         pass
 
@@ -539,7 +592,7 @@ class merge_plan(object):
         :param drop_cycles: boolean controlling whether to drop dep cycles
         :param limit_to_vdb: boolean controlling considering pkgs only from the vdb
         :return: 3 possible; None (not viable), True (presolved),
-          :obj:`caching_iter` (not solved, but viable), :obj:`choice_point`
+          tuple of matches (not solved, but viable), :obj:`choice_point`
         """
         choices = ret = None
         if atom in self.insoluble:
@@ -551,8 +604,10 @@ class merge_plan(object):
                 ret = ((True,), {"pre_solved":True})
             else:
                 # not in the plan thus far.
-                matches = caching_iter(dbs.itermatch(atom))
+                matches = self._viable_matches(atom, dbs, limit_to_vdb)
                 if matches:
+                    if self.prefetcher is not None:
+                        self.prefetcher.queue(matches)
                     choices = choice_point(atom, matches)
                     # ignore what dropped out, at this juncture we don't care.
                     choices.reduce_atoms(self.insoluble)
@@ -580,6 +635,36 @@ class merge_plan(object):
             return None
         return choices, matches
 
+    def _viable_matches(self, atom, dbs, limit_to_vdb):
+        """Return the matches of an atom within dbs, memoized.
+
+        Matches against the vdb depend on the plan's vdb filter, thus those
+        are keyed on the plan state generation, and dropped as soon as the
+        generation moves on; other dbs don't depend on the plan state.
+        """
+        generation = None
+        if limit_to_vdb:
+            generation = self.state.generation
+        key = (atom, dbs, limit_to_vdb, generation)
+        matches = self._viable_memo.get(key)
+        if matches is not None:
+            self._viable_memo_hits += 1
+            return matches
+        self._viable_memo_misses += 1
+        if limit_to_vdb and generation != self._viable_memo_generation:
+            # drop vdb matches from prior generations.
+            for stale in [x for x in self._viable_memo if x[3] is not None]:
+                del self._viable_memo[stale]
+            self._viable_memo_generation = generation
+        # matched lazily, as choice_points mostly only get to the first pkg.
+        matches = self._viable_memo[key] = _shared_matches(dbs.itermatch(atom))
+        return matches
+
+    @property
+    def viable_memo_stats(self):
+        """Return a (hits, misses) tuple for the viability memo."""
+        return self._viable_memo_hits, self._viable_memo_misses
+
     def check_for_cycles(self, stack, cur_frame):
         """Check the current stack for cyclical issues.
 
@@ -814,6 +899,9 @@ class merge_plan(object):
     def free_caches(self):
         for repo in self.all_raw_dbs:
             repo.clear()
+        self._viable_memo.clear()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
 
     # selection strategies for atom matches
 
@@ -0,0 +1,171 @@
+# License: GPL2/BSD
+
+"""
+background metadata loading for the resolver
+
+Pkgs load their metadata on first attribute access, which on cold caches
+or network mounted trees leaves resolution waiting on I/O one pkg at a
+time.  The resolver hands every choice point's matches to a
+:obj:`metadata_prefetcher`, whose threads load their metadata along with
+that of every version of their direct dependencies, so by the time the
+resolver descends into them it mostly finds warm pkgs.
+"""
+
+__all__ = ("metadata_prefetcher",)
+
+import Queue
+import os
+import threading
+
+from snakeoil.demandload import demandload
+from snakeoil.lists import iflatten_instance
+
+from pkgcore.ebuild.atom import atom as _atom
+from pkgcore.util import repo_utils
+
+demandload(
+    'pkgcore.log:logger',
+)
+
+
+def _raw_pkg(pkg):
+    while getattr(pkg, '_raw_pkg', None) is not None:
+        pkg = pkg._raw_pkg
+    return pkg
+
+
+def _dep_keys(pkg):
+    keys = set()
+    for attr in ("depends", "rdepends", "post_rdepends"):
+        for atom in iflatten_instance(getattr(pkg, attr), _atom):
+            if not atom.blocks:
+                keys.add(atom.key)
+    return keys
+
+
+class metadata_prefetcher(object):
+
+    """Load the metadata of pkgs the resolver is likely to need in threads.
+
+    Pass an instance as the prefetcher keyword to
+    :obj:`pkgcore.resolver.plan.merge_plan`.  Repositories cache pkg
+    instances weakly, so the prefetcher holds on to the pkgs it loaded until
+    :obj:`shutdown` is called.
+
+    Failures are ignored; the resolver hits them again when it accesses the
+    pkg itself, and handles them as it would without prefetching.
+    """
+
+    def __init__(self, repos, threads=4):
+        """
+        :param repos: repositories dependencies are looked up in; they're
+            unwrapped down to the raw repositories
+        :param threads: number of loading threads
+        """
+        self.repos = repo_utils.get_raw_repos(list(repos))
+        self.threads = max(threads, 1)
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._pid = None
+        self._pkgs = {}
+        self._keys = set()
+        self._stopped = False
+        self.loaded = 0
+
+    def queue(self, pkgs):
+        """Queue pkgs for loading, along with their direct dependencies.
+
+        :param pkgs: iterable of pkgs; they may be configured pkgs, in which
+            case the raw pkgs they wrap are loaded
+        """
+        if self._stopped:
+            return
+        if self._pid != os.getpid():
+            # no threads yet, or they didn't survive forking.
+            self._start()
+        for pkg in pkgs:
+            self._add(_raw_pkg(pkg), True)
+
+    def _add(self, pkg, follow):
+        key = (id(pkg.repo), pkg.cpvstr)
+        with self._lock:
+            if key in self._pkgs:
+                return
+            self._pkgs[key] = pkg
+        self._queue.put((pkg, follow))
+
+    def _start(self):
+        # locks held by threads at fork time would never be released.
+        self._pid = os.getpid()
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for x in xrange(self.threads):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None or self._stopped:
+                return
+            pkg, follow = item
+            try:
+                pkg.data
+                with self._lock:
+                    self.loaded += 1
+                if follow:
+                    self._follow(pkg)
+            except Exception as e:
+                logger.debug("prefetching metadata of %s failed: %s", pkg, e)
+            finally:
+                self._queue.task_done()
+
+    def _follow(self, pkg):
+        keys = _dep_keys(pkg)
+        with self._lock:
+            keys.difference_update(self._keys)
+            self._keys.update(keys)
+        for key in sorted(keys):
+            restrict = _atom(key)
+            for repo in self.repos:
+                for dep in repo.itermatch(restrict):
+                    if self._stopped:
+                        return
+                    self._add(dep, False)
+
+    def wait(self):
+        """Block until every queued pkg is loaded."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def suspend(self):
+        """Stop the threads once every queued pkg is loaded.
+
+        Meant for forking, which locks held by the threads wouldn't
+        survive; queueing more pkgs starts them again.
+        """
+        self.wait()
+        self._join()
+        self._pid = None
+
+    def _join(self):
+        if self._pid == os.getpid():
+            for t in self._workers:
+                self._queue.put(None)
+            for t in self._workers:
+                t.join()
+        self._workers = []
+
+    def shutdown(self):
+        """Stop the threads and release the pkgs held.
+
+        Queued pkgs not yet loaded are dropped.
+        """
+        self._stopped = True
+        self._join()
+        self._pkgs.clear()
+        self._keys.clear()
@@ -0,0 +1,142 @@
+# License: GPL2/BSD
+
+"""
+resolver instrumentation
+
+Unlike the debug output of :obj:`pkgcore.resolver.plan.merge_plan`, this
+only keeps counters and timings, so it's usable for real world resolves.
+"""
+
+__all__ = ("resolver_profile",)
+
+import json
+from time import time
+
+from snakeoil.currying import partial
+
+
+class resolver_profile(object):
+
+    """Collect statistics on a merge_plan's resolution.
+
+    Pass an instance as the profile keyword to
+    :obj:`pkgcore.resolver.plan.merge_plan`; it accumulates across every
+    resolution the plan does.
+
+    :ivar atoms: mapping of atom string to a [frames pushed, self time] list
+    :ivar timings: mapping of instrumented method name to a
+        [calls, time] list; time only counts the outermost of nested calls
+    :ivar collapsed: mapping of ';' joined atom stacks to their self time
+    """
+
+    timed_methods = ("_viable", "process_dependencies", "insert_blockers",
+                     "check_for_cycles")
+
+    def __init__(self, timer=time):
+        self.timer = timer
+        self.atoms = {}
+        self.timings = dict((name, [0, 0.0]) for name in self.timed_methods)
+        self.collapsed = {}
+        self.frames = 0
+        self.backtracks = 0
+        self.choice_iterations = 0
+        self.max_depth = 0
+        self.total_time = 0.0
+        self._active = dict.fromkeys(self.timed_methods, False)
+        self._path = []
+        self._child_times = []
+
+    def attach(self, resolver):
+        """Instrument a merge_plan instance."""
+        for name in self.timed_methods:
+            setattr(resolver, name, self._timed(name, getattr(resolver, name)))
+        resolver._rec_add_atom = partial(
+            self._profile_rec_add_atom, resolver._rec_add_atom)
+        resolver.notify_trying_choice = partial(
+            self._count_choice, resolver.notify_trying_choice)
+        resolver.state.backtrack = partial(
+            self._count_backtrack, resolver.state, resolver.state.backtrack)
+
+    def _timed(self, name, func):
+        stats = self.timings[name]
+        active = self._active
+        timer = self.timer
+
+        def f(*args, **kwds):
+            stats[0] += 1
+            if active[name]:
+                return func(*args, **kwds)
+            active[name] = True
+            start = timer()
+            try:
+                return func(*args, **kwds)
+            finally:
+                stats[1] += timer() - start
+                active[name] = False
+        return f
+
+    def _profile_rec_add_atom(self, func, atom, stack, dbs, **kwds):
+        key = str(atom)
+        stats = self.atoms.get(key)
+        if stats is None:
+            stats = self.atoms[key] = [0, 0.0]
+        stats[0] += 1
+        self.frames += 1
+        # _viable pushes the frame for this atom.
+        self.max_depth = max(self.max_depth, len(stack) + 1)
+        self._path.append(key)
+        self._child_times.append(0.0)
+        start = self.timer()
+        try:
+            return func(atom, stack, dbs, **kwds)
+        finally:
+            elapsed = self.timer() - start
+            own = elapsed - self._child_times.pop()
+            if self._child_times:
+                self._child_times[-1] += elapsed
+            else:
+                self.total_time += elapsed
+            stats[1] += own
+            path = ";".join(self._path)
+            self.collapsed[path] = self.collapsed.get(path, 0.0) + own
+            self._path.pop()
+
+    def _count_choice(self, func, *args, **kwds):
+        self.choice_iterations += 1
+        return func(*args, **kwds)
+
+    def _count_backtrack(self, plan_state, func, state_pos):
+        if state_pos < len(plan_state.plan):
+            self.backtracks += 1
+        return func(state_pos)
+
+    def to_dict(self):
+        """Return the collected statistics as a JSON serializable dict."""
+        return {
+            "total_time": self.total_time,
+            "frames": self.frames,
+            "backtracks": self.backtracks,
+            "choice_iterations": self.choice_iterations,
+            "max_depth": self.max_depth,
+            "timings": dict(
+                (name, {"calls": calls, "time": t})
+                for name, (calls, t) in self.timings.iteritems()),
+            "atoms": dict(
+                (atom, {"frames": frames, "self_time": t})
+                for atom, (frames, t) in self.atoms.iteritems()),
+        }
+
+    def write_json(self, handle):
+        json.dump(self.to_dict(), handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+    def write_collapsed(self, handle):
+        """Write atom stacks in the collapsed format flamegraph tools use.
+
+        Each line holds a ';' joined stack followed by its self time in
+        microseconds.
+        """
+        for path, t in sorted(self.collapsed.iteritems()):
+            t = int(round(t * 1000000))
+            if t:
+                handle.write("%s %i\n" % (path, t))
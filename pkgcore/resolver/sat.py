@@ -0,0 +1,472 @@
+# License: GPL2/BSD
+
+"""
+clause learning resolver
+
+:obj:`sat_merge_plan` picks the packages to merge by encoding the
+requests, the dependencies of every candidate package, slot pigeonholes
+and blockers as boolean clauses and handing them to :obj:`solver`, a
+conflict driven clause learning SAT solver.  Instead of chronologically
+backtracking over every choice above a conflict, it learns the cause of
+each conflict and jumps straight back to the choice responsible for it.
+
+The ordering of the chosen packages is still done by
+:obj:`pkgcore.resolver.plan.merge_plan`, restricted to the chosen packages,
+so the resulting plan state and ops are the same as for the chronological
+resolver.
+"""
+
+__all__ = ("solver", "sat_merge_plan")
+
+from collections import deque
+
+from pkgcore.resolver import plan
+from pkgcore.resolver.choice_point import choice_point
+from pkgcore.restrictions import values
+
+
+class solver(object):
+
+    """Conflict driven clause learning SAT solver.
+
+    Variables are positive integers allocated via :obj:`new_var`; literals
+    are variables, negated for their false phase.  Decisions are left to a
+    callable passed to :obj:`solve`, which allows the caller to steer the
+    search towards preferred solutions.
+
+    :ivar ok: False if the clauses added thus far are unsatisfiable
+    :ivar decisions: number of decisions made
+    :ivar conflicts: number of conflicts hit
+    """
+
+    def __init__(self):
+        self.ok = True
+        self.decisions = 0
+        self.conflicts = 0
+        # var -> True/False/None; var 0 is unused.
+        self._assigns = [None]
+        self._levels = [0]
+        self._reasons = [None]
+        self._watches = {}
+        self.trail = []
+        self._trail_lim = []
+        self._qhead = 0
+
+    @property
+    def decision_level(self):
+        return len(self._trail_lim)
+
+    def new_var(self):
+        self._assigns.append(None)
+        self._levels.append(0)
+        self._reasons.append(None)
+        return len(self._assigns) - 1
+
+    def value(self, lit):
+        """Return True/False if a literal is assigned, else None."""
+        val = self._assigns[abs(lit)]
+        if val is None or lit > 0:
+            return val
+        return not val
+
+    def add_clause(self, lits):
+        """Add a clause; only valid prior to solving.
+
+        :param lits: iterable of literals, one of which must be true
+        :return: False if the clauses are now known to be unsatisfiable
+        """
+        if not self.ok:
+            return False
+        clause = []
+        for lit in lits:
+            if -lit in clause:
+                # tautology.
+                return True
+            val = self.value(lit)
+            if val:
+                return True
+            elif val is None and lit not in clause:
+                clause.append(lit)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self._watch(clause)
+        return self.ok
+
+    def solve(self, decide):
+        """Search for an assignment satisfying every clause.
+
+        :param decide: callable invoked with the solver, returning the next
+            literal to assign true, or None if the current assignment
+            satisfies the caller
+        :return: True if satisfiable, False if not
+        """
+        if not self.ok:
+            return False
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                if not self._trail_lim:
+                    self.ok = False
+                    return False
+                learnt, level = self._analyze(conflict)
+                self._cancel_until(level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self._watch(learnt)
+                    self._enqueue(learnt[0], learnt)
+                continue
+            lit = decide(self)
+            if lit is None:
+                return True
+            self.decisions += 1
+            self._trail_lim.append(len(self.trail))
+            self._enqueue(lit, None)
+
+    def _watch(self, clause):
+        watches = self._watches
+        for lit in clause[:2]:
+            l = watches.get(lit)
+            if l is None:
+                watches[lit] = [clause]
+            else:
+                l.append(clause)
+
+    def _enqueue(self, lit, reason):
+        var = abs(lit)
+        self._assigns[var] = lit > 0
+        self._levels[var] = len(self._trail_lim)
+        self._reasons[var] = reason
+        self.trail.append(lit)
+
+    def _propagate(self):
+        """Propagate pending assignments, returning a conflicting clause."""
+        value = self.value
+        watches = self._watches
+        trail = self.trail
+        while self._qhead < len(trail):
+            false_lit = -trail[self._qhead]
+            self._qhead += 1
+            watchers = watches.get(false_lit)
+            if not watchers:
+                continue
+            kept = []
+            for idx, clause in enumerate(watchers):
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                if value(first):
+                    kept.append(clause)
+                    continue
+                for pos in xrange(2, len(clause)):
+                    if value(clause[pos]) is not False:
+                        clause[1], clause[pos] = clause[pos], clause[1]
+                        l = watches.get(clause[1])
+                        if l is None:
+                            watches[clause[1]] = [clause]
+                        else:
+                            l.append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if value(first) is False:
+                        kept.extend(watchers[idx + 1:])
+                        watches[false_lit] = kept
+                        self._qhead = len(trail)
+                        return clause
+                    self._enqueue(first, clause)
+            watches[false_lit] = kept
+        return None
+
+    def _analyze(self, conflict):
+        """Derive the first UIP clause for a conflict.
+
+        :return: (learnt clause, level to backjump to); the first literal of
+            the clause is the one asserted after backjumping
+        """
+        levels = self._levels
+        trail = self.trail
+        current = len(self._trail_lim)
+        seen = set()
+        learnt = [None]
+        pending = 0
+        lit = None
+        idx = len(trail) - 1
+        clause = conflict
+        while True:
+            for q in clause:
+                var = abs(q)
+                if q == lit or var in seen or not levels[var]:
+                    continue
+                seen.add(var)
+                if levels[var] == current:
+                    pending += 1
+                else:
+                    learnt.append(q)
+            while abs(trail[idx]) not in seen:
+                idx -= 1
+            lit = trail[idx]
+            idx -= 1
+            pending -= 1
+            if not pending:
+                break
+            clause = self._reasons[abs(lit)]
+        learnt[0] = -lit
+        if len(learnt) == 1:
+            return learnt, 0
+        # the highest level literal is watched alongside the asserting one.
+        pos = max(xrange(1, len(learnt)), key=lambda i: levels[abs(learnt[i])])
+        learnt[1], learnt[pos] = learnt[pos], learnt[1]
+        return learnt, levels[abs(learnt[1])]
+
+    def _cancel_until(self, level):
+        if len(self._trail_lim) <= level:
+            return
+        trail = self.trail
+        start = self._trail_lim[level]
+        for lit in trail[start:]:
+            var = abs(lit)
+            self._assigns[var] = None
+            self._reasons[var] = None
+        del trail[start:]
+        del self._trail_lim[level:]
+        self._qhead = len(trail)
+
+
+class _SolutionRestriction(values.base):
+
+    __slots__ = ('_chosen', 'match')
+
+    def __init__(self, chosen):
+        sf = object.__setattr__
+        sf(self, '_chosen', chosen)
+        sf(self, 'match', lambda pkg: (pkg.repo, pkg.cpvstr) in chosen)
+
+
+class _encoding(object):
+
+    """Clauses and decision heuristic for a set of requests."""
+
+    def __init__(self, resolver, restricts):
+        self.resolver = resolver
+        self.solver = s = solver()
+        self.root = s.new_var()
+        s.add_clause([self.root])
+        self.pkgs = {}
+        self.pkg_vars = {}
+        self.slots = {}
+        # var -> list of alternatives, one of which must be chosen if the
+        # var is; alternatives are ordered by preference.
+        self.requirements = {self.root: []}
+        # installed pkgs, or their replacements; these are only decided
+        # once nothing else is open, so pkgs are upgraded if anything
+        # prefers it.
+        self.installed = []
+        self._matches = {}
+        self._queue = deque()
+        self._expanded = set()
+        self._saved = []
+        self.unmatched = []
+
+        for restrict in restricts:
+            alternatives = self.match(restrict)
+            if not alternatives:
+                self.unmatched.append(restrict)
+            self.require(self.root, alternatives)
+        self._expand()
+        self._add_slot_clauses()
+
+    def match(self, restrict, expand=True):
+        l = self._matches.get(restrict)
+        if l is None:
+            l = self._matches[restrict] = []
+            for pkg in self.resolver._viable_matches(
+                    restrict, self.resolver.default_dbs, False):
+                var = self._var(pkg)
+                if var not in l:
+                    l.append(var)
+        if expand:
+            self._queue.extend(l)
+        return l
+
+    def _var(self, pkg):
+        key = (pkg.repo, pkg.cpvstr)
+        var = self.pkg_vars.get(key)
+        if var is None:
+            var = self.pkg_vars[key] = self.solver.new_var()
+            self.pkgs[var] = pkg
+            self.slots.setdefault((pkg.key, pkg.slot), []).append(var)
+            if pkg.repo.livefs:
+                # installed pkgs stay unless replaced.
+                self._queue.append(var)
+        return var
+
+    def require(self, var, alternatives):
+        self.solver.add_clause([-var] + alternatives)
+        if alternatives:
+            self.requirements.setdefault(var, []).append(alternatives)
+
+    def _expand(self):
+        resolver = self.resolver
+        queue = self._queue
+        while queue:
+            var = queue.popleft()
+            if var in self._expanded:
+                continue
+            self._expanded.add(var)
+            pkg = self.pkgs[var]
+            modes = ["rdepends", "post_rdepends"]
+            if not pkg.built or resolver.process_built_depends:
+                modes.insert(0, "depends")
+            for mode in modes:
+                depset = getattr(pkg, mode).cnf_solutions()
+                for or_block in resolver.depset_reorder(depset, mode):
+                    atoms = [x for x in or_block if not x.blocks]
+                    if atoms:
+                        alternatives = []
+                        for atom in atoms:
+                            alternatives.extend(x for x in self.match(atom)
+                                                if x not in alternatives)
+                        self.require(var, alternatives)
+                        continue
+                    for blocker in or_block:
+                        for blocked in self.match(blocker, expand=False):
+                            if blocked != var:
+                                self.solver.add_clause([-var, -blocked])
+
+    def _add_slot_clauses(self):
+        s = self.solver
+        for l in self.slots.itervalues():
+            for idx, var in enumerate(l):
+                for other in l[idx + 1:]:
+                    s.add_clause([-var, -other])
+            for var in l:
+                if self.pkgs[var].repo.livefs:
+                    # pkgs only matched by blockers weren't expanded, thus
+                    # can't stand in for it.
+                    alternatives = [var] + [
+                        x for x in l if x != var and x in self._expanded]
+                    s.add_clause(alternatives)
+                    self.installed.append(alternatives)
+
+    def decide(self, s):
+        """Choose the preferred alternative of the first open requirement.
+
+        Requirements are walked in the order their owners were chosen; the
+        position reached is saved per decision level, since everything
+        prior to it stays satisfied unless that level is backjumped over.
+        """
+        level = s.decision_level
+        if len(self._saved) > level:
+            del self._saved[level + 1:]
+            pos = self._saved.pop()
+        else:
+            pos = self._saved[-1] if self._saved else 0
+        value = s.value
+        trail = s.trail
+        requirements = self.requirements
+        while pos < len(trail):
+            lit = trail[pos]
+            for alternatives in requirements.get(lit, ()) if lit > 0 else ():
+                choice = None
+                for x in alternatives:
+                    val = value(x)
+                    if val:
+                        break
+                    elif val is None and choice is None:
+                        choice = x
+                else:
+                    if choice is not None:
+                        self._saved.append(pos)
+                        return choice
+            pos += 1
+        for alternatives in self.installed:
+            choice = None
+            for x in alternatives:
+                val = value(x)
+                if val:
+                    break
+                elif val is None and choice is None:
+                    choice = x
+            else:
+                if choice is not None:
+                    self._saved.append(pos)
+                    return choice
+        return None
+
+    def solve(self):
+        """Return the chosen pkgs, or None if no solution exists."""
+        if not self.solver.solve(self.decide):
+            return None
+        return [self.pkgs[x] for x in self.solver.trail if x in self.pkgs]
+
+
+class sat_merge_plan(plan.merge_plan):
+
+    """merge_plan choosing pkgs via :obj:`solver`.
+
+    Requests that don't match anything, and resolutions the chosen pkgs
+    can't be ordered for, are handed to the chronological resolver as is.
+    """
+
+    _sat_disabled = False
+
+    def load_vdb_state(self):
+        self._sat_disabled = True
+        try:
+            return plan.merge_plan.load_vdb_state(self)
+        finally:
+            self._sat_disabled = False
+
+    def add_atoms(self, restricts, finalize=False):
+        if not restricts or self._sat_disabled:
+            return plan.merge_plan.add_atoms(self, restricts, finalize=finalize)
+
+        encoding = _encoding(self, restricts)
+        if encoding.unmatched:
+            return plan.merge_plan.add_atoms(self, restricts, finalize=finalize)
+        self._dprint("sat: %i pkgs considered", (len(encoding.pkgs),))
+        chosen = encoding.solve()
+        self._dprint("sat: %i decisions, %i conflicts",
+                     (encoding.solver.decisions, encoding.solver.conflicts))
+        if chosen is None:
+            return self._sat_failure(restricts)
+
+        chosen = frozenset((pkg.repo, pkg.cpvstr) for pkg in chosen)
+        start = self.state.current_state
+        self.filter_dbs(_SolutionRestriction(chosen))
+        try:
+            ret = plan.merge_plan.add_atoms(self, restricts, finalize=finalize)
+        finally:
+            self.filter_dbs(None)
+        if ret:
+            self._dprint("sat: ordering the solution failed, falling back")
+            self.state.backtrack(start)
+            ret = plan.merge_plan.add_atoms(self, restricts, finalize=finalize)
+        return ret
+
+    def _sat_failure(self, restricts):
+        # find the first request that can't be satisfied alongside those
+        # prior to it.
+        for idx in xrange(1, len(restricts)):
+            if _encoding(self, restricts[:idx]).solve() is None:
+                break
+        else:
+            idx = len(restricts)
+        restrict = restricts[idx - 1]
+        stack = plan.resolver_stack()
+        matches = self._viable_matches(restrict, self.default_dbs, False)
+        stack.add_frame("none", restrict, choice_point(restrict, ()),
+                        self.default_dbs, self.state.current_state, False)
+        for pkg in matches:
+            stack.add_event(("inspecting", pkg))
+            stack.add_event(("choice", str(pkg), False,
+                             "no choice of its dependencies avoids slot or "
+                             "blocker conflicts with the prior requests"))
+        stack.pop_frame(False)
+        return [restrict], stack.events[-1]
@@ -10,6 +10,7 @@ __all__ = (
 
 from snakeoil.containers import RefCountingSet
 
+from pkgcore.resolver.dag import plan_dag
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 
 
@@ -24,6 +25,9 @@ class plan_state(object):
         self.match_atom = self.state.find_atom_matches
         self.vdb_filter = set()
         self.forced_restrictions = RefCountingSet()
+        # bumped whenever vdb_filter changes or the plan is backtracked;
+        # lookups depending on either are only valid for a single generation.
+        self.generation = 0
 
     def add_blocker(self, choices, blocker, key=None):
         """Adds blocker, returning any packages blocked.
@@ -49,6 +53,7 @@ class plan_state(object):
         assert state_pos <= len(self.plan)
         if len(self.plan) == state_pos:
             return
+        self.generation += 1
 
         # track exactly how many reversions we've done-
         # since we do a single slicing of plan, if an exception occurs
@@ -77,6 +82,13 @@ class plan_state(object):
             i = (x for x in i if x.pkg.package_is_real)
         return ops_sequence(i)
 
+    def dag(self, livefs=False, only_real=False):
+        """Dependency graph of the ops; see :obj:`pkgcore.resolver.dag.plan_dag`.
+
+        The arguments are the same as :obj:`ops`.
+        """
+        return plan_dag(self, self.ops(livefs=livefs, only_real=only_real))
+
     def __getitem__(self, slice):
         return self.plan[slice]
 
@@ -207,11 +219,13 @@ class remove_op(base_op_state):
         del plan.pkg_choices[self.pkg]
         plan.plan.append(self)
         plan.vdb_filter.add(self.pkg)
+        plan.generation += 1
 
     def revert(self, plan):
         plan.state.fill_slotting(self.pkg, force=True)
         plan.pkg_choices[self.pkg] = self.choices
         plan.vdb_filter.remove(self.pkg)
+        plan.generation += 1
 
 
 class replace_op(base_op_state):
@@ -252,6 +266,7 @@ class replace_op(base_op_state):
         plan.pkg_choices[self.pkg] = self.choices
         plan.plan.append(self)
         plan.vdb_filter.add(old)
+        plan.generation += 1
 
     def revert(self, plan):
         # far simpler, since the apply op generates multiple ops on its own.
@@ -265,6 +280,7 @@ class replace_op(base_op_state):
         del plan.pkg_choices[self.pkg]
         plan.pkg_choices[self.old_pkg] = self.old_choices
         plan.vdb_filter.remove(self.old_pkg)
+        plan.generation += 1
 
     def __str__(self):
         s = ''
@@ -21,16 +21,18 @@ class delegate(restriction.base):
     :obj:`pkgcore.ebuild.domain`.
     """
 
-    __slots__ = ('_transform', 'negate')
+    __slots__ = ('_transform', 'negate', 'attrs')
 
     type = packages.package_type
     inst_caching = False
 
-    def __init__(self, transform_func, negate=False):
+    def __init__(self, transform_func, negate=False, attrs=None):
         """
 
         :param transform_func: callable invoked with data, pkg, and mode
             mode may be "match", "force_True", or "force_False"
+        :param attrs: if known, sequence of the package attributes
+            transform_func accesses
         """
 
         if not callable(transform_func):
@@ -38,6 +40,9 @@ class delegate(restriction.base):
 
         object.__setattr__(self, "negate", negate)
         object.__setattr__(self, "_transform", transform_func)
+        if attrs is not None:
+            attrs = tuple(attrs)
+        object.__setattr__(self, "attrs", attrs)
 
 
     def match(self, pkginst):
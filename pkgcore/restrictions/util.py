@@ -36,3 +36,30 @@ def collect_package_restrictions(restrict, attrs=None, invert=False):
         for r in iflatten_func(restrict, _is_package_instance):
             if invert == attrs.isdisjoint(getattr(r, 'attrs', ())):
                 yield r
+
+def collect_package_attrs(restrict):
+    """Collect the package attributes a restriction matches against.
+
+    :param restrict: package restriction to scan
+    :return: frozenset of the top level attribute names, or None if the
+        restriction holds restrictions whose attributes can't be determined.
+    """
+    attrs = set()
+    stack = [restrict]
+    while stack:
+        r = stack.pop()
+        if isinstance(r, boolean.base):
+            stack.extend(r.restrictions)
+        elif isinstance(r, restriction.AlwaysBool):
+            continue
+        elif getattr(r, "type", None) != packages.package_type:
+            return None
+        else:
+            l = getattr(r, "attrs", None)
+            if l is None:
+                l = getattr(r, "attr", None)
+                if not isinstance(l, basestring):
+                    return None
+                l = (l,)
+            attrs.update(x.split(".", 1)[0] for x in l)
+    return frozenset(attrs)
@@ -13,12 +13,22 @@ source or binary packages.
 __all__ = ("argparser", "AmbiguousQuery", "NoMatches")
 
 import argparse
+import json
+from itertools import izip
 from time import time
 
 from pkgcore.ebuild import resolver
 from pkgcore.ebuild.atom import atom
+from pkgcore.fetch.background import background_fetcher
 from pkgcore.merge import errors as merge_errors
+from pkgcore.merge.triggers import trigger_session
 from pkgcore.operations import observer, format
+from pkgcore.operations.scheduler import merge_scheduler
+from pkgcore.resolver import parallel as parallel_resolver
+from pkgcore.resolver.incremental import resolution_state
+from pkgcore.resolver.prefetch import metadata_prefetcher
+from pkgcore.resolver.profile import resolver_profile
+from pkgcore.resolver.sat import sat_merge_plan
 from pkgcore.resolver.util import reduce_to_failures
 from pkgcore.restrictions import packages
 from pkgcore.restrictions.boolean import OrRestriction
@@ -88,6 +98,37 @@ merge_mode.add_argument(
 merge_mode.add_argument(
     '-f', '--fetchonly', action='store_true',
     help="do only the fetch steps of the resolved plan")
+merge_mode.add_argument(
+    '-j', '--jobs', type=int, default=1, metavar='N',
+    help="fetch and build up to N packages concurrently, as far as their "
+         "dependencies allow; merging into the livefs still happens one "
+         "package at a time")
+merge_mode.add_argument(
+    '--fetch-jobs', type=int, default=0, metavar='N',
+    help="once the plan is accepted, fetch the distfiles of all its "
+         "packages in N background threads, in plan order; building a "
+         "package then only waits on its own distfiles")
+merge_mode.add_argument(
+    '--merge-jobs', type=int, default=1, metavar='N',
+    help="merge and unmerge the files of a package, and run its triggers, "
+         "in up to N threads; defaults to 1")
+merge_mode.add_argument(
+    '--link-image', action='store_true',
+    help="hardlink the files of freshly built packages from their build "
+         "image into place where possible, rather than copying them")
+merge_mode.add_argument(
+    '--reverify-distfiles', action='store_true',
+    help="hash distfiles again rather than trusting the checksums cached "
+         "for them since they were last verified")
+merge_mode.add_argument(
+    '--defer-triggers', action='store_true',
+    help="run triggers regenerating system wide state, like ldconfig, "
+         "env-update and the info index, once at the end rather than after "
+         "every merge; they're also run before building a package")
+merge_mode.add_argument(
+    '--load-average', type=float, metavar='LOAD',
+    help="with --jobs, don't start new jobs while others are running and "
+         "the load average is at least LOAD")
 merge_mode.add_argument(
     '-1', '--oneshot', action='store_true',
     default=False,
@@ -139,6 +180,42 @@ resolution_options.add_argument(
     '-e', '--empty', action='store_true',
     help="force rebuilding of all involved packages, using installed "
          "packages only to satisfy building the replacements")
+resolution_options.add_argument(
+    '--sat', action='store_true',
+    help="choose packages via a clause learning SAT solver rather than "
+         "chronological backtracking; this considers every candidate "
+         "package up front, but copes far better with slot and blocker "
+         "conflicts")
+resolution_options.add_argument(
+    '--resolver-jobs', type=int, default=1, metavar='N',
+    help="resolve groups of targets not sharing dependencies in up to N "
+         "processes concurrently")
+resolution_options.add_argument(
+    '--metadata-prefetch', type=int, default=0, metavar='N',
+    help="load the metadata of packages the resolver is about to consider, "
+         "and of the versions of their dependencies, in N background "
+         "threads; helps on cold caches and network mounted repositories")
+resolution_options.add_argument(
+    '--resolver-state', metavar='FILE',
+    help="record targets that resolved to nothing to merge in FILE, and "
+         "skip resolving them again while none of the packages their "
+         "resolution involved changed (new or removed versions, USE, "
+         "ebuild modifications, changed dependencies, etc); meant for "
+         "repeated world upgrades")
+resolution_options.add_argument(
+    '--resolver-profile', metavar='FILE',
+    help="write resolver statistics (frames and time spent per atom, "
+         "backtracks, time spent per resolver stage, etc) as JSON to FILE")
+resolution_options.add_argument(
+    '--resolver-profile-stacks', metavar='FILE',
+    help="write the time spent resolving each atom stack to FILE in the "
+         "collapsed stack format flamegraph tools accept")
+resolution_options.add_argument(
+    '--export-dag', metavar='FILE',
+    help="write the dependency graph of the packages to merge as JSON to "
+         "FILE: the ops, the build, runtime and post dependencies between "
+         "them, the levels of ops that may run concurrently, and the "
+         "longest chain of dependent ops")
 
 output_options = argparser.add_argument_group("Output related options")
 output_options.add_argument(
@@ -222,19 +299,28 @@ def do_unmerge(options, out, err, vdb, matches, world_set, repo_obs):
         else:
             raise Failure('vdb is frozen')
 
-    for idx, match in enumerate(matches):
-        out.write("removing %i of %i: %s" % (idx + 1, len(matches), match))
-        out.title("%i/%i: %s" % (idx + 1, len(matches), match))
-        op = options.domain.uninstall_pkg(match, observer=repo_obs)
-        ret = op.finish()
-        if not ret:
-            if not options.ignore_failures:
-                raise Failure('failed unmerging %s' % (match,))
-            out.write(out.fg('red'), 'failed unmerging ', match)
-        update_worldset(world_set, match, remove=True)
+    try:
+        for idx, match in enumerate(matches):
+            out.write("removing %i of %i: %s" % (idx + 1, len(matches), match))
+            out.title("%i/%i: %s" % (idx + 1, len(matches), match))
+            op = options.domain.uninstall_pkg(match, observer=repo_obs)
+            ret = op.finish()
+            if not ret:
+                if not options.ignore_failures:
+                    raise Failure('failed unmerging %s' % (match,))
+                out.write(out.fg('red'), 'failed unmerging ', match)
+            update_worldset(world_set, match, remove=True)
+    finally:
+        sync_triggers(options.domain)
     out.write("finished; removed %i packages" % len(matches))
 
 
+def sync_triggers(domain):
+    """run the triggers deferred by the merges done so far, if any"""
+    if domain.trigger_session:
+        domain.trigger_session.sync()
+
+
 def display_failures(out, sequence, first_level=True, debug=False):
     """when resolution fails, display a nicely formatted message"""
 
@@ -352,7 +438,8 @@ def _validate(parser, namespace):
     namespace.set = f(namespace.set)
 
 
-def parse_atom(restriction, repo, livefs_repos, return_none=False):
+def parse_atom(restriction, repo, livefs_repos, return_none=False,
+               matches=None):
     """Use :obj:`parserestrict.parse_match` to produce a single atom.
 
     This matches the restriction against a repo. If multiple pkgs match, then
@@ -364,10 +451,14 @@ def parse_atom(restriction, repo, livefs_repos, return_none=False):
     :param repo: :obj:`pkgcore.repository.prototype.tree` instance to search in.
     :param livefs_repos: :obj:`pkgcore.config.domain.all_livefs_repos` instance to search in.
     :param return_none: indicates if no matches raises or returns C{None}
+    :param matches: pkgs from repo matching the restriction if they were
+        already looked up, for example via :obj:`itermatch_many`.
 
     :return: an atom or C{None}.
     """
-    key_matches = set(x.key for x in repo.itermatch(restriction))
+    if matches is None:
+        matches = repo.itermatch(restriction)
+    key_matches = set(x.key for x in matches)
     if not key_matches:
         raise NoMatches(restriction)
     elif len(key_matches) > 1:
@@ -398,6 +489,14 @@ def main(options, out, err):
 
     domain = options.domain
     livefs_repos = domain.all_livefs_repos
+    if options.reverify_distfiles:
+        chksum_cache = getattr(domain.fetcher, 'chksum_cache', None)
+        if chksum_cache is not None:
+            chksum_cache.trusted = False
+    if options.defer_triggers:
+        domain.trigger_session = trigger_session()
+    domain.merge_jobs = max(options.merge_jobs, 1)
+    domain.link_image = options.link_image
     world_set = world_list = options.world
     if options.oneshot:
         world_set = None
@@ -457,9 +556,11 @@ def main(options, out, err):
         else:
             atoms.extend(l)
 
-    for token in options.targets:
+    target_matches = source_repos.combined.itermatch_many(options.targets)
+    for token, matches in izip(options.targets, target_matches):
         try:
-            a = parse_atom(token, source_repos.combined, livefs_repos, return_none=True)
+            a = parse_atom(token, source_repos.combined, livefs_repos,
+                           return_none=True, matches=matches)
         except parserestrict.ParseError as e:
             out.error(str(e))
             return 1
@@ -494,16 +595,31 @@ def main(options, out, err):
 
     extra_kwargs = {}
     if options.empty:
-        extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
+        if options.sat:
+            extra_kwargs['resolver_cls'] = resolver.empty_tree_sat_merge_plan
+        else:
+            extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
+    elif options.sat:
+        extra_kwargs['resolver_cls'] = sat_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    profile = None
+    if options.resolver_profile or options.resolver_profile_stacks:
+        profile = extra_kwargs['profile'] = resolver_profile()
+    if options.metadata_prefetch > 0:
+        extra_kwargs['prefetcher'] = metadata_prefetcher(
+            list(installed_repos.repositories) +
+            list(source_repos.repositories),
+            threads=options.metadata_prefetch)
 
     # XXX: This should recurse on deep
     if options.newuse:
         out.write(out.bold, ' * ', out.reset, 'Scanning for changed USE...')
         out.title('Scanning for changed USE...')
-        for inst_pkg in installed_repos.itermatch(OrRestriction(*atoms)):
-            src_pkgs = source_repos.match(inst_pkg.versioned_atom)
+        inst_pkgs = list(installed_repos.itermatch(OrRestriction(*atoms)))
+        src_matches = source_repos.itermatch_many(
+            inst_pkg.versioned_atom for inst_pkg in inst_pkgs)
+        for inst_pkg, src_pkgs in izip(inst_pkgs, src_matches):
             if src_pkgs:
                 src_pkg = max(src_pkgs)
                 inst_iuse = set(use.lstrip("+-") for use in inst_pkg.iuse)
@@ -537,7 +653,21 @@ def main(options, out, err):
     resolve_time = time()
     out.title('Resolving...')
     out.write(out.bold, ' * ', out.reset, 'Resolving...')
-    ret = resolver_inst.add_atoms(atoms, finalize=True)
+    add_atoms = partial(parallel_resolver.add_atoms, jobs=options.resolver_jobs)
+    if options.resolver_state:
+        context = repr((resolver_kls.__name__, options.deep, options.nodeps,
+                        options.empty, options.replace, options.sat,
+                        options.with_built_depends, options.usepkg,
+                        options.usepkgonly, options.source_only))
+        state = resolution_state(options.resolver_state, context)
+        ret = state.add_atoms(resolver_inst, atoms, finalize=True,
+                              add_atoms=add_atoms)
+        if state.skipped:
+            out.write(out.bold, ' * ', out.reset,
+                      "reused the prior resolution of %i targets"
+                      % len(state.skipped))
+    else:
+        ret = add_atoms(resolver_inst, atoms, finalize=True)
     while ret:
         out.error('resolution failed')
         restrict = ret[0][0]
@@ -552,8 +682,25 @@ def main(options, out, err):
         ret = resolver_inst.add_atoms(atoms, finalize=True)
     resolve_time = time() - resolve_time
 
+    if profile is not None:
+        for path, writer in ((options.resolver_profile, profile.write_json),
+                             (options.resolver_profile_stacks,
+                              profile.write_collapsed)):
+            if path is None:
+                continue
+            try:
+                with open(path, 'w') as f:
+                    writer(f)
+            except EnvironmentError as e:
+                err.write("failed writing resolver profile %r: %s" % (path, e))
+
     if options.debug:
         out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
+        hits, misses = resolver_inst.viable_memo_stats
+        if hits + misses:
+            out.write(out.bold, " * ", out.reset,
+                      "viability memo: %i hits, %i misses, %.1f%% hit rate" %
+                      (hits, misses, 100 * hits / float(hits + misses)))
 
     if failures:
         out.write()
@@ -613,6 +760,15 @@ def main(options, out, err):
 
     changes = resolver_inst.state.ops(only_real=True)
 
+    if options.export_dag:
+        try:
+            with open(options.export_dag, 'w') as f:
+                json.dump(resolver_inst.state.dag(only_real=True).to_dict(),
+                          f, indent=2, sort_keys=True)
+        except EnvironmentError as e:
+            err.write("failed writing dependency graph %r: %s"
+                      % (options.export_dag, e))
+
     build_obs = observer.build_observer(observer.formatter_output(out), not options.debug)
     repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
 
@@ -651,6 +807,42 @@ def main(options, out, err):
     if (options.ask and not formatter.ask("Would you like to merge these packages?")):
         return
 
+    def update_world(op):
+        if world_set is not None:
+            if op.desc == "remove":
+                out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
+                removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+                update_worldset(world_set, removal_pkg, remove=True)
+            elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+                if not options.upgrade:
+                    out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
+                    add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+                    update_worldset(world_set, add_pkg)
+
+    background = None
+    if options.fetch_jobs > 0:
+        background = background_fetcher(
+            domain, [op.pkg for op in changes if op.desc != "remove"],
+            threads=options.fetch_jobs)
+        background.start()
+
+    if options.jobs > 1:
+        scheduler = merge_scheduler(
+            domain, resolver_inst.state.dag(only_real=True), out,
+            jobs=options.jobs, load_average=options.load_average,
+            fetchonly=options.fetchonly,
+            ignore_failures=options.ignore_failures, debug=options.debug,
+            merged=update_world, background=background)
+        try:
+            if not scheduler.run():
+                return 1
+        finally:
+            if background is not None:
+                background.shutdown()
+            sync_triggers(domain)
+        out.write("finished")
+        return 0
+
     change_count = len(changes)
 
     # left in place for ease of debugging.
@@ -672,6 +864,9 @@ def main(options, out, err):
 
                 pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
                 out.write("\n%i files required-" % len(op.pkg.fetchables))
+                if background is not None:
+                    # failures are retried and reported by the fetch below.
+                    background.wait(op.pkg)
                 try:
                     ret = pkg_ops.run_if_supported("fetch", or_return=True)
                 except IGNORED_EXCEPTIONS:
@@ -691,6 +886,8 @@ def main(options, out, err):
                 buildop = pkg_ops.run_if_supported("build", or_return=None)
                 pkg = op.pkg
                 if buildop is not None:
+                    # the build sees the livefs as deferred triggers leave it.
+                    sync_triggers(domain)
                     out.write("building %s" % (op.pkg.cpvstr,))
                     result = False
                     try:
@@ -748,16 +945,7 @@ def main(options, out, err):
             # mainly to protect against any code following triggering reloads
             # basically, be protective
 
-            if world_set is not None:
-                if op.desc == "remove":
-                    out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
-                    removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not options.upgrade:
-                        out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
-                        add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+            update_world(op)
 
 
 #    again... left in place for ease of debugging.
@@ -766,7 +954,9 @@ def main(options, out, err):
 #    else:
 #        import pdb;pdb.set_trace()
     finally:
-        pass
+        if background is not None:
+            background.shutdown()
+        sync_triggers(domain)
 
     # the final run from the loop above doesn't invoke cleanups;
     # we could ignore it, but better to run it to ensure nothing is inadvertantly
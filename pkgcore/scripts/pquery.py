@@ -9,7 +9,7 @@ from snakeoil.demandload import demandload
 from snakeoil.formatters import decorate_forced_wrapping
 
 from pkgcore.ebuild import conditionals, atom
-from pkgcore.restrictions import packages, values, boolean
+from pkgcore.restrictions import packages, values, boolean, restriction
 from pkgcore.util import (
     commandline, repo_utils, parserestrict, packages as pkgutils)
 
@@ -17,6 +17,7 @@ demandload(
     'errno',
     're',
     'snakeoil.lists:iter_stable_unique',
+    'snakeoil.osutils:normpath',
     'pkgcore.fs:fs@fs_module,contents@contents_module',
 )
 
@@ -53,6 +54,56 @@ class DataSourceRestriction(values.base):
     __hash__ = object.__hash__
 
 
+class OwnersRestriction(restriction.base):
+
+    """Match pkgs owning files via their repo's owners index, if it has one.
+
+    Pkgs from repos lacking an index are matched against a contents based
+    fallback restriction instead.
+    """
+
+    __slots__ = ('lookup', 'fallback', 'negate', '_owners')
+    __inst_caching__ = False
+    type = packages.package_type
+
+    def __init__(self, lookup, fallback):
+        """
+        :param lookup: callable taking an owners index, returning the
+            cpvstrs to match
+        :param fallback: restriction to use for pkgs lacking an index
+        """
+        sf = object.__setattr__
+        sf(self, 'lookup', lookup)
+        sf(self, 'fallback', fallback)
+        sf(self, 'negate', False)
+        sf(self, '_owners', {})
+
+    def match(self, pkg):
+        index = getattr(getattr(pkg, 'repo', None), 'owners', None)
+        if index is None:
+            return self.fallback.match(pkg)
+        owners = self._owners.get(index)
+        if owners is None:
+            owners = self._owners[index] = frozenset(self.lookup(index))
+        return pkg.cpvstr in owners
+
+    def __str__(self):
+        return 'owners index lookup, else %s' % (self.fallback,)
+
+    def __repr__(self):
+        return '<%s fallback=%r @%#8x>' % (
+            self.__class__.__name__, self.fallback, id(self))
+
+    __hash__ = object.__hash__
+
+
+def _lookup_owners(paths, index):
+    return (cpvstr for _path, cpvstr in index.iter_owners(paths))
+
+def _lookup_owners_matching(predicate, index):
+    return index.owners_matching(predicate)
+
+
 dep_attrs = ['depends', 'rdepends', 'post_rdepends']
 metadata_attrs = dep_attrs
 dep_attrs += list('raw_%s' % x for x in dep_attrs)
@@ -626,7 +677,8 @@ def parse_owns(value):
         'contents',
         values_kls=contents_module.contentsSet,
         token_kls=partial(fs_module.fsBase, strict=False))
-    return parser(value)
+    paths = tuple(normpath(piece.strip()) for piece in value.split(','))
+    return OwnersRestriction(partial(_lookup_owners, paths), parser(value))
 
 @bind_add_query(
     '--owns-re', action='append', dest='owns_re',
@@ -637,10 +689,12 @@ def parse_ownsre(value):
     This means the object kind is prepended to the path the regexp has
     to match.
     """
-    return packages.PackageRestriction(
-        'contents',
-        values.AnyMatch(values.GetAttrRestriction(
-            'location', mk_strregex(value))))
+    regex = mk_strregex(value)
+    return OwnersRestriction(
+        partial(_lookup_owners_matching, regex.match),
+        packages.PackageRestriction(
+            'contents',
+            values.AnyMatch(values.GetAttrRestriction('location', regex))))
 
 @bind_add_query(
     '--maintainer', action='append', dest='maintainer',
@@ -791,10 +845,45 @@ def get_pkg_attr(pkg, attr, fallback=None):
     return getattr(pkg, attr, fallback)
 
 
+def pkg_attrs(attrs):
+    """Yield the package attributes rendering a sequence of attrs accesses.
+
+    This is used to limit the metadata pulled for matches; see the attrs
+    keyword of :obj:`pkgcore.repository.prototype.tree.itermatch`.
+    """
+    for attr in attrs:
+        if attr[0:4] == 'raw_':
+            attr = attr[4:]
+        if attr in ('files', 'uris'):
+            yield 'fetchables'
+        elif attr == 'use':
+            yield 'use'
+            yield 'iuse'
+        else:
+            yield attr
+
+
 class _Fail(Exception):
     pass
 
 
+def process_attrs(sequence):
+    """Expand the meta attrs (all, allmetadata, etc) of a sequence."""
+    for attr in sequence:
+        if attr == 'all':
+            i = [x for x in printable_attrs if x != 'all']
+        elif attr == 'allmetadata':
+            i = process_attrs(metadata_attrs)
+        elif attr == 'alldepends':
+            i = ['depends', 'rdepends', 'post_rdepends']
+        elif attr == 'raw_alldepends':
+            i = ['raw_depends', 'raw_rdepends', 'raw_post_rdepends']
+        else:
+            i = [attr]
+        for attr in i:
+            yield attr
+
+
 def mangle_values(vals, err):
 
     def error_out(*args, **kwds):
@@ -812,21 +901,6 @@ def mangle_values(vals, err):
     if vals.one_attr and vals.print_revdep:
         error_out('--print-revdep with --force-one-attr or --one-attr does not make sense.')
 
-    def process_attrs(sequence):
-        for attr in sequence:
-            if attr == 'all':
-                i = [x for x in printable_attrs if x != 'all']
-            elif attr == 'allmetadata':
-                i = process_attrs(metadata_attrs)
-            elif attr == 'alldepends':
-                i = ['depends', 'rdepends', 'post_rdepends']
-            elif attr == 'raw_alldepends':
-                i = ['raw_depends', 'raw_rdepends', 'raw_post_rdepends']
-            else:
-                i = [attr]
-            for attr in i:
-                yield attr
-
     attrs = ['repo', 'description', 'homepage'] if vals.verbose else []
     attrs.extend(process_attrs(vals.attr))
 
@@ -853,9 +927,18 @@ def main(options, out, err):
 
     if options.query is None:
         return 0
+    attrs = list(options.attr)
+    if options.one_attr:
+        attrs.append(options.one_attr)
+    if options.print_revdep:
+        attrs.extend(dep_attrs)
+    if options.contents:
+        attrs.append('contents')
+    attrs = frozenset(pkg_attrs(attrs))
     for repo in options.repos:
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            for pkgs in pkgutils.groupby_pkg(
+                    repo.itermatch(options.query, sorter=sorted, attrs=attrs)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
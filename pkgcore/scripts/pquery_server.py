@@ -0,0 +1,361 @@
+# License: BSD/GPL2
+
+"""pkgcore HTTP/JSON query service
+
+Serves pquery style queries over HTTP, keeping the configuration, domain,
+repositories and their caches loaded across requests.
+
+Queries are issued as ``GET /query?<params>`` or as ``POST /query`` with a
+JSON object body holding the same params.  Params may be given multiple
+times; values of the same kind are or'd together, different kinds are
+and'd, mirroring pquery:
+
+* ``match``, ``revdep``, ``owns``, ``owns_re``, ``description``,
+  ``maintainer``, ``has_use``, ``license``: restrictions, parsed as the
+  matching pquery options.
+* ``repo``: name of a configured repo to search instead of the default
+  (non-vdb) repos; ``GET /repos`` lists the available names.
+* ``attr``: package attributes to include with each result, any of those
+  pquery's ``--attr`` accepts.
+* ``offset``, ``limit``: select the page of results to return.
+* ``stream``: if true, results are written as they're found, one JSON
+  object per line, instead of being collected into a single response.
+"""
+
+__all__ = ("argparser", "main", "QueryServer", "query_parsers")
+
+import BaseHTTPServer
+import json
+import Queue
+import re
+import threading
+import urlparse
+
+from snakeoil.demandload import demandload
+
+from pkgcore.restrictions import packages
+from pkgcore.scripts import pquery
+from pkgcore.util import commandline, parserestrict
+
+demandload(
+    'errno',
+    'socket',
+    'pkgcore.log:logger',
+)
+
+query_parsers = {
+    'match': parserestrict.parse_match,
+    'revdep': pquery.parse_revdep,
+    'owns': pquery.parse_owns,
+    'owns_re': pquery.parse_ownsre,
+    'description': pquery.parse_description,
+    'maintainer': pquery.parse_maintainer,
+    'has_use': parserestrict.comma_separated_containment('iuse'),
+    'license': parserestrict.comma_separated_containment('license'),
+}
+
+
+class QueryError(Exception):
+    """Malformed query; reported to the client as a 400."""
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.decode('utf8', 'replace')
+    return value
+
+
+def parse_query(params):
+    """Convert query params to a package restriction.
+
+    :param params: mapping of param name to a list of values
+    """
+    restricts = []
+    for kind in sorted(query_parsers):
+        vals = params.get(kind)
+        if not vals:
+            continue
+        parser = query_parsers[kind]
+        try:
+            l = [parser(val) for val in vals]
+        except (parserestrict.ParseError, ValueError, TypeError, IndexError,
+                re.error) as e:
+            # parsers aren't picky about what they raise for malformed input.
+            raise QueryError("invalid %s %r: %s" % (kind, vals, e))
+        if len(l) == 1:
+            restricts.append(l[0])
+        else:
+            restricts.append(packages.OrRestriction(*l))
+    if not restricts:
+        return packages.AlwaysTrue
+    if len(restricts) == 1:
+        return restricts[0]
+    return packages.AndRestriction(*restricts)
+
+
+def _int_param(params, key, default, minimum):
+    vals = params.get(key)
+    if not vals:
+        return default
+    try:
+        val = int(vals[-1])
+    except (TypeError, ValueError):
+        val = None
+    if val is None or val < minimum:
+        raise QueryError("%s must be an integer >= %i, got %r" %
+                         (key, minimum, vals[-1]))
+    return val
+
+
+def _bool_param(params, key):
+    vals = params.get(key)
+    if not vals:
+        return False
+    val = vals[-1]
+    if isinstance(val, bool):
+        return val
+    try:
+        return commandline.string_bool(str(val))
+    except ValueError:
+        raise QueryError("%s must be a boolean, got %r" % (key, val))
+
+
+class QueryServer(BaseHTTPServer.HTTPServer):
+
+    """HTTP server answering queries from a fixed pool of worker threads.
+
+    Queries share the repository instances handed in, so any metadata
+    and caches loaded by one request are reused by the following ones.
+    Repositories and their caches aren't thread safe, so workers take
+    turns accessing them; only sending results to clients is concurrent.
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, address, repos, default_repos, jobs=4, page_size=100):
+        """
+        :param address: (host, port) tuple to listen on
+        :param repos: mapping of repo name to repo instance
+        :param default_repos: sequence of repos searched if a query doesn't
+            name any
+        :param jobs: number of worker threads handling requests
+        :param page_size: number of results returned if a query doesn't
+            specify a limit
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, QueryHandler)
+        self.repos = repos
+        self.default_repos = tuple(default_repos)
+        self.page_size = page_size
+        # held while accessing repos
+        self._repo_lock = threading.Lock()
+        self._requests = Queue.Queue()
+        self._workers = []
+        for x in xrange(max(jobs, 1)):
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        for t in self._workers:
+            self._requests.put(None)
+        for t in self._workers:
+            t.join()
+        self._workers = []
+
+    def get_repos(self, params):
+        names = params.get('repo')
+        if not names:
+            return self.default_repos
+        try:
+            return tuple(self.repos[name] for name in names)
+        except KeyError as e:
+            raise QueryError("unknown repo %r" % (e.args[0],))
+
+    def iter_results(self, params):
+        """Yield a result mapping per matching package."""
+        restrict = parse_query(params)
+        repos = self.get_repos(params)
+        attrs = params.get('attr', ())
+        for attr in attrs:
+            if attr not in pquery.printable_attrs:
+                raise QueryError("unknown attr %r" % (attr,))
+        attrs = list(pquery.process_attrs(attrs))
+        # query parsing errors have to be raised prior to the first result.
+        return self._iter_results(restrict, repos, attrs)
+
+    def _iter_results(self, restrict, repos, attrs):
+        pkg_attrs = frozenset(pquery.pkg_attrs(attrs))
+        for repo in repos:
+            with self._repo_lock:
+                pkgs = repo.itermatch(restrict, sorter=sorted, attrs=pkg_attrs)
+            while True:
+                # the lock isn't held while the caller handles a result.
+                with self._repo_lock:
+                    pkg = next(pkgs, None)
+                    if pkg is None:
+                        break
+                    result = {'cpv': pkg.cpvstr}
+                    for attr in attrs:
+                        result[attr] = _text(
+                            pquery.stringify_attr(None, pkg, attr))
+                yield result
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    server_version = "pkgcore-query/1"
+    _streaming = False
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        self._dispatch(url.path, urlparse.parse_qs(url.query))
+
+    def do_POST(self):
+        url = urlparse.urlsplit(self.path)
+        try:
+            length = int(self.headers.getheader('content-length', 0))
+            body = json.loads(self.rfile.read(length) or '{}')
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            self._send_json(400, {'error': 'invalid request body: %s' % (e,)})
+            return
+        params = {}
+        for key, val in body.iteritems():
+            if not isinstance(val, list):
+                val = [val]
+            params[key] = [x if isinstance(x, bool) else unicode(x).encode('utf8')
+                           for x in val]
+        self._dispatch(url.path, params)
+
+    def _dispatch(self, path, params):
+        try:
+            if path == '/query':
+                self._query(params)
+            elif path == '/repos':
+                self._send_json(200, {'repos': sorted(self.server.repos)})
+            else:
+                self._send_json(404, {'error': 'unknown path %r' % (path,)})
+        except QueryError as e:
+            self._send_json(400, {'error': str(e)})
+        except socket.error as e:
+            if e.errno not in (errno.EPIPE, errno.ECONNRESET):
+                raise
+            # client went away.
+        except Exception as e:
+            logger.exception("failed handling request %r", self.path)
+            if self._streaming:
+                # headers are already out; all we can do is cut it short.
+                return
+            self._send_json(500, {'error': 'internal error: %s' % (e,)})
+
+    def _query(self, params):
+        offset = _int_param(params, 'offset', 0, 0)
+        results = self.server.iter_results(params)
+        if _bool_param(params, 'stream'):
+            limit = _int_param(params, 'limit', None, 1)
+            self._streaming = True
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-json-stream')
+            self.end_headers()
+            for idx, result in enumerate(results):
+                if idx < offset:
+                    continue
+                if limit is not None and idx >= offset + limit:
+                    break
+                self.wfile.write(json.dumps(result) + '\n')
+                self.wfile.flush()
+            return
+
+        limit = _int_param(params, 'limit', self.server.page_size, 1)
+        l = []
+        next_offset = None
+        for idx, result in enumerate(results):
+            if idx < offset:
+                continue
+            if idx >= offset + limit:
+                next_offset = idx
+                break
+            l.append(result)
+        self._send_json(200, {'results': l, 'offset': offset, 'limit': limit,
+                              'next_offset': next_offset})
+
+    def _send_json(self, code, data):
+        data = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+argparser = commandline.mk_argparser(description=__doc__.split('\n', 1)[0])
+argparser.add_argument(
+    '--host', default='localhost',
+    help="address to listen on; defaults to localhost.")
+argparser.add_argument(
+    '-p', '--port', type=int, default=12345,
+    help="port to listen on; defaults to 12345.")
+argparser.add_argument(
+    '-j', '--jobs', type=int, default=4,
+    help="number of requests to handle concurrently; defaults to 4.")
+argparser.add_argument(
+    '--page-size', type=int, default=100,
+    help="number of results returned by queries not specifying a limit; "
+         "defaults to 100.")
+argparser.add_argument(
+    '--no-filters', action='store_true', default=False,
+    help="disable license and visibility filtering (ACCEPT_KEYWORDS, "
+         "package masking, etc) for all repos.")
+
+
+@argparser.bind_main_func
+def main(options, out, err):
+    domain = options.domain
+    if options.no_filters:
+        repos = dict(domain.repos_configured)
+        default_repos = [repo for name, repo in sorted(repos.iteritems())
+                         if repo not in domain.vdb]
+    else:
+        repos = dict(domain.repos_configured_filtered)
+        default_repos = domain.repos
+    # drop the "profile virtuals" style pseudo repos lacking a config name.
+    repos.pop(None, None)
+
+    try:
+        server = QueryServer((options.host, options.port), repos,
+                             default_repos, jobs=options.jobs,
+                             page_size=options.page_size)
+    except socket.error as e:
+        err.write("failed binding %s:%i: %s" % (options.host, options.port, e))
+        return 1
+
+    out.write("serving queries on http://%s:%i/" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
@@ -0,0 +1,65 @@
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.benchmarks import suite, synthetic
+from pkgcore.ebuild.atom import atom
+from pkgcore.test import TestCase, silence_logging
+
+
+class TestSynthetic(TempDirMixin, TestCase):
+
+    params = synthetic.tree_params(packages=30, versions=2, fanout=3,
+                                   slot_density=0.2, blocker_density=0.2)
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        synthetic.generate(self.params, self.dir)
+
+    def test_generate(self):
+        repo, vdb = synthetic.load_repos(self.dir)
+        self.assertEqual(len(repo), 60)
+        pkgs = list(vdb)
+        self.assertTrue(pkgs)
+        for pkg in pkgs:
+            self.assertTrue(repo.match(pkg.versioned_atom))
+        # the same params generate the same trees.
+        other = pjoin(self.dir, 'other')
+        synthetic.generate(self.params, other)
+        other_repo, other_vdb = synthetic.load_repos(other)
+        self.assertEqual(sorted(pkgs), sorted(other_vdb))
+        key = self.params.keys[0]
+        self.assertEqual(
+            [str(pkg.rdepends) for pkg in repo.match(atom(key))],
+            [str(pkg.rdepends) for pkg in other_repo.match(atom(key))])
+
+    def test_configured(self):
+        repo, vdb = synthetic.load_repos(self.dir)
+        for pkg in synthetic.configured_repo(repo):
+            self.assertEqual(pkg.use, synthetic.enabled_use)
+            self.assertFalse(pkg.rdepends.has_conditionals)
+
+    @silence_logging
+    def test_suite(self):
+        results = suite.run_suite(self.dir, self.params, repeat=1)
+        self.assertEqual(sorted(results['benchmarks']),
+                         sorted(name for name, func in suite.benchmarks))
+        self.assertEqual(results['params'], self.params.to_dict())
+        benchmarks = results['benchmarks']
+        self.assertEqual(benchmarks['cache_read']['info'], {'pkgs': 60})
+        self.assertEqual(benchmarks['resolve']['info']['targets'], 3)
+        self.assertTrue(benchmarks['resolve']['peak_rss_kb'] > 0)
+        path = pjoin(self.dir, 'results.json')
+        suite.write_results(path, results)
+        self.assertEqual(
+            [x[0] for x in suite.compare(suite.read_results(path), results)],
+            sorted(benchmarks))
+
+    def test_failure(self):
+        def bench(location, params):
+            def f():
+                raise ValueError("broken")
+            return f
+        self.assertRaises(ValueError, suite.run_benchmark,
+                          bench, self.dir, self.params)
@@ -24,3 +24,15 @@ class TestFlatHash(util.GenericCacheMixin, TempDirMixin):
     def get_db(self, readonly=False):
         return db(self.dir,
             auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_project(self):
+        db = self.get_db()
+        for key, raw_data in self.test_data:
+            db[key] = dict(raw_data)
+            d = db.project(key, ["KEYWORDS", "SLOT"])
+            self.assertEqual(sorted(d.keys()),
+                ["KEYWORDS", "SLOT", "_eclasses_", "_mtime_"])
+            raw_data = dict(raw_data)
+            self.assertEqual(d["KEYWORDS"], raw_data["KEYWORDS"])
+            self.assertEqual(sorted(x[0] for x in d["_eclasses_"]),
+                sorted(raw_data["_eclasses_"]))
@@ -63,6 +63,20 @@ class test_base(TestCase):
         o = self.get_pkg({'LICENSE':'GPL2 FOON'})
         self.assertEqual(list(o.license), ['GPL2', 'FOON'])
 
+    def test_depset_sharing(self):
+        dep = 'dev-util/foo x? ( dev-util/bar )'
+        o1 = self.get_pkg({'DEPEND':dep, 'RDEPEND':dep, 'EAPI':'2'})
+        o2 = self.get_pkg({'DEPEND':dep, 'LICENSE':'GPL2', 'EAPI':'2'},
+            cpv='dev-util/diffball-0.2')
+        self.assertIdentical(o1.depends, o1.rdepends)
+        self.assertIdentical(o1.depends, o2.depends)
+        # atoms parse differently depending on eapi.
+        o3 = self.get_pkg({'DEPEND':dep, 'EAPI':'0'})
+        self.assertNotIdentical(o1.depends, o3.depends)
+        # as do the other depset attrs.
+        self.assertNotIdentical(o2.license,
+            self.get_pkg({'RESTRICT':'GPL2'}).restrict)
+
     def test_description(self):
         o = self.get_pkg({'DESCRIPTION':' foon\n asdf '})
         self.assertEqual(o.description, 'foon\n asdf')
@@ -424,6 +438,37 @@ class test_package_factory(TestCase):
         self.assertEqual(cache2[pkg.cpvstr],
             {'_eclasses_':{'eclass1':(None, 100)}, 'marker':2, '_mtime_':200})
 
+    def test_project_metadata(self):
+        data = {'KEYWORDS':'x86', 'SLOT':'1', 'DESCRIPTION':'foo'}
+        l = []
+        def get_metadata(pkg, keys=None, **kwds):
+            l.append(keys)
+            if keys is None:
+                return dict(data)
+            return {k: v for k, v in data.iteritems() if k in keys}
+
+        pf = self.mkinst(_get_metadata=get_metadata)
+        pkg = ebuild_src.base(pf, 'dev-util/diffball-0.1')
+        pf.project_metadata(pkg, ['keywords', 'fullver'])
+        # nothing is pulled until it's needed.
+        self.assertEqual(l, [])
+        self.assertEqual(pkg.keywords, ('x86',))
+        self.assertEqual(l, [frozenset(['KEYWORDS'])])
+        # anything else pulls the full metadata, once.
+        self.assertEqual(pkg.slot, '1')
+        self.assertEqual(pkg.description, 'foo')
+        self.assertEqual(l[1:], [None])
+        # consumed keys aren't resurrected by the full pull.
+        self.assertEqual(sorted(pkg.data), [])
+
+        # unknown attrs, and those not needing metadata, disable it.
+        for attrs in (['keywords', 'environment'], ['fullver']):
+            del l[:]
+            pkg = ebuild_src.base(pf, 'dev-util/diffball-0.2')
+            pf.project_metadata(pkg, attrs)
+            self.assertEqual(pkg.data, data)
+            self.assertEqual(l, [None])
+
     def test_required_use(self):
         pass
 
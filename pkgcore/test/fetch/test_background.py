@@ -0,0 +1,85 @@
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.fetch import errors, fetchable
+from pkgcore.fetch.background import background_fetcher
+from pkgcore.test import TestCase
+
+
+class fake_pkg(object):
+
+    repo = None
+
+    def __init__(self, name, *fetchables):
+        self.name = name
+        self.fetchables = fetchables
+
+
+class fake_fetcher(object):
+
+    def __init__(self, broken=(), blocked=()):
+        self.fetched = []
+        self.broken = broken
+        self.blocked = blocked
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, target):
+        if target.filename in self.blocked:
+            self.release.wait(5)
+        with self._lock:
+            self.fetched.append(target.filename)
+        if target.filename in self.broken:
+            raise errors.FetchFailed(target.filename, "broken")
+        return "/distdir/" + target.filename
+
+
+class fake_domain(object):
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+
+
+class TestBackgroundFetcher(TestCase):
+
+    def test_fetching(self):
+        shared = fetchable("shared.tar.gz")
+        pkgs = [fake_pkg("a", fetchable("a.tar.gz"), shared),
+                fake_pkg("b", shared, fetchable("b.tar.gz")),
+                fake_pkg("c")]
+        fetcher = fake_fetcher()
+        background = background_fetcher(fake_domain(fetcher), pkgs, threads=1)
+        background.start()
+        for pkg in pkgs:
+            self.assertEqual(background.wait(pkg), [])
+        background.shutdown()
+        # once each, in plan order.
+        self.assertEqual(fetcher.fetched,
+                         ["a.tar.gz", "shared.tar.gz", "b.tar.gz"])
+        # unknown pkgs have nothing to wait on.
+        self.assertEqual(background.wait(fake_pkg("d")), [])
+
+    def test_failures(self):
+        broken = fetchable("broken.tar.gz")
+        pkg = fake_pkg("a", broken, fetchable("a.tar.gz"))
+        background = background_fetcher(
+            fake_domain(fake_fetcher(broken=("broken.tar.gz",))), [pkg])
+        background.start()
+        failures = background.wait(pkg)
+        background.shutdown()
+        self.assertEqual([x[0] for x in failures], [broken])
+        self.assertIsInstance(failures[0][1], errors.FetchFailed)
+
+    def test_independent_waits(self):
+        # waiting on a pkg doesn't wait on the distfiles of others.
+        pkgs = [fake_pkg("a", fetchable("a.tar.gz")),
+                fake_pkg("b", fetchable("b.tar.gz"))]
+        fetcher = fake_fetcher(blocked=("a.tar.gz",))
+        background = background_fetcher(fake_domain(fetcher), pkgs, threads=2)
+        background.start()
+        self.assertEqual(background.wait(pkgs[1]), [])
+        self.assertNotIn("a.tar.gz", fetcher.fetched)
+        fetcher.release.set()
+        self.assertEqual(background.wait(pkgs[0]), [])
+        background.shutdown()
@@ -122,3 +122,30 @@ class TestFetcher(TempDirMixin, TestCase):
         self.assertEqual(self.fetcher._verify(self.fp, self.obj,
             handlers=alt_handlers), None)
         self.assertEqual(sorted(l), sorted(alt_handlers))
+
+    def test_get_paths(self):
+        class c(base.fetcher):
+            def get_path(self, fetchable):
+                if self._verify(fetchable.filename, fetchable) is None:
+                    return fetchable.filename
+        self.write_data()
+        missing = fetchable(os.path.join(self.dir, "missing"),
+                            chksums=chksums)
+        bad = os.path.join(self.dir, "bad")
+        with open(bad, "w") as f:
+            f.write(data[:-1] + "x")
+        targets = [self.obj, missing, fetchable(bad, chksums=chksums)]
+        self.assertEqual(c().get_paths(targets, threads=2),
+                         [self.fp, None, None])
+        self.assertEqual(c().get_paths([]), [])
+
+    def test_get_paths_errors(self):
+        class c(base.fetcher):
+            def get_path(self, fetchable):
+                if fetchable.filename == 'unreadable':
+                    raise IOError(13, "permission denied")
+                return fetchable.filename
+        targets = [fetchable(x, chksums=chksums)
+                   for x in ['a'] * 10 + ['unreadable'] + ['b'] * 10]
+        # errors other than fetch failures aren't swallowed.
+        self.assertRaises(IOError, c().get_paths, targets, threads=2)
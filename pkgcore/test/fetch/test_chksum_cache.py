@@ -0,0 +1,123 @@
+# License: GPL2/BSD
+
+import os
+
+from snakeoil import data_source
+from snakeoil.chksum import get_chksums, get_handlers
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fetch import base, errors, fetchable
+from pkgcore.fetch.chksum_cache import chksum_cache
+from pkgcore.test import TestCase
+
+handlers = get_handlers()
+data = 'asdf' * 4000
+
+
+class TestChksumCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.fp = os.path.join(self.dir, "distfile")
+        self.write(data)
+        self.location = os.path.join(self.dir, "cache")
+
+    def write(self, contents):
+        with open(self.fp, "w") as f:
+            f.write(contents)
+
+    def cached(self, cache):
+        return cache.get(self.fp, cache._get_entries()[self.fp][0])
+
+    def test_get_chksums(self):
+        cache = chksum_cache(self.location)
+        expected = get_chksums(self.fp, "sha256", "md5")
+        self.assertEqual(cache.get_chksums(self.fp, "sha256", "md5"), expected)
+        self.assertEqual(sorted(self.cached(cache)), ["md5", "sha256"])
+
+        # a fresh instance reads what was stored.
+        cache = chksum_cache(self.location)
+        self.assertEqual(self.cached(cache)["sha256"], expected[0])
+        # cached values are trusted as long as the file is unchanged.
+        key, chksums = cache._get_entries()[self.fp]
+        chksums["sha256"] = 1
+        self.assertEqual(cache.get_chksums(self.fp, "sha256"), [1])
+
+        # forcing reverification hashes again, and updates the cache.
+        cache.trusted = False
+        self.assertEqual(cache.get_chksums(self.fp, "sha256"), expected[:1])
+        cache.trusted = True
+        self.assertEqual(cache.get_chksums(self.fp, "sha256"), expected[:1])
+
+    def test_invalidation(self):
+        cache = chksum_cache(self.location)
+        cache.get_chksums(self.fp, "sha256")
+        self.write(data[:-1] + "x")
+        self.assertEqual(cache.get_chksums(self.fp, "sha256"),
+                         get_chksums(self.fp, "sha256"))
+        # the stale entry is replaced, on disk too.
+        cache = chksum_cache(self.location)
+        self.assertEqual(cache.get_chksums(self.fp, "sha256"),
+                         get_chksums(self.fp, "sha256"))
+
+    def test_compaction(self):
+        cache = chksum_cache(self.location)
+        for x in xrange(150):
+            cache.update(self.fp, (0, x, 0, 0.0, 0.0), {"md5": x})
+        with open(self.location) as f:
+            self.assertEqual(len(f.readlines()), 150)
+        # the file is gone as far as the cache is concerned; its entries
+        # are dropped once the cache is mostly stale.
+        chksum_cache(self.location)._get_entries()
+        with open(self.location) as f:
+            self.assertEqual(f.read(), "")
+
+    def test_unreadable(self):
+        with open(self.location, "w") as f:
+            f.write("garbage\n%s\t1\t2\n" % (self.fp,))
+        cache = chksum_cache(self.location)
+        self.assertEqual(cache.get_chksums(self.fp, "md5"),
+                         get_chksums(self.fp, "md5"))
+        self.assertTrue(self.cached(cache))
+
+    def test_unwritable(self):
+        cache = chksum_cache(os.path.join(self.dir, "missing", "cache"))
+        self.assertEqual(cache.get_chksums(self.fp, "md5"),
+                         get_chksums(self.fp, "md5"))
+        self.assertTrue(self.cached(cache))
+
+    def test_verify(self):
+        chksums = dict((chf, handlers[chf](data_source.data_source(data)))
+                       for chf in ("size", "sha256"))
+        target = fetchable(self.fp, chksums=chksums)
+        fetcher = base.fetcher()
+        fetcher.chksum_cache = chksum_cache(self.location)
+        self.assertEqual(fetcher._verify(self.fp, target), None)
+        # the cached value is used while the file is unchanged.
+        fetcher.chksum_cache._get_entries()[self.fp][1]["sha256"] = 1
+        self.assertRaises(errors.FetchFailed, fetcher._verify, self.fp, target)
+        fetcher.chksum_cache.trusted = False
+        self.assertEqual(fetcher._verify(self.fp, target), None)
+
+    def test_untrusted(self):
+        cache = chksum_cache(self.location)
+        cache.get_chksums(self.fp, "md5")
+        with open(self.location) as f:
+            stored = f.read()
+
+        def check():
+            # the cache is neither used nor added to.
+            cache = chksum_cache(self.location)
+            self.assertEqual(cache._get_entries(), {})
+            self.assertEqual(cache.get_chksums(self.fp, "md5", "sha256"),
+                             get_chksums(self.fp, "md5", "sha256"))
+            with open(self.location) as f:
+                self.assertEqual(f.read(), stored)
+
+        # a cache others can write can't vouch for anything.
+        os.chmod(self.location, 0664)
+        check()
+        os.chmod(self.location, 0644)
+        if os.getuid() == 0:
+            os.chown(self.location, 1, -1)
+            check()
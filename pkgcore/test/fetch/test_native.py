@@ -0,0 +1,254 @@
+# License: GPL2/BSD
+
+import BaseHTTPServer
+import os
+import SocketServer
+import threading
+import time
+
+from snakeoil import data_source
+from snakeoil.chksum import get_handlers
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fetch import errors, fetchable, native
+from pkgcore.test import TestCase
+
+handlers = get_handlers()
+
+
+def mk_fetchable(filename, data, uris):
+    chksums = dict((chf, handlers[chf](data_source.data_source(data)))
+                   for chf in ('size', 'sha256'))
+    return fetchable(filename, uris, chksums)
+
+
+class _handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(
+                (self.path, self.headers.get('range'), self.client_address))
+        if self.path in server.redirects:
+            self.send_response(302)
+            self.send_header('Location', server.redirects[self.path])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        delay = server.delays.get(self.path)
+        if delay:
+            time.sleep(delay)
+        start, end = 0, len(data) - 1
+        byte_range = self.headers.get('range')
+        if byte_range and server.range_delay:
+            time.sleep(server.range_delay)
+        if byte_range and server.ranges:
+            start, end = byte_range.split('=')[1].split('-')
+            start = int(start) + server.range_shift
+            end = int(end) if end else len(data) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %i-%i/%i' % (
+                start, end, len(data)))
+        else:
+            self.send_response(200)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        try:
+            self.wfile.write(data[start:end + 1])
+        except EnvironmentError:
+            # the fetcher dropped the connection.
+            pass
+
+
+class _server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _handler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.files = {}
+        self.delays = {}
+        self.redirects = {}
+        self.ranges = True
+        # added to the start of requested ranges
+        self.range_shift = 0
+        self.range_delay = 0
+
+    def uri(self, path):
+        return 'http://127.0.0.1:%i%s' % (self.server_address[1], path)
+
+
+class TestNativeFetcher(TempDirMixin, TestCase):
+
+    data = ''.join(chr(x % 251) for x in xrange(200 * 1024))
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.server = _server()
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.distdir = os.path.join(self.dir, 'distdir')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        TempDirMixin.tearDown(self)
+
+    def mk_fetcher(self, **kwds):
+        kwds.setdefault('userpriv', False)
+        kwds.setdefault('timeout', 10)
+        return native.fetcher(self.distdir, **kwds)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_fetch(self):
+        self.server.files['/foo.tar.gz'] = self.data
+        fetcher = self.mk_fetcher(segment_threshold=1024 * 1024)
+        target = mk_fetchable(
+            'foo.tar.gz', self.data, [self.server.uri('/foo.tar.gz')])
+        path = fetcher(target)
+        self.assertEqual(path, os.path.join(self.distdir, 'foo.tar.gz'))
+        self.assertEqual(self.read(path), self.data)
+        self.assertEqual(fetcher.get_path(target), path)
+        # already fetched and verified; nothing is requested.
+        fetcher(target)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connection_reuse(self):
+        for name in ('a', 'b'):
+            self.server.files['/' + name] = self.data
+        fetcher = self.mk_fetcher(segment_threshold=1024 * 1024)
+        for name in ('a', 'b'):
+            fetcher(mk_fetchable(name, self.data, [self.server.uri('/' + name)]))
+        clients = [x[2] for x in self.server.requests]
+        self.assertEqual(len(clients), 2)
+        self.assertEqual(clients[0], clients[1])
+
+    def test_resume(self):
+        self.server.files['/foo'] = self.data
+        os.mkdir(self.distdir)
+        with open(os.path.join(self.distdir, 'foo'), 'wb') as f:
+            f.write(self.data[:1000])
+        fetcher = self.mk_fetcher(segment_threshold=1024 * 1024)
+        path = fetcher(mk_fetchable('foo', self.data,
+                                    [self.server.uri('/foo')]))
+        self.assertEqual(self.read(path), self.data)
+        self.assertEqual([x[1] for x in self.server.requests],
+                         ['bytes=1000-'])
+
+    def test_resume_without_ranges(self):
+        # servers ignoring ranges send the whole file, which replaces the
+        # partial one.
+        self.server.files['/foo'] = self.data
+        self.server.ranges = False
+        os.mkdir(self.distdir)
+        with open(os.path.join(self.distdir, 'foo'), 'wb') as f:
+            f.write(self.data[:1000])
+        fetcher = self.mk_fetcher(segment_threshold=1024)
+        path = fetcher(mk_fetchable('foo', self.data,
+                                    [self.server.uri('/foo')]))
+        self.assertEqual(self.read(path), self.data)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_resume_wrong_offset(self):
+        # data from another offset than asked for isn't appended.
+        self.server.files['/foo'] = self.data
+        self.server.range_shift = 10
+        os.mkdir(self.distdir)
+        path = os.path.join(self.distdir, 'foo')
+        with open(path, 'wb') as f:
+            f.write(self.data[:1000])
+        fetcher = self.mk_fetcher(attempts=1, segment_threshold=1024 * 1024)
+        self.assertRaises(
+            errors.FetchFailed, fetcher,
+            mk_fetchable('foo', self.data, [self.server.uri('/foo')]))
+        self.assertEqual(self.read(path), self.data[:1000])
+
+    def test_segments(self):
+        self.server.files['/foo'] = self.data
+        fetcher = self.mk_fetcher(connections=4, segment_threshold=64 * 1024)
+        path = fetcher(mk_fetchable('foo', self.data,
+                                    [self.server.uri('/foo')]))
+        self.assertEqual(self.read(path), self.data)
+        ranges = sorted(x[1] for x in self.server.requests if x[1])
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(ranges), 3)
+        # no segment files are left behind.
+        self.assertEqual(
+            [x for x in os.listdir(self.distdir) if x.startswith('foo')],
+            ['foo'])
+
+    def test_segment_failure(self):
+        self.server.files['/foo'] = self.data
+        self.server.range_delay = 0.5
+        fetcher = self.mk_fetcher(
+            connections=4, segment_threshold=64 * 1024, attempts=1)
+        copy = fetcher._copy
+
+        def _copy(stream, handle, length=None, cancel=None):
+            if length is not None and cancel is None:
+                raise IOError("first segment failed")
+            return copy(stream, handle, length, cancel)
+        fetcher._copy = _copy
+        self.assertRaises(
+            errors.FetchFailed, fetcher,
+            mk_fetchable('foo', self.data, [self.server.uri('/foo')]))
+        # the other segments are done with once the fetch is.
+        time.sleep(0.7)
+        self.assertEqual(
+            [x for x in os.listdir(self.distdir) if '__segment' in x], [])
+
+    def test_race(self):
+        self.server.files['/slow/foo'] = self.data
+        self.server.files['/fast/foo'] = self.data
+        self.server.delays['/slow/foo'] = 2
+        fetcher = self.mk_fetcher(race=2, segment_threshold=1024 * 1024)
+        start = time.time()
+        path = fetcher(mk_fetchable(
+            'foo', self.data,
+            [self.server.uri('/slow/foo'), self.server.uri('/fast/foo')]))
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(self.read(path), self.data)
+
+    def test_failover(self):
+        self.server.files['/good/foo'] = self.data
+        self.server.redirects['/moved/foo'] = '/good/foo'
+        fetcher = self.mk_fetcher(race=1, segment_threshold=1024 * 1024)
+        path = fetcher(mk_fetchable(
+            'foo', self.data,
+            [self.server.uri('/missing/foo'), self.server.uri('/moved/foo')]))
+        self.assertEqual(self.read(path), self.data)
+        self.assertEqual([x[0] for x in self.server.requests],
+                         ['/missing/foo', '/moved/foo', '/good/foo'])
+
+    def test_failures(self):
+        fetcher = self.mk_fetcher(race=1)
+        self.assertRaises(
+            errors.FetchFailed, fetcher,
+            mk_fetchable('foo', self.data, [self.server.uri('/missing/foo')]))
+
+        # corrupt data fails verification, and isn't kept.
+        self.server.files['/foo'] = self.data[:-1] + 'x'
+        fetcher = self.mk_fetcher(race=1, attempts=2)
+        self.assertRaises(
+            errors.FetchFailed, fetcher,
+            mk_fetchable('foo', self.data, [self.server.uri('/foo')] * 3))
+        self.assertEqual(len(self.server.requests), 3)
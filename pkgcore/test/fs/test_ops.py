@@ -1,10 +1,11 @@
 # Copyright: 2006 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+import errno
 import os
 import shutil
 
-from snakeoil.data_source import local_source
+from snakeoil.data_source import data_source, local_source
 from snakeoil.osutils import pjoin
 from snakeoil.test.mixins import TempDirMixin
 
@@ -81,6 +82,39 @@ class TestCopyFile(VerifyMixin, TempDirMixin, TestCase):
             self.assertEqual("asdf\n" * 10, f.read())
         self.verify(o, kwds, os.stat(o.location))
 
+    def test_transformed_source(self):
+        # sources with a path that transform its data aren't reflinked.
+        raw = pjoin(self.dir, "raw")
+        with open(raw, "w") as f:
+            f.write("raw")
+
+        class transformed_source(data_source):
+            path = raw
+            def transfer_to_path(self, path):
+                with open(path, "w") as f:
+                    f.write(self.data)
+
+        class fake_fcntl(object):
+            # reflinks regardless of the filesystem.
+            @staticmethod
+            def ioctl(trg, request, src):
+                os.write(trg, os.read(src, 1024))
+
+        dest = pjoin(self.dir, "dest")
+        orig_fcntl, orig_ficlone = ops.fcntl, ops._FICLONE
+        ops.fcntl, ops._FICLONE = fake_fcntl, 1
+        try:
+            for source, expected in ((transformed_source("decoded"), "decoded"),
+                                     (local_source(raw), "raw")):
+                o = fs.fsFile(dest, mtime=10321, uid=os.getuid(),
+                              gid=os.getgid(), mode=0644, data=source,
+                              dev=None, inode=None)
+                self.assertTrue(ops.default_copyfile(o))
+                with open(dest, "r") as f:
+                    self.assertEqual(expected, f.read())
+        finally:
+            ops.fcntl, ops._FICLONE = orig_fcntl, orig_ficlone
+
     def test_sym_perms(self):
         curgid = os.getgid()
         group = [x for x in os.getgroups() if x != curgid]
@@ -158,12 +192,12 @@ class ContentsMixin(VerifyMixin, TempDirMixin, TestCase):
 
 class Test_merge_contents(ContentsMixin):
 
-    def generic_merge_bits(self, entries):
+    def generic_merge_bits(self, entries, threads=1):
         src = self.gen_dir("src")
         self.generate_tree(src, entries)
         cset = livefs.scan(src, offset=src)
         dest = self.gen_dir("dest")
-        self.assertTrue(ops.merge_contents(cset, offset=dest))
+        self.assertTrue(ops.merge_contents(cset, offset=dest, threads=threads))
         self.assertEqual(livefs.scan(src, offset=src),
             livefs.scan(dest, offset=dest))
         return src, dest, cset
@@ -181,6 +215,98 @@ class Test_merge_contents(ContentsMixin):
             ops.merge_contents(cset, offset=dest, callback=s.remove)
             self.assertFalse(s)
 
+    def test_threads(self):
+        for attr in dir(self):
+            if not attr.startswith('entries') or 'fail' in attr:
+                continue
+            e = getattr(self, attr)
+            if not isinstance(e, dict):
+                continue
+            src, dest, cset = self.generic_merge_bits(e, threads=4)
+            # overwriting, reporting every entry in order.
+            l = []
+            ops.merge_contents(cset, offset=dest, callback=l.append, threads=4)
+            self.assertEqual(
+                l, sorted(contents.offset_rewriter(dest, cset.iterdirs())) +
+                list(contents.offset_rewriter(dest, cset.iterdirs(invert=True))))
+
+    def test_threaded_hardlinks(self):
+        src = self.gen_dir("src")
+        for x in xrange(10):
+            with open(pjoin(src, "file%i" % x), "w") as f:
+                f.write("data%i" % x)
+        os.link(pjoin(src, "file0"), pjoin(src, "link"))
+        cset = livefs.scan(src, offset=src)
+        dest = self.gen_dir("dest")
+        self.assertTrue(ops.merge_contents(cset, offset=dest, threads=4))
+        self.assertEqual(livefs.scan(src, offset=src),
+                         livefs.scan(dest, offset=dest))
+        self.assertEqual(os.stat(pjoin(dest, "file0")).st_ino,
+                         os.stat(pjoin(dest, "link")).st_ino)
+
+    def test_threaded_failure(self):
+        src = self.gen_dir("src")
+        self.generate_tree(src, self.entries_norm1)
+        cset = livefs.scan(src, offset=src)
+        dest = self.gen_dir("dest")
+        def copyfile(obj, mkdirs=False):
+            raise OSError(errno.EACCES, "denied", obj.location)
+        orig = ops.get_plugin
+        ops.get_plugin = lambda key: copyfile if key == "fs_ops.copyfile" \
+            else orig(key)
+        try:
+            self.assertRaises(OSError, ops.merge_contents, cset,
+                              offset=dest, threads=4)
+        finally:
+            ops.get_plugin = orig
+
+    def test_relocate(self):
+        for threads in (1, 4):
+            src = self.gen_dir("src")
+            self.generate_tree(src, self.entries_norm1)
+            dest = self.gen_dir("dest")
+            os.mkdir(pjoin(dest, "dir"))
+            with open(pjoin(dest, "dir", "file2"), "w") as f:
+                f.write("old")
+            cset = livefs.scan(src, offset=src)
+            self.assertTrue(ops.merge_contents(
+                cset, offset=dest, threads=threads, relocate=[src]))
+            self.assertEqual(livefs.scan(src, offset=src),
+                             livefs.scan(dest, offset=dest))
+            for path in ("file1", "dir/file2"):
+                self.assertEqual(os.stat(pjoin(src, path)).st_ino,
+                                 os.stat(pjoin(dest, path)).st_ino)
+            self.assertFalse(os.path.exists(pjoin(dest, "dir", "file2#new")))
+
+            # only data from the given directories is linked.
+            dest = self.gen_dir("dest")
+            self.assertTrue(ops.merge_contents(
+                cset, offset=dest, threads=threads, relocate=[src + "x"]))
+            self.assertNotEqual(os.stat(pjoin(src, "file1")).st_ino,
+                                os.stat(pjoin(dest, "file1")).st_ino)
+
+    def test_relocate_shared_inode(self):
+        for threads in (1, 4):
+            src = self.gen_dir("src")
+            with open(pjoin(src, "a"), "w") as f:
+                f.write("data")
+            os.link(pjoin(src, "a"), pjoin(src, "b"))
+            cset = livefs.scan(src, offset=src)
+            # b can't be hardlinked to a, having been given another mode.
+            b = cset["/b"].change_attributes(mode=0600)
+            cset.update([b])
+            dest = self.gen_dir("dest")
+            self.assertTrue(ops.merge_contents(
+                cset, offset=dest, threads=threads, relocate=[src]))
+            # one is relocated, the other copied; neither gets the
+            # attributes of the other.
+            inodes = set(os.stat(pjoin(dest, x)).st_ino for x in "ab")
+            self.assertEqual(len(inodes), 2)
+            self.assertIn(os.stat(pjoin(src, "a")).st_ino, inodes)
+            self.assertEqual(os.stat(pjoin(dest, "a")).st_mode & 07777,
+                             cset["/a"].mode)
+            self.assertEqual(os.stat(pjoin(dest, "b")).st_mode & 07777, 0600)
+
     def test_dangling_symlink(self):
         src = self.gen_dir("src")
         self.generate_tree(src, {"dir":["dir"]})
@@ -251,3 +377,33 @@ class Test_unmerge_contents(ContentsMixin):
         open(fp, "w").close()
         self.assertTrue(ops.unmerge_contents(cset, offset=img))
         self.assertTrue(os.path.exists(fp))
+
+    def test_threads(self):
+        for attr in dir(self):
+            if not attr.startswith('entries') or 'fail' in attr:
+                continue
+            e = getattr(self, attr)
+            if not isinstance(e, dict):
+                continue
+            img, cset = self.generic_unmerge_bits(e, img=attr)
+            s = set(contents.offset_rewriter(img, cset))
+            self.assertTrue(ops.unmerge_contents(
+                cset, offset=img, callback=s.remove, threads=4))
+            self.assertFalse(s, s)
+            self.assertFalse(livefs.scan(img, offset=img))
+
+    def test_threaded_lingering_file(self):
+        img, cset = self.generic_unmerge_bits(self.entries_norm1)
+        dirs = sorted(k for k, v in self.entries_norm1.iteritems()
+                      if v[0] == "dir")
+        fp = os.path.join(img, dirs[-1], "linger")
+        open(fp, "w").close()
+        removed = []
+        self.assertTrue(ops.unmerge_contents(
+            cset, offset=img, callback=removed.append, threads=4))
+        self.assertTrue(os.path.exists(fp))
+        # the directories holding it are kept, and not reported.
+        for d in ("dir", "dir/subdir"):
+            path = os.path.join(img, d)
+            self.assertTrue(os.path.isdir(path))
+            self.assertNotIn(path, [x.location for x in removed])
@@ -2,6 +2,7 @@
 # License: GPL2/BSD
 
 import os
+import threading
 
 from snakeoil.osutils import pjoin
 from snakeoil.test.mixins import tempdir_decorator
@@ -11,7 +12,7 @@ from pkgcore.fs.contents import contentsSet
 from pkgcore.merge import engine
 from pkgcore.test import TestCase
 from pkgcore.test.fs.fs_util import fsFile, fsDir, fsSymlink
-from pkgcore.test.merge.util import fake_engine
+from pkgcore.test.merge.util import fake_engine, fake_trigger
 
 
 class fake_pkg(object):
@@ -129,3 +130,106 @@ class Test_MergeEngineCsets(TestCase):
         generated = self.run_cset('_get_livefs_intersect_cset', engine,
             'test')
         self.assertEqual(generated, existent)
+
+
+class Test_MergeEngineTriggers(TestCase):
+
+    def mk_engine(self, parallelism=4):
+        o = engine.MergeEngine.install(
+            None, fake_pkg(contentsSet()), disable_plugins=True)
+        if parallelism is not None:
+            o.parallelism = parallelism
+        return o
+
+    def mk_trigger(self, label, reads=('new_cset',), writes=(), **kwargs):
+        return fake_trigger(_label=label, _hooks=('pre_merge',),
+                            required_csets=reads, modified_csets=writes,
+                            **kwargs)
+
+    def test_trigger_waves(self):
+        o = self.mk_engine()
+        r1, r2 = self.mk_trigger('r1'), self.mk_trigger('r2')
+        w = self.mk_trigger('w', writes=('new_cset',))
+        # install is an alias of new_cset.
+        alias = self.mk_trigger('alias', reads=('install',))
+        # derived from new_cset, so it waits on what writes to any cset.
+        derived = self.mk_trigger('derived', reads=('resolved_install',))
+        self.assertEqual(
+            o._trigger_waves([r1, r2, w, alias, derived]),
+            [[r1, r2], [w], [alias, derived]])
+        self.assertEqual(o._trigger_waves([derived, r1]), [[derived, r1]])
+
+        # undeclared, or requiring every cset, runs alone.
+        for kwargs in (dict(writes=None), dict(reads=None)):
+            t = self.mk_trigger('alone', **kwargs)
+            self.assertEqual(o._trigger_waves([r1, t, r2]), [[r1], [t], [r2]])
+
+        # modified csets may depend on the mode, like required ones.
+        t = self.mk_trigger('mode', writes={o.mode: ('install',)})
+        self.assertEqual(o._trigger_waves([r1, t]), [[r1], [t]])
+        t = self.mk_trigger('mode', writes={None: ('install',)})
+        self.assertEqual(o._trigger_waves([r1, t]), [[r1], [t]])
+
+    def test_concurrency(self):
+        events = {}
+        lock = threading.Lock()
+        log = []
+        timeout = [5]
+
+        def wait_on(label, other):
+            def f(self, engine, cset):
+                with lock:
+                    log.append(label)
+                events.setdefault(label, threading.Event()).set()
+                # only succeeds if the trigger waited on runs concurrently.
+                if not events.setdefault(other, threading.Event()).wait(
+                        timeout[0]):
+                    raise AssertionError("%s didn't run concurrently" % other)
+            return f
+
+        def record(self, engine, cset):
+            with lock:
+                log.append(self.label)
+
+        # engines are serial unless told otherwise.
+        for parallelism in (None, 4):
+            events.clear()
+            del log[:]
+            o = self.mk_engine(parallelism)
+            triggers = [
+                self.mk_trigger('r1', trigger=wait_on('r1', 'r2')),
+                self.mk_trigger('r2', trigger=wait_on('r2', 'r1')),
+                self.mk_trigger('w', writes=('new_cset',), trigger=record),
+                self.mk_trigger('early', priority=10, trigger=record),
+            ]
+            for t in triggers:
+                t.suppress_exceptions = False
+                t.register(o)
+            if parallelism is None:
+                self.assertEqual(o.parallelism, 1)
+                # serially, the first never sees the second start.
+                timeout[0] = 0.1
+                self.assertRaises(AssertionError, o.pre_merge)
+                timeout[0] = 5
+                continue
+            o.pre_merge()
+            self.assertEqual(log[0], 'early')
+            self.assertEqual(sorted(log[1:3]), ['r1', 'r2'])
+            self.assertEqual(log[3:], ['w'])
+
+    def test_failures(self):
+        o = self.mk_engine()
+        def fail(self, engine, cset):
+            raise ValueError(self.label)
+        l = [self.mk_trigger(str(x), trigger=fail) for x in xrange(3)]
+        l[1].suppress_exceptions = False
+        l[2].suppress_exceptions = False
+        for t in l:
+            t.register(o)
+        try:
+            o.pre_merge()
+        except ValueError as e:
+            # the first failure serially is raised.
+            self.assertEqual(str(e), '1')
+        else:
+            self.fail("no exception was raised")
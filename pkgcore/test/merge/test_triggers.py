@@ -457,6 +457,110 @@ END-INFO-DIR-ENTRY
         self.assertFalse(self.run_trigger('post_unmerge', [self.dir]))
 
 
+class Test_trigger_session(mixins.TempDirMixin, TestCase):
+
+    def mk_engine(self, session, **kwargs):
+        kwargs.setdefault('offset', self.dir)
+        return fake_engine(mode=const.INSTALL_MODE, trigger_session=session,
+                           **kwargs)
+
+    def mk_trigger(self, **kwargs):
+        kwargs.setdefault('deferrable', True)
+        return fake_trigger(required_csets=(), **kwargs)
+
+    def merge(self, engine, *triggers):
+        for phase in ('pre_merge', 'post_merge'):
+            engine.phase = phase
+            for trigger in triggers:
+                trigger(engine, {})
+
+    def test_defer(self):
+        session = triggers.trigger_session()
+        # triggers are reinstantiated per merge; the first one collects
+        # the state, and is the one run.
+        l = [self.mk_trigger(_label='foo') for x in xrange(3)]
+        engines = [self.mk_engine(session) for x in l]
+        for engine, trigger in zip(engines, l):
+            self.merge(engine, trigger)
+        self.assertEqual(l[0]._called, [(engines[0],)])
+        self.assertFalse(l[1]._called)
+        self.assertFalse(l[2]._called)
+        self.assertTrue(session)
+
+        session.sync()
+        self.assertFalse(session)
+        self.assertEqual(len(l[0]._called), 2)
+        engine = l[0]._called[1][0]
+        self.assertEqual(engine.phase, 'sync')
+        self.assertEqual(engine.offset, self.dir)
+
+        # state is collected anew after a sync.
+        self.merge(engines[1], l[1])
+        self.assertEqual(l[1]._called, [(engines[1],)])
+        session.sync()
+        self.assertEqual(len(l[1]._called), 2)
+        # nothing pending, nothing run.
+        session.sync()
+        self.assertEqual(len(l[1]._called), 2)
+
+    def test_nondeferrable(self):
+        session = triggers.trigger_session()
+        trigger = self.mk_trigger(deferrable=False)
+        engine = self.mk_engine(session)
+        self.merge(engine, trigger)
+        self.assertEqual(trigger._called, [(engine,), (engine,)])
+        self.assertFalse(session)
+
+    def test_sync_order(self):
+        session = triggers.trigger_session()
+        order = []
+        l = [self.mk_trigger(_label=str(x), priority=x,
+                             trigger=lambda self, engine: order.append(self))
+             for x in (10, 5, 20)]
+        for offset in ('/', self.dir):
+            engine = self.mk_engine(session, offset=offset)
+            engine.phase = 'post_merge'
+            for trigger in l:
+                trigger(engine, {})
+        session.sync()
+        self.assertEqual([x.priority for x in order], [5, 5, 10, 10, 20, 20])
+
+    def test_failures(self):
+        session = triggers.trigger_session()
+        warnings = []
+        class observer(object):
+            warn = staticmethod(warnings.append)
+            def trigger_start(self, hook, trigger):
+                pass
+            trigger_end = trigger_start
+
+        def fail(self, engine):
+            raise ValueError("foon")
+
+        trigger = self.mk_trigger(trigger=fail)
+        engine = self.mk_engine(session, observer=observer())
+        engine.phase = 'post_merge'
+        trigger(engine, {})
+        session.sync()
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('foon', warnings[0])
+
+        trigger = self.mk_trigger(trigger=fail, suppress_exceptions=False)
+        trigger(engine, {})
+        self.assertRaises(ValueError, session.sync)
+
+    def test_ldconfig(self):
+        session = triggers.trigger_session()
+        kls = castrate_trigger(triggers.ldconfig)
+        l = [kls() for x in xrange(3)]
+        for trigger in l:
+            self.merge(self.mk_engine(session), trigger)
+        self.assertFalse(any(x._passed_in_args for x in l))
+        session.sync()
+        self.assertEqual(len(l[0]._passed_in_args), 1)
+        self.assertEqual(l[0]._passed_in_args[0][0].offset, self.dir)
+
+
 class single_attr_change_base(object):
 
     kls = triggers.fix_uid_perms
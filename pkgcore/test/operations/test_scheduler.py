@@ -0,0 +1,196 @@
+# License: GPL2/BSD
+
+from io import BytesIO
+import threading
+
+from snakeoil.formatters import PlainTextFormatter
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.operations.scheduler import merge_scheduler
+from pkgcore.resolver import plan
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_sat import mk_repo
+
+
+class fake_buildop(object):
+
+    def __init__(self, domain, pkg):
+        self.domain = domain
+        self.pkg = pkg
+
+    def finalize(self):
+        cpv = self.pkg.cpvstr
+        self.domain.event('build', cpv)
+        self.domain.started(cpv).set()
+        waits = self.domain.waits.get(cpv)
+        if waits is not None:
+            # only succeeds if the job waited on runs concurrently.
+            if not self.domain.started(waits).wait(5):
+                return False
+        if cpv in self.domain.broken:
+            return False
+        return self.pkg
+
+    def cleanup(self):
+        pass
+
+
+class fake_ops(object):
+
+    def __init__(self, domain, pkg):
+        self.domain = domain
+        self.pkg = pkg
+
+    def run_if_supported(self, name, or_return=None):
+        if name == 'fetch':
+            self.domain.event('fetch', self.pkg.cpvstr)
+            return True
+        elif name == 'build':
+            return fake_buildop(self.domain, self.pkg)
+        return or_return
+
+
+class fake_merge(object):
+
+    def __init__(self, domain, desc, pkg):
+        self.domain = domain
+        self.desc = desc
+        self.pkg = pkg
+
+    def finish(self):
+        self.domain.event(self.desc, self.pkg.cpvstr)
+        if self.domain.trigger_session is not None:
+            self.domain.trigger_session.pending = True
+        return True
+
+
+class fake_session(object):
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.pending = False
+
+    def __nonzero__(self):
+        return self.pending
+
+    def sync(self):
+        self.domain.event('sync')
+        self.pending = False
+
+
+class fake_domain(object):
+
+    def __init__(self, broken=(), waits={}):
+        self.events = []
+        self.broken = broken
+        self.waits = waits
+        self._started = {}
+        self._lock = threading.Lock()
+        self.trigger_session = None
+
+    def event(self, *args):
+        with self._lock:
+            self.events.append(args)
+
+    def started(self, cpv):
+        with self._lock:
+            return self._started.setdefault(cpv, threading.Event())
+
+    def pkg_operations(self, pkg, observer=None):
+        return fake_ops(self, pkg)
+
+    def install_pkg(self, pkg, observer):
+        return fake_merge(self, 'install', pkg)
+
+    def replace_pkg(self, old_pkg, pkg, observer):
+        return fake_merge(self, 'replace', pkg)
+
+    def uninstall_pkg(self, pkg, observer):
+        return fake_merge(self, 'uninstall', pkg)
+
+
+class TestMergeScheduler(TestCase):
+
+    def run_plan(self, pkgs, targets, jobs=2, **kwds):
+        resolver = plan.merge_plan(
+            [mk_repo(pkgs), mk_repo({}, livefs=True)], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        self.assertFalse(resolver.add_atoms([atom(x) for x in targets]))
+        domain = fake_domain(kwds.pop('broken', ()), kwds.pop('waits', {}))
+        if kwds.pop('trigger_session', False):
+            domain.trigger_session = fake_session(domain)
+        self.merged = []
+        scheduler = merge_scheduler(
+            domain, resolver.state.dag(), PlainTextFormatter(BytesIO()),
+            jobs=jobs, merged=self.merged.append, **kwds)
+        return scheduler, scheduler.run(), domain.events
+
+    def position(self, events, *event):
+        return events.index(event)
+
+    def test_concurrency(self):
+        # b and c only finish building when built concurrently.
+        scheduler, ret, events = self.run_plan({
+            'app/a-1': {'DEPEND': 'dev/b dev/c'},
+            'dev/b-1': {}, 'dev/c-1': {},
+        }, ['app/a'], waits={'dev/b-1': 'dev/c-1', 'dev/c-1': 'dev/b-1'})
+        self.assertTrue(ret)
+        self.assertEqual(scheduler.failed, [])
+        for dep in ('dev/b-1', 'dev/c-1'):
+            self.assertTrue(self.position(events, 'install', dep) <
+                            self.position(events, 'build', 'app/a-1'))
+        self.assertEqual(events[-1], ('install', 'app/a-1'))
+        self.assertEqual(sorted(op.pkg.cpvstr for op in self.merged),
+                         ['app/a-1', 'dev/b-1', 'dev/c-1'])
+
+    def test_runtime_deps(self):
+        scheduler, ret, events = self.run_plan({
+            'app/a-1': {'RDEPEND': 'dev/b'}, 'dev/b-1': {},
+        }, ['app/a'])
+        self.assertTrue(ret)
+        self.assertTrue(self.position(events, 'install', 'dev/b-1') <
+                        self.position(events, 'install', 'app/a-1'))
+
+    def test_serial(self):
+        scheduler, ret, events = self.run_plan({
+            'app/a-1': {'DEPEND': 'dev/b'}, 'dev/b-1': {},
+        }, ['app/a'], jobs=1)
+        self.assertTrue(ret)
+        self.assertEqual([x[0] for x in events],
+                         ['fetch', 'build', 'install'] * 2)
+
+    def test_trigger_session(self):
+        # deferred triggers are run before a build needing the merges.
+        scheduler, ret, events = self.run_plan({
+            'app/a-1': {'DEPEND': 'dev/b'}, 'dev/b-1': {},
+        }, ['app/a'], jobs=1, trigger_session=True)
+        self.assertTrue(ret)
+        self.assertEqual([x[0] for x in events],
+                         ['fetch', 'build', 'install', 'sync', 'fetch',
+                          'build', 'install'])
+
+    def test_failures(self):
+        pkgs = {'app/a-1': {'DEPEND': 'dev/b dev/c'},
+                'dev/b-1': {}, 'dev/c-1': {}}
+        scheduler, ret, events = self.run_plan(
+            pkgs, ['app/a'], broken=('dev/c-1',))
+        self.assertFalse(ret)
+        self.assertEqual([op.pkg.cpvstr for op in scheduler.failed],
+                         ['dev/c-1'])
+        self.assertNotIn(('build', 'app/a-1'), events)
+
+        scheduler, ret, events = self.run_plan(
+            pkgs, ['app/a'], broken=('dev/c-1',), ignore_failures=True)
+        self.assertTrue(ret)
+        self.assertEqual([op.pkg.cpvstr for op in scheduler.failed],
+                         ['dev/c-1'])
+        self.assertIn(('install', 'app/a-1'), events)
+
+    def test_fetchonly(self):
+        scheduler, ret, events = self.run_plan({
+            'app/a-1': {'DEPEND': 'dev/b'}, 'dev/b-1': {},
+        }, ['app/a'], fetchonly=True)
+        self.assertTrue(ret)
+        self.assertEqual(sorted(events),
+                         [('fetch', 'app/a-1'), ('fetch', 'dev/b-1')])
+        self.assertEqual(self.merged, [])
@@ -4,6 +4,7 @@
 from snakeoil.currying import partial
 from snakeoil.mappings import OrderedDict
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.repository.multiplex import tree
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values
@@ -63,6 +64,19 @@ class TestMultiplex(TestCase):
             self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)),
             rev_sorted(self.tree1_list + self.tree2_list))
 
+    def test_itermatch_many(self):
+        p = packages.PackageRestriction("package",
+            values.StrExactMatch("diffball"))
+        restricts = [atom("dev-util/diffball"), atom("dev-lib/fake"), p,
+            atom("dev-util/monkeys_rule")]
+        self.assertEqual(
+            [[x.cpvstr for x in l] for l in
+                self.ctree.itermatch_many(restricts, sorter=rev_sorted)],
+            [[x.cpvstr for x in self.ctree.itermatch(r, sorter=rev_sorted)]
+                for r in restricts])
+        self.assertEqual(self.kls().itermatch_many(restricts),
+            [[], [], [], []])
+
     def test_install(self):
         raise Exception()
     test_install.todo = "need to implement tests for multiplexing down repo_ops"
@@ -166,6 +166,36 @@ class TestPrototype(TestCase):
                     "dev-util/bsdiff-0.4.1", "dev-util/bsdiff-0.4.2",
                     "dev-lib/fake-1.0", "dev-lib/fake-1.0-r1")))
 
+    def test_itermatch_many(self):
+        self.assertRaises(TypeError, self.repo.itermatch_many, ["asdf"])
+        restricts = [
+            atom("dev-util/diffball"),
+            atom("=dev-util/diffball-1.0"),
+            atom("dev-util/monkeys_rule"),
+            packages.KeyedAndRestriction(
+                packages.PackageRestriction("fullver",
+                    values.StrExactMatch("0.4.1")), key="dev-util/bsdiff"),
+            packages.PackageRestriction("category",
+                values.StrExactMatch("dev-lib")),
+            ]
+        for kwds in ({}, {"sorter":sorted},
+                     {"pkg_klass_override":partial(MutatedPkg, overrides={})}):
+            self.assertEqual(
+                self.repo.itermatch_many(restricts, **kwds),
+                [list(self.repo.itermatch(r, **kwds)) for r in restricts])
+        self.assertEqual(self.repo.itermatch_many([]), [])
+
+        # each package key's versions should only be instantiated once.
+        l = []
+        def pkg_klass_override(pkg):
+            l.append(pkg)
+            return pkg
+        self.repo.itermatch_many(
+            [atom("dev-util/diffball"), atom("=dev-util/diffball-1.0"),
+             atom("<dev-util/diffball-1.0")],
+            pkg_klass_override=pkg_klass_override)
+        self.assertEqual(len(l), 2)
+
     def test_notify_remove(self):
         pkg = versioned_CPV("dev-util/diffball-1.0")
         self.repo.notify_remove_package(pkg)
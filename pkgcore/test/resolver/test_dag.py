@@ -0,0 +1,103 @@
+# License: GPL2/BSD
+
+import json
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import plan
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_sat import mk_repo
+
+
+class TestPlanDag(TestCase):
+
+    def resolve(self, pkgs, targets, installed={}):
+        resolver = plan.merge_plan(
+            [mk_repo(pkgs), mk_repo(installed, livefs=True)],
+            plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        self.assertFalse(resolver.add_atoms([atom(x) for x in targets]))
+        dag = resolver.state.dag()
+        self.ops = dict((op.pkg.cpvstr, op) for op in dag)
+        return dag
+
+    def names(self, ops):
+        return sorted(op.pkg.cpvstr for op in ops)
+
+    def test_edges(self):
+        dag = self.resolve({
+            'app/a-1': {'DEPEND': 'dev/b', 'RDEPEND': 'dev/c',
+                        'PDEPEND': 'dev/d'},
+            'dev/b-1': {}, 'dev/c-1': {}, 'dev/d-1': {'RDEPEND': 'app/a'},
+        }, ['app/a'])
+        self.assertEqual(len(dag), 4)
+        a = self.ops['app/a-1']
+        self.assertEqual(
+            sorted((dep.pkg.cpvstr, kind) for dep, kind in dag.edges[a]),
+            [('dev/b-1', 'build'), ('dev/c-1', 'runtime'),
+             ('dev/d-1', 'post')])
+        self.assertEqual(self.names(dag.dependencies(a, ('build',))),
+                         ['dev/b-1'])
+        self.assertEqual(self.names(dag.dependents(self.ops['dev/b-1'])),
+                         ['app/a-1'])
+        self.assertEqual(self.names(dag.prerequisites(a)),
+                         ['dev/b-1', 'dev/c-1'])
+        self.assertEqual(self.names(dag.prerequisites(a, ('build',))),
+                         ['dev/b-1'])
+
+        levels = [self.names(level) for level in dag.levels()]
+        self.assertEqual(levels, [['dev/b-1', 'dev/c-1'],
+                                  ['app/a-1'], ['dev/d-1']])
+
+    def test_installed_deps(self):
+        # the installed dev/b pulls dev/c in at runtime.
+        dag = self.resolve(
+            {'app/a-1': {'DEPEND': 'dev/b'}, 'dev/b-1': {'RDEPEND': 'dev/c'},
+             'dev/c-1': {}},
+            ['app/a'], installed={'dev/b-1': {'RDEPEND': 'dev/c'}})
+        self.assertEqual(sorted(self.ops), ['app/a-1', 'dev/c-1'])
+        self.assertEqual(
+            [(dep.pkg.cpvstr, kind) for dep, kind
+             in dag.edges[self.ops['app/a-1']]],
+            [('dev/c-1', 'build')])
+
+    def test_critical_path(self):
+        dag = self.resolve({
+            'app/a-1': {'DEPEND': 'dev/b dev/c'},
+            'dev/b-1': {'DEPEND': 'dev/d'},
+            'dev/c-1': {}, 'dev/d-1': {},
+        }, ['app/a'])
+        total, path = dag.critical_path()
+        self.assertEqual(total, 3)
+        self.assertEqual([op.pkg.cpvstr for op in path],
+                         ['dev/d-1', 'dev/b-1', 'app/a-1'])
+
+        costs = {'dev/c-1': 10}
+        total, path = dag.critical_path(
+            lambda op: costs.get(op.pkg.cpvstr, 1))
+        self.assertEqual(total, 11)
+        self.assertEqual([op.pkg.cpvstr for op in path],
+                         ['dev/c-1', 'app/a-1'])
+
+    def test_cycle(self):
+        dag = self.resolve({
+            'dev/a-1': {'RDEPEND': 'dev/b'}, 'dev/b-1': {'RDEPEND': 'dev/a'},
+        }, ['dev/a'])
+        self.assertEqual(len(dag.levels()), 2)
+        self.assertEqual(dag.critical_path()[0], 2)
+
+    def test_to_dict(self):
+        dag = self.resolve({
+            'app/a-1': {'DEPEND': 'dev/b'}, 'dev/b-1': {},
+        }, ['app/a'])
+        d = json.loads(json.dumps(dag.to_dict()))
+        names = [node['pkg'] for node in d['nodes']]
+        a, b = names.index('app/a-1'), names.index('dev/b-1')
+        self.assertEqual(d['edges'], [[a, b, 'build']])
+        self.assertEqual(d['levels'], [[b], [a]])
+        self.assertEqual(d['critical_path'], {'cost': 2, 'ops': [b, a]})
+        self.assertEqual(d['nodes'][a]['level'], 1)
+
+    def test_empty(self):
+        dag = self.resolve({}, [], installed={})
+        self.assertEqual(dag.levels(), [])
+        self.assertEqual(dag.critical_path(), (0, ()))
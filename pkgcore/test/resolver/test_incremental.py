@@ -0,0 +1,112 @@
+# License: GPL2/BSD
+
+import os
+import shutil
+import tempfile
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import incremental, plan
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_sat import mk_repo
+
+
+class TestResolutionState(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'state')
+        self.installed = {'dev-util/a-1': {'RDEPEND': 'dev-libs/x'},
+                          'dev-libs/x-1': {}}
+        self.vdb = mk_repo(self.installed, livefs=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def resolve(self, pkgs, atoms, context='ctx'):
+        resolver = plan.merge_plan(
+            [mk_repo(pkgs), self.vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        state = incremental.resolution_state(self.path, context)
+        self.assertFalse(state.add_atoms(resolver, atoms))
+        return state, sorted(op.pkg.cpvstr for op in resolver.state.iter_ops())
+
+    def test_reuse(self):
+        atoms = [atom('dev-util/a'), atom('dev-util/b')]
+        pkgs = dict(self.installed)
+        pkgs['dev-util/b-1'] = {}
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, ())
+        self.assertEqual(ops, ['dev-util/b-1'])
+
+        # a resolved to nothing to merge, b didn't.
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, (atoms[0],))
+        self.assertEqual(ops, ['dev-util/b-1'])
+
+        # other resolver configurations don't share the state.
+        state, ops = self.resolve(pkgs, atoms, context='other')
+        self.assertEqual(state.skipped, ())
+
+    def test_invalidation(self):
+        atoms = [atom('dev-util/a')]
+        self.resolve(self.installed, atoms)
+        # a dependency gained a version.
+        pkgs = dict(self.installed)
+        pkgs['dev-libs/x-2'] = {}
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, ())
+        self.assertEqual(ops, ['dev-libs/x-2'])
+        state, ops = self.resolve(self.installed, atoms)
+        self.assertEqual(state.skipped, ())
+        state, ops = self.resolve(self.installed, atoms)
+        self.assertEqual(state.skipped, tuple(atoms))
+
+    def test_overlapping_changes(self):
+        atoms = [atom('dev-util/a'), atom('dev-util/c')]
+        pkgs = dict(self.installed)
+        pkgs['dev-util/c-1'] = {}
+        state, ops = self.resolve(pkgs, atoms[:1])
+        # pretend a's resolution involved c; merging c then invalidates it.
+        resolver = plan.merge_plan(
+            [mk_repo(pkgs), self.vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        state._targets[str(atoms[0])]['dev-util/c'] = \
+            state.fingerprint(resolver, 'dev-util/c')
+        state.flush()
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, ())
+        self.assertEqual(ops, ['dev-util/c-1'])
+        state, ops = self.resolve(pkgs, atoms[:1])
+        self.assertEqual(state.skipped, tuple(atoms[:1]))
+
+    def test_corrupted(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        state, ops = self.resolve(self.installed, [atom('dev-util/a')])
+        self.assertEqual(state.skipped, ())
+        state, ops = self.resolve(self.installed, [atom('dev-util/a')])
+        self.assertEqual(len(state.skipped), 1)
+
+    def test_dependency_changes(self):
+        atoms = [atom('dev-util/a')]
+        pkgs = dict(self.installed)
+        pkgs['dev-libs/x-2'] = {'RDEPEND': 'dev-libs/missing'}
+        pkgs['dev-libs/x-0'] = {}
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(ops, [])
+        # only candidates preferred over the chosen x-1 are recorded.
+        self.assertEqual(
+            [fp[0] for fp in state._targets['dev-util/a']['dev-libs/x'][1]],
+            ['dev-libs/x-2', 'dev-libs/x-1'])
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, tuple(atoms))
+        del pkgs['dev-libs/x-0']
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, tuple(atoms))
+
+        # x-2's dependencies changed without a new version or ebuild mtime,
+        # as an eclass change does.
+        pkgs['dev-libs/x-2'] = {}
+        state, ops = self.resolve(pkgs, atoms)
+        self.assertEqual(state.skipped, ())
+        self.assertEqual(ops, ['dev-libs/x-2'])
@@ -0,0 +1,137 @@
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import parallel, plan
+from pkgcore.resolver.prefetch import metadata_prefetcher
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_sat import mk_repo
+
+
+class TestParallel(TestCase):
+
+    def setUp(self):
+        self.repo = mk_repo({
+            'dev-util/a-1': {'RDEPEND': 'dev-libs/x'},
+            'dev-util/b-1': {'RDEPEND': 'dev-libs/x'},
+            'dev-util/c-1': {'RDEPEND': 'dev-libs/y'},
+            'dev-util/d-1': {'RDEPEND': 'dev-libs/z'},
+            'dev-util/e-1': {'RDEPEND': '=dev-libs/y-1'},
+            'dev-libs/x-1': {},
+            'dev-libs/y-1': {},
+            'dev-libs/y-2': {},
+            'dev-libs/z-1': {},
+        })
+        self.vdb = mk_repo({'dev-libs/y-1': {}, 'dev-libs/z-1': {}},
+                           livefs=True)
+
+    def mk_resolver(self):
+        return plan.merge_plan(
+            [self.repo, self.vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+
+    def test_partition(self):
+        resolver = self.mk_resolver()
+        atoms = map(atom, ('dev-util/a', 'dev-util/c', 'dev-util/d',
+                           'dev-util/b'))
+        self.assertEqual(
+            parallel.partition_restricts(resolver.default_dbs, atoms),
+            [[atoms[0], atoms[3]], [atoms[1]], [atoms[2]]])
+        # deps satisfied by installed pkgs aren't followed.
+        self.assertEqual(
+            parallel.partition_restricts(
+                resolver.default_dbs, atoms + [atom('dev-libs/z')],
+                resolver.livefs_dbs),
+            [[atoms[0], atoms[3]], [atoms[1]], [atoms[2]],
+             [atom('dev-libs/z')]])
+
+    def test_add_atoms(self):
+        atoms = map(atom, ('dev-util/a', 'dev-util/e', 'dev-util/b',
+                           'dev-util/c'))
+        serial = self.mk_resolver()
+        self.assertFalse(serial.add_atoms(atoms))
+        resolver = self.mk_resolver()
+        resolved = []
+
+        def add_atoms(restricts, finalize=False):
+            resolved.append(list(restricts))
+            return plan.merge_plan.add_atoms(resolver, restricts, finalize)
+        resolver.add_atoms = add_atoms
+        self.assertFalse(parallel.add_atoms(resolver, atoms, 4))
+        # e and c pick different versions of the installed y when resolved
+        # apart; the conflict is settled by resolving them serially, while
+        # what a and b resolved to is replayed.
+        self.assertEqual(resolved, [[atoms[1]], [atoms[3]]])
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            sorted(op.pkg.cpvstr for op in serial.state.iter_ops()))
+
+    def test_blockers(self):
+        repo = mk_repo({
+            'app/p-1': {'RDEPEND': '!dev-libs/q dev-libs/r'},
+            'app/s-1': {'RDEPEND': 'dev-libs/q'},
+            'app/t-1': {},
+            'dev-libs/q-1': {},
+            'dev-libs/r-1': {},
+        })
+        mk_resolver = lambda: plan.merge_plan(
+            [repo], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        resolver = mk_resolver()
+        self.assertFalse(parallel.add_atoms(
+            resolver, [atom('app/p'), atom('app/t')], 2))
+        # the blocker is replayed too.
+        self.assertIn(atom('!dev-libs/q'), resolver.state.blockers_refcnt)
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            ['app/p-1', 'app/t-1', 'dev-libs/r-1'])
+        # groups resolving fine apart may still block each other.
+        atoms = [atom('app/p'), atom('app/s')]
+        self.assertEqual(
+            bool(parallel.add_atoms(mk_resolver(), atoms, 2)),
+            bool(mk_resolver().add_atoms(atoms)))
+
+    def test_conflicting(self):
+        x = ('dev-libs/x-1', 'gentoo', False, 'dev-libs/x', '0')
+        y = ('dev-libs/y-1', 'gentoo', False, 'dev-libs/y', '0')
+        self.assertEqual(parallel._conflicting([[x], [y], [x, y]]), set())
+        self.assertEqual(parallel._conflicting([[x], None, [y]]), set([1]))
+        # the same version from another repo is another choice.
+        self.assertEqual(
+            parallel._conflicting([[x], [y], [x[:1] + ('overlay',) + x[2:]]]),
+            set([0, 2]))
+        self.assertEqual(
+            parallel._conflicting([[y], [y[:2] + (True,) + y[3:]]]),
+            set([0, 1]))
+
+    def test_prefetcher(self):
+        prefetcher = metadata_prefetcher([self.repo, self.vdb])
+        resolver = plan.merge_plan(
+            [self.repo, self.vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy,
+            prefetcher=prefetcher)
+        try:
+            self.assertFalse(parallel.add_atoms(
+                resolver, map(atom, ('dev-util/a', 'dev-util/d')), 2))
+            # its threads are stopped before forking.
+            self.assertEqual(prefetcher._workers, [])
+        finally:
+            prefetcher.shutdown()
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            ['dev-libs/x-1', 'dev-util/a-1', 'dev-util/d-1'])
+
+    def test_serial(self):
+        # resolving serially doesn't walk the dependencies of the targets.
+        def partition(*args):
+            raise AssertionError("partitioned for a single job")
+        orig = parallel.partition_restricts
+        parallel.partition_restricts = partition
+        try:
+            resolver = self.mk_resolver()
+            self.assertFalse(parallel.add_atoms(
+                resolver, [atom('dev-util/a'), atom('dev-util/c')], 1))
+        finally:
+            parallel.partition_restricts = orig
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            ['dev-libs/x-1', 'dev-libs/y-2', 'dev-util/a-1', 'dev-util/c-1'])
@@ -1,9 +1,11 @@
 # Copyright: 2006-2007 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 from pkgcore.restrictions import restriction
 from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
 from pkgcore.test.resolver.test_choice_point import fake_package
 
 
@@ -62,3 +64,55 @@ class SlotTesting(TestCase):
         self.assertFalse([], c.fill_slotting(p2))
         c.remove_slotting(p)
         c.remove_slotting(p2)
+
+    def test_versioned_limiters(self):
+        c = PigeonHoledSlots()
+        blockers = map(atom, (
+            '!<dev-util/foo-1.2', '!<=dev-util/foo-1.0', '!>dev-util/foo-2',
+            '!>=dev-util/foo-1.5', '!=dev-util/foo-1.1', '!~dev-util/foo-1.3',
+            '!=dev-util/foo-1.4*', '!dev-util/foo:3', '!<dev-util/foo-1.2',
+            '!>=dev-util/foo-1.5'))
+        for blocker in blockers:
+            self.assertFalse(c.add_limiter(blocker))
+        pkgs = [FakePkg('dev-util/foo-%s' % ver, slot=slot) for ver, slot in (
+            ('0.9', 0), ('1.0', 0), ('1.0-r1', 0), ('1.1', 0), ('1.2', 0),
+            ('1.3-r2', 0), ('1.4.1', 0), ('1.4.9', 3), ('1.5', 0), ('2', 0),
+            ('2.1', 0))]
+
+        def check():
+            for pkg in pkgs:
+                self.assertEqual(
+                    c.check_limiters(pkg),
+                    [x for x in blockers if x.match(pkg)], msg=str(pkg))
+        check()
+        # removal drops every occurrence.
+        for blocker in (blockers[0], blockers[2], blockers[4]):
+            c.remove_limiter(blocker)
+            blockers = [x for x in blockers if x is not blocker]
+        check()
+        self.assertIn(blockers[1], c)
+        self.assertNotIn(atom('!>dev-util/foo-2'), c)
+        self.assertRaises(KeyError, c.remove_limiter, atom('!<dev-util/foo-3'))
+        for blocker in set(blockers):
+            c.remove_limiter(blocker)
+        self.assertEqual(c.limiters, {})
+
+    def test_version_spelling(self):
+        # exact limiters match by version, not by how it's spelled.
+        c = PigeonHoledSlots()
+        blockers = map(atom, (
+            '!=dev-util/foo-1.00', '!~dev-util/foo-1.00', '!=dev-util/foo-2.0-r1',
+            '!~dev-util/foo-02'))
+        for blocker in blockers:
+            self.assertFalse(c.add_limiter(blocker))
+        for ver in ('1.0', '1.0-r2', '1.000', '2-r1', '2.0-r2', '2', '3'):
+            pkg = FakePkg('dev-util/foo-%s' % ver)
+            expected = [x for x in blockers if x.match(pkg)]
+            self.assertEqual(c.check_limiters(pkg), expected, msg=ver)
+        self.assertEqual(
+            c.check_limiters(FakePkg('dev-util/foo-1.0')), blockers[:2])
+        self.assertEqual(
+            c.check_limiters(FakePkg('dev-util/foo-1.0-r2')), blockers[1:2])
+        for blocker in blockers:
+            c.remove_limiter(blocker)
+        self.assertEqual(c.limiters, {})
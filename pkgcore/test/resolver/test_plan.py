@@ -3,6 +3,8 @@
 
 from snakeoil.currying import post_curry
 
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.util import SimpleTree
 from pkgcore.resolver import plan
 from pkgcore.test import TestCase
 from pkgcore.test.misc import FakePkg
@@ -30,3 +32,60 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+
+class TestViableMemo(TestCase):
+
+    def setUp(self):
+        self.repo = SimpleTree({'dev-util': {'foo': ['2', '3']}})
+        self.vdb = SimpleTree({'dev-util': {'foo': ['1']}}, livefs=True)
+        self.resolver = plan.merge_plan(
+            [self.vdb, self.repo], plan.pkg_sort_highest,
+            global_strategy=plan.merge_plan.prefer_highest_version_strategy)
+
+    def test_memoized(self):
+        a = atom('dev-util/foo')
+        dbs = self.resolver.default_dbs
+        matches = self.resolver._viable_matches(a, dbs, False)
+        self.assertEqual(sorted(x.cpvstr for x in matches),
+            ['dev-util/foo-1', 'dev-util/foo-2', 'dev-util/foo-3'])
+        self.assertIdentical(
+            self.resolver._viable_matches(a, dbs, False), matches)
+        self.assertEqual(self.resolver.viable_memo_stats, (1, 1))
+        # state changes don't matter for non vdb lookups.
+        self.resolver.state.generation += 1
+        self.assertIdentical(
+            self.resolver._viable_matches(a, dbs, False), matches)
+        self.resolver.free_caches()
+        self.assertNotIdentical(
+            self.resolver._viable_matches(a, dbs, False), matches)
+        self.assertEqual(self.resolver.viable_memo_stats, (2, 2))
+
+    def test_lazy(self):
+        a = atom('dev-util/foo')
+        dbs = self.resolver.default_dbs
+        matches = self.resolver._viable_matches(a, dbs, False)
+        self.assertEqual(len(matches.cached_list), 0)
+        first = iter(matches)
+        self.assertEqual(next(first).cpvstr, 'dev-util/foo-3')
+        # only what's been looked at is matched.
+        self.assertEqual(len(matches.cached_list), 1)
+        # consumers sharing the matches don't take pkgs from each other.
+        second = iter(matches)
+        self.assertEqual([x.cpvstr for x in second],
+            ['dev-util/foo-3', 'dev-util/foo-2', 'dev-util/foo-1'])
+        self.assertEqual([x.cpvstr for x in first],
+            ['dev-util/foo-2', 'dev-util/foo-1'])
+
+    def test_vdb_generation(self):
+        a = atom('dev-util/foo')
+        dbs = self.resolver.livefs_dbs
+        matches = self.resolver._viable_matches(a, dbs, True)
+        self.assertEqual([x.cpvstr for x in matches], ['dev-util/foo-1'])
+        self.assertIdentical(
+            self.resolver._viable_matches(a, dbs, True), matches)
+        # filtering the installed pkg out bumps the generation.
+        self.resolver.state.vdb_filter.add(matches[0])
+        self.resolver.state.generation += 1
+        self.assertEqual(self.resolver._viable_matches(a, dbs, True), ())
+        self.assertEqual(self.resolver.viable_memo_stats, (1, 2))
@@ -0,0 +1,66 @@
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import plan
+from pkgcore.resolver.prefetch import metadata_prefetcher
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_sat import mk_repo
+
+
+class broken_pkg(object):
+
+    repo = None
+    cpvstr = 'dev-util/broken-1'
+
+    @property
+    def data(self):
+        raise ValueError("no metadata")
+
+
+class TestMetadataPrefetcher(TestCase):
+
+    def test_resolution(self):
+        repo = mk_repo({
+            'app/a-1': {'DEPEND': 'dev/b'}, 'app/a-2': {'DEPEND': 'dev/b'},
+            'dev/b-1': {}, 'dev/b-2': {}, 'dev/c-1': {},
+        })
+        prefetcher = metadata_prefetcher([repo], threads=2)
+        resolver = plan.merge_plan(
+            [repo], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy,
+            prefetcher=prefetcher)
+        self.assertFalse(resolver.add_atoms([atom('app/a')]))
+        prefetcher.wait()
+        self.assertEqual(
+            sorted(cpvstr for repo_id, cpvstr in prefetcher._pkgs),
+            ['app/a-1', 'app/a-2', 'dev/b-1', 'dev/b-2'])
+        self.assertEqual(prefetcher.loaded, 4)
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            ['app/a-2', 'dev/b-2'])
+
+        resolver.free_caches()
+        self.assertFalse(prefetcher._pkgs)
+        prefetcher.queue(repo.match(atom('dev/c')))
+        self.assertFalse(prefetcher._pkgs)
+
+    def test_failures(self):
+        repo = mk_repo({'dev/b-1': {}})
+        prefetcher = metadata_prefetcher([repo], threads=1)
+        prefetcher.queue([broken_pkg()] + repo.match(atom('dev/b')))
+        prefetcher.wait()
+        self.assertEqual(prefetcher.loaded, 1)
+        prefetcher.shutdown()
+
+    def test_suspend(self):
+        repo = mk_repo({'dev/b-1': {}, 'dev/c-1': {}})
+        prefetcher = metadata_prefetcher([repo], threads=2)
+        prefetcher.queue(repo.match(atom('dev/b')))
+        prefetcher.suspend()
+        self.assertEqual(prefetcher.loaded, 1)
+        self.assertFalse(any(t.is_alive() for t in prefetcher._workers))
+        # queueing starts them again.
+        prefetcher.queue(repo.match(atom('dev/c')))
+        prefetcher.wait()
+        self.assertEqual(prefetcher.loaded, 2)
+        prefetcher.shutdown()
@@ -0,0 +1,52 @@
+# License: GPL2/BSD
+
+from StringIO import StringIO
+import json
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.util import SimpleTree
+from pkgcore.resolver import plan
+from pkgcore.resolver.profile import resolver_profile
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestResolverProfile(TestCase):
+
+    def setUp(self):
+        self.profile = resolver_profile()
+        fake_repo = FakeRepo(livefs=False)
+        repo = SimpleTree({'dev-util': {'foo': ['1', '2']}},
+            pkg_klass=lambda *a: FakePkg('%s/%s-%s' % a, repo=fake_repo))
+        self.resolver = plan.merge_plan(
+            [repo], plan.pkg_sort_highest,
+            global_strategy=plan.merge_plan.prefer_highest_version_strategy,
+            profile=self.profile)
+
+    def test_counters(self):
+        self.assertFalse(self.resolver.add_atoms([atom('dev-util/foo')]))
+        self.assertTrue(self.resolver.add_atoms([atom('dev-util/bar')]))
+        d = self.profile.to_dict()
+        self.assertEqual(d['frames'], 2)
+        self.assertEqual(d['max_depth'], 1)
+        self.assertEqual(d['choice_iterations'], 1)
+        self.assertEqual(sorted(d['atoms']), ['dev-util/bar', 'dev-util/foo'])
+        self.assertEqual(d['atoms']['dev-util/foo']['frames'], 1)
+        self.assertEqual(d['timings']['_viable']['calls'], 2)
+        self.assertEqual(d['timings']['check_for_cycles']['calls'], 1)
+        self.assertEqual(sorted(self.profile.collapsed),
+            ['dev-util/bar', 'dev-util/foo'])
+
+        self.resolver.reset()
+        self.assertEqual(self.profile.backtracks, 1)
+        self.resolver.reset()
+        self.assertEqual(self.profile.backtracks, 1)
+
+    def test_output(self):
+        self.profile.collapsed = {'a/b;c/d': 0.0015, 'a/b': 0.0}
+        f = StringIO()
+        self.profile.write_collapsed(f)
+        self.assertEqual(f.getvalue(), 'a/b;c/d 1500\n')
+        f = StringIO()
+        self.profile.write_json(f)
+        self.assertEqual(json.loads(f.getvalue()), self.profile.to_dict())
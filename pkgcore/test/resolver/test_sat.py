@@ -0,0 +1,132 @@
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.util import SimpleTree
+from pkgcore.resolver import plan, sat
+from pkgcore.resolver.util import reduce_to_failures
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+def mk_repo(pkgs, livefs=False):
+    """Create a repo from a mapping of cpv to metadata."""
+    fake_repo = FakeRepo(livefs=livefs)
+    cpv_dict = {}
+    for cpvstr in pkgs:
+        category, rest = cpvstr.split('/')
+        package, version = rest.rsplit('-', 1)
+        cpv_dict.setdefault(category, {}).setdefault(package, []).append(version)
+
+    def pkg_klass(*args):
+        cpvstr = '%s/%s-%s' % args
+        data = dict(pkgs[cpvstr])
+        pkg = FakePkg(cpvstr, repo=fake_repo, slot=data.pop('SLOT', '0'))
+        pkg.data.update(data)
+        return pkg
+
+    return SimpleTree(cpv_dict, pkg_klass=pkg_klass, livefs=livefs)
+
+
+class TestSolver(TestCase):
+
+    def test_satisfiable(self):
+        s = sat.solver()
+        a, b, c = s.new_var(), s.new_var(), s.new_var()
+        self.assertTrue(s.add_clause([a, b]))
+        self.assertTrue(s.add_clause([-a, c]))
+        self.assertTrue(s.add_clause([-c, -b]))
+        choices = iter([b, a])
+        self.assertTrue(s.solve(lambda s: next(
+            (x for x in choices if s.value(x) is None), None)))
+        # picking b forces a false, leaving nothing to decide.
+        self.assertEqual((s.value(a), s.value(b), s.value(c)),
+                         (False, True, False))
+
+    def test_unsatisfiable(self):
+        s = sat.solver()
+        a = s.new_var()
+        self.assertTrue(s.add_clause([a]))
+        self.assertFalse(s.add_clause([-a]))
+        self.assertFalse(s.solve(lambda s: None))
+
+    def test_pigeonhole(self):
+        # three pigeons, two holes; only refuted via conflict analysis.
+        s = sat.solver()
+        holes = [[s.new_var() for x in xrange(2)] for y in xrange(3)]
+        for pigeon in holes:
+            s.add_clause(pigeon)
+        for hole in xrange(2):
+            for idx, pigeon in enumerate(holes):
+                for other in holes[idx + 1:]:
+                    s.add_clause([-pigeon[hole], -other[hole]])
+
+        def decide(s):
+            for pigeon in holes:
+                for var in pigeon:
+                    if s.value(var) is None:
+                        return var
+            return None
+
+        self.assertFalse(s.solve(decide))
+        self.assertTrue(s.conflicts)
+
+
+class TestSatMergePlan(TestCase):
+
+    def mk_resolver(self, repo, vdb=None, kls=sat.sat_merge_plan):
+        dbs = [repo]
+        if vdb is not None:
+            dbs.append(vdb)
+        return kls(dbs, plan.pkg_sort_highest,
+                   plan.merge_plan.prefer_highest_version_strategy)
+
+    def assertOps(self, resolver, expected):
+        self.assertEqual(
+            [(op.desc, op.pkg.cpvstr) for op in resolver.state.iter_ops()],
+            expected)
+
+    def test_matches_chronological(self):
+        repo = mk_repo({
+            'dev-util/app-1': {'RDEPEND': 'dev-util/lib'},
+            'dev-util/app-2': {'RDEPEND': '>=dev-util/lib-2 dev-util/other'},
+            'dev-util/lib-1': {},
+            'dev-util/lib-2': {'RDEPEND': '!dev-util/other'},
+            'dev-util/other-1': {},
+        })
+        vdb = mk_repo({'dev-util/lib-1': {}}, livefs=True)
+        for kls in (plan.merge_plan, sat.sat_merge_plan):
+            resolver = self.mk_resolver(repo, vdb, kls=kls)
+            self.assertFalse(resolver.add_atoms([atom('dev-util/app')]))
+            self.assertOps(resolver, [
+                ('replace', 'dev-util/lib-2'), ('add', 'dev-util/app-1')])
+
+    def test_slot_conflict(self):
+        # the newest a and b want different slots of c; only learning which
+        # version of b is to blame avoids retrying every other choice.
+        repo = mk_repo({
+            'dev-util/a-1': {'RDEPEND': '=dev-util/c-1*'},
+            'dev-util/a-2': {'RDEPEND': '=dev-util/c-2* dev-util/b'},
+            'dev-util/b-1': {'RDEPEND': '=dev-util/c-2*'},
+            'dev-util/b-2': {'RDEPEND': '=dev-util/c-3*'},
+            'dev-util/c-1': {'SLOT': '1'},
+            'dev-util/c-2': {'SLOT': '0'},
+            'dev-util/c-3': {'SLOT': '0'},
+        })
+        resolver = self.mk_resolver(repo)
+        self.assertFalse(resolver.add_atoms([atom('dev-util/a')]))
+        self.assertEqual(
+            sorted(op.pkg.cpvstr for op in resolver.state.iter_ops()),
+            ['dev-util/a-2', 'dev-util/b-1', 'dev-util/c-2'])
+
+    def test_failure(self):
+        repo = mk_repo({
+            'dev-util/app-1': {'RDEPEND': 'dev-util/x dev-util/y'},
+            'dev-util/x-1': {'RDEPEND': '!dev-util/y'},
+            'dev-util/y-1': {},
+        })
+        resolver = self.mk_resolver(repo)
+        ret = resolver.add_atoms([atom('dev-util/y'), atom('dev-util/app')])
+        self.assertEqual(ret[0], [atom('dev-util/app')])
+        failures = reduce_to_failures(ret[1])
+        self.assertEqual(failures[0].atom, atom('dev-util/app'))
+        self.assertEqual(failures[1][0].cpvstr, 'dev-util/app-1')
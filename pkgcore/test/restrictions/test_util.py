@@ -1,7 +1,8 @@
 # Copyright: 2006 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
-from pkgcore.restrictions import util, packages, values
+from pkgcore.ebuild.atom import atom
+from pkgcore.restrictions import delegated, util, packages, values
 from pkgcore.test import TestCase
 
 
@@ -32,3 +33,28 @@ class Test_collect_package_restrictions(TestCase):
             self.assertEqual(
                 list(util.collect_package_restrictions(r, attrs=[k])),
                 [v] * 2)
+
+
+class Test_collect_package_attrs(TestCase):
+
+    def test_it(self):
+        self.assertEqual(util.collect_package_attrs(packages.AlwaysTrue),
+            frozenset())
+        self.assertEqual(
+            util.collect_package_attrs(atom("=dev-util/foo-1:2::gentoo[x]")),
+            frozenset(["category", "package", "fullver", "slot", "repo",
+                       "use"]))
+        r = packages.OrRestriction(
+            packages.PackageRestriction("keywords", values.AlwaysTrue),
+            packages.PackageRestrictionMulti(("iuse", "use"),
+                values.AlwaysTrue))
+        self.assertEqual(util.collect_package_attrs(r),
+            frozenset(["keywords", "iuse", "use"]))
+
+        f = lambda pkg, mode: True
+        self.assertEqual(util.collect_package_attrs(
+            packages.AndRestriction(r, delegated.delegate(f))), None)
+        self.assertEqual(util.collect_package_attrs(
+            packages.AndRestriction(r, delegated.delegate(f,
+                attrs=["license"]))),
+            frozenset(["keywords", "iuse", "use", "license"]))
@@ -4,6 +4,8 @@
 
 from pkgcore.config import basics, ConfigHint, configurable
 from pkgcore.ebuild import atom
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
 from pkgcore.repository import util
 from pkgcore.scripts import pquery
 from pkgcore.test import TestCase
@@ -74,3 +76,62 @@ class CommandlineTest(TestCase, helpers.ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
+
+
+class FakeOwnersIndex(object):
+
+    def __init__(self, owners):
+        self._owners = owners
+
+    def iter_owners(self, paths):
+        for path in paths:
+            for cpvstr in self._owners.get(path, ()):
+                yield path, cpvstr
+
+    def owners_matching(self, predicate):
+        return frozenset(cpvstr for path, cpvstrs in self._owners.iteritems()
+                         if predicate(path) for cpvstr in cpvstrs)
+
+
+class FakeOwnedPkg(object):
+
+    def __init__(self, cpvstr, repo, contents=()):
+        self.cpvstr = cpvstr
+        self.repo = repo
+        self._contents = contents
+
+    @property
+    def contents(self):
+        if self.repo.owners is not None:
+            raise AssertionError("contents accessed despite owners index")
+        return self._contents
+
+
+class FakeOwnersRepo(object):
+
+    def __init__(self, owners=None):
+        self.owners = owners
+
+
+class OwnsTest(TestCase):
+
+    def test_index(self):
+        repo = FakeOwnersRepo(FakeOwnersIndex({
+            '/usr/bin/foo': ['a/foo-1'], '/usr/bin/bar': ['a/bar-1']}))
+        r = pquery.parse_owns('/usr/bin/foo, /usr//bin/bar')
+        for cpvstr in ('a/foo-1', 'a/bar-1'):
+            self.assertTrue(r.match(FakeOwnedPkg(cpvstr, repo)))
+        self.assertFalse(r.match(FakeOwnedPkg('a/baz-1', repo)))
+
+        r = pquery.parse_ownsre('^/usr/bin/f')
+        self.assertTrue(r.match(FakeOwnedPkg('a/foo-1', repo)))
+        self.assertFalse(r.match(FakeOwnedPkg('a/bar-1', repo)))
+
+    def test_fallback(self):
+        repo = FakeOwnersRepo()
+        pkg = FakeOwnedPkg('a/foo-1', repo,
+            contentsSet([fs.fsFile('/usr/bin/foo', strict=False)]))
+        self.assertTrue(pquery.parse_owns('/usr/bin/foo').match(pkg))
+        self.assertFalse(pquery.parse_owns('/usr/bin/bar').match(pkg))
+        self.assertTrue(pquery.parse_ownsre('bin/f').match(pkg))
+        self.assertFalse(pquery.parse_ownsre('bin/b').match(pkg))
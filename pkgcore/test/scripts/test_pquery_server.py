@@ -0,0 +1,137 @@
+# License: BSD/GPL2
+
+import json
+import threading
+import time
+import urllib2
+
+from pkgcore.repository import util
+from pkgcore.scripts import pquery_server
+from pkgcore.test import TestCase
+
+
+class TestQueryServer(TestCase):
+
+    def setUp(self):
+        self.repo = util.SimpleTree(
+            {'dev-util': {'foo': ('1', '2'), 'bar': ('1',)},
+             'sys-apps': {'baz': ('3',)}},
+            repo_id='repo')
+        self.vdb = util.SimpleTree({'dev-util': {'foo': ('1',)}}, repo_id='vdb')
+        self.server = pquery_server.QueryServer(
+            ('localhost', 0), {'repo': self.repo, 'vdb': self.vdb},
+            [self.repo], jobs=2, page_size=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://localhost:%i' % (self.server.server_address[1],)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def request(self, path, body=None):
+        if body is not None:
+            body = json.dumps(body)
+        try:
+            f = urllib2.urlopen(self.url + path, body)
+        except urllib2.HTTPError as e:
+            return e.code, json.load(e)
+        return f.getcode(), f.read()
+
+    def query(self, path, body=None):
+        code, data = self.request(path, body)
+        self.assertEqual(code, 200, msg=data)
+        return json.loads(data)
+
+    def test_repos(self):
+        self.assertEqual(self.query('/repos'), {'repos': ['repo', 'vdb']})
+
+    def test_match(self):
+        self.assertEqual(
+            self.query('/query?match=dev-util/foo&attr=version&attr=package'),
+            {'results': [
+                {'cpv': 'dev-util/foo-1', 'version': '1', 'package': 'foo'},
+                {'cpv': 'dev-util/foo-2', 'version': '2', 'package': 'foo'}],
+             'offset': 0, 'limit': 2, 'next_offset': None})
+        self.assertEqual(
+            [x['cpv'] for x in self.query(
+                '/query?match=dev-util/foo&match=sys-apps/*')['results']],
+            ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(
+            [x['cpv'] for x in self.query(
+                '/query?match=dev-util/foo&match=sys-apps/*&limit=5')['results']],
+            ['dev-util/foo-1', 'dev-util/foo-2', 'sys-apps/baz-3'])
+        self.assertEqual(
+            self.query('/query?match=dev-util/*&match=>=dev-util/foo-2')['results'],
+            [{'cpv': 'dev-util/bar-1'}, {'cpv': 'dev-util/foo-1'}])
+        self.assertEqual(
+            self.query('/query?match=foo&repo=vdb')['results'],
+            [{'cpv': 'dev-util/foo-1'}])
+
+    def test_pagination(self):
+        data = self.query('/query')
+        self.assertEqual(
+            [x['cpv'] for x in data['results']],
+            ['dev-util/bar-1', 'dev-util/foo-1'])
+        self.assertEqual(data['next_offset'], 2)
+        data = self.query('/query?offset=2')
+        self.assertEqual(
+            [x['cpv'] for x in data['results']],
+            ['dev-util/foo-2', 'sys-apps/baz-3'])
+        self.assertEqual(data['next_offset'], None)
+
+    def test_post(self):
+        data = self.query(
+            '/query', {'match': 'dev-util/*', 'offset': 1, 'limit': 1})
+        self.assertEqual(data['results'], [{'cpv': 'dev-util/foo-1'}])
+        self.assertEqual(data['next_offset'], 2)
+
+    def test_stream(self):
+        code, data = self.request('/query?stream=yes&offset=1')
+        self.assertEqual(code, 200)
+        self.assertEqual(
+            [json.loads(x)['cpv'] for x in data.splitlines()],
+            ['dev-util/foo-1', 'dev-util/foo-2', 'sys-apps/baz-3'])
+        code, data = self.request('/query', {'stream': True, 'limit': 1})
+        self.assertEqual(data, '{"cpv": "dev-util/bar-1"}\n')
+
+    def test_errors(self):
+        for path, body in (
+                ('/query?match=%3Ddev-util/foo', None),
+                ('/query?attr=nonexistent', None),
+                ('/query?repo=nonexistent', None),
+                ('/query?limit=0', None),
+                ('/query?stream=maybe', None),
+                ('/query', ['match']),
+                ('/query?revdep=%21', None),
+                ('/query?owns_re=%28', None),
+                ):
+            code, data = self.request(path, body)
+            self.assertEqual(code, 400, msg="%s: %r" % (path, data))
+            self.assertIn('error', data)
+        code, data = self.request('/nonexistent')
+        self.assertEqual(code, 404)
+
+    def test_repo_lock(self):
+        # repos are only accessed by one worker at a time.
+        active = []
+        overlaps = []
+        itermatch = self.repo.itermatch
+
+        def locked_itermatch(*args, **kwargs):
+            for pkg in itermatch(*args, **kwargs):
+                active.append(pkg)
+                if len(active) > 1:
+                    overlaps.append(pkg)
+                time.sleep(0.01)
+                active.remove(pkg)
+                yield pkg
+        self.repo.itermatch = locked_itermatch
+        threads = [threading.Thread(target=self.query, args=('/query',))
+                   for x in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
@@ -0,0 +1,110 @@
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.test import TestCase
+from pkgcore.vdb.owners import OwnersIndex
+
+
+class FakePkg(object):
+
+    def __init__(self, cpvstr, contents=()):
+        self.cpvstr = cpvstr
+        self.category = cpvstr.split('/')[0]
+        self.contents = contentsSet(
+            fs.fsFile(x, strict=False) for x in contents)
+
+
+class TestOwnersIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util/foo-1', '/usr/bin/foo', '/usr/share/shared')
+        self.add_pkg('dev-util/bar-2', '/usr/bin/bar', '/usr/share/shared')
+        self.add_pkg('sys-apps/baz-3', '/bin/baz')
+
+    def add_pkg(self, cpvstr, *paths):
+        path = pjoin(self.vdb, cpvstr)
+        ensure_dirs(path)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            for x in paths:
+                f.write('obj %s d41d8cd98f00b204e9800998ecf8427e 1\n' % (x,))
+        # ensure mtime changes regardless of fs timestamp granularity.
+        category = pjoin(self.vdb, cpvstr.split('/')[0])
+        st = os.stat(category)
+        os.utime(category, (st.st_atime, st.st_mtime + 10))
+
+    def mk_index(self, cache=True):
+        return OwnersIndex(self.vdb, self.cache if cache else None)
+
+    def test_owners(self):
+        index = self.mk_index(cache=False)
+        self.assertFalse(index.in_use)
+        self.assertEqual(index.owners('/usr/bin/foo'), ('dev-util/foo-1',))
+        self.assertEqual(index.owners('//bin/./baz'), ('sys-apps/baz-3',))
+        self.assertEqual(sorted(index.owners('/usr/share/shared')),
+            ['dev-util/bar-2', 'dev-util/foo-1'])
+        self.assertEqual(index.owners('/nonexistent'), ())
+        self.assertEqual(
+            sorted(index.iter_owners(['/usr/bin/bar', '/bin/baz', '/x'])),
+            [('/bin/baz', 'sys-apps/baz-3'), ('/usr/bin/bar', 'dev-util/bar-2')])
+        self.assertEqual(
+            index.owners_matching(lambda x: x.startswith('/usr/bin/')),
+            frozenset(['dev-util/foo-1', 'dev-util/bar-2']))
+        self.assertTrue(index.in_use)
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_persistence(self):
+        index = self.mk_index()
+        self.assertFalse(index.in_use)
+        index.refresh()
+        self.assertFalse(index.loaded)
+        self.assertEqual(index.owners('/bin/baz'), ('sys-apps/baz-3',))
+        self.assertTrue(os.path.exists(index.cache_path))
+
+        # cached categories shouldn't be reindexed.
+        os.unlink(pjoin(self.vdb, 'dev-util', 'foo-1', 'CONTENTS'))
+        index = self.mk_index()
+        self.assertTrue(index.in_use)
+        self.assertEqual(index.owners('/usr/bin/foo'), ('dev-util/foo-1',))
+
+        # while modified categories should be.
+        self.add_pkg('sys-apps/baz-4', '/bin/baz')
+        index = self.mk_index()
+        self.assertEqual(sorted(index.owners('/bin/baz')),
+            ['sys-apps/baz-3', 'sys-apps/baz-4'])
+        self.assertEqual(index.owners('/usr/bin/foo'), ('dev-util/foo-1',))
+
+    def test_corrupt_cache(self):
+        ensure_dirs(self.cache)
+        with open(pjoin(self.cache, 'owners.cache'), 'w') as f:
+            f.write('pkgcore-owners-1\n/usr/bin/foo\n')
+        index = self.mk_index()
+        self.assertEqual(index.owners('/usr/bin/foo'), ('dev-util/foo-1',))
+
+    def test_update(self):
+        index = self.mk_index()
+        # not loaded; updates are ignored.
+        index.update(added=[FakePkg('dev-util/foo-2', ['/usr/bin/foo'])])
+        self.assertFalse(index.loaded)
+
+        index.refresh()
+        index.owners('/bin/baz')
+        self.add_pkg('dev-util/foo-2', '/usr/bin/foo')
+        index.update(added=[FakePkg('dev-util/foo-2', ['/usr/bin/foo2'])],
+                     removed=[FakePkg('dev-util/foo-1')])
+        self.assertEqual(index.owners('/usr/bin/foo'), ())
+        self.assertEqual(index.owners('/usr/bin/foo2'), ('dev-util/foo-2',))
+        self.assertEqual(index.owners('/usr/share/shared'), ('dev-util/bar-2',))
+
+        # the update must have been persisted, and the category still valid.
+        index = self.mk_index()
+        self.assertEqual(index.owners('/usr/bin/foo2'), ('dev-util/foo-2',))
+        self.assertEqual(index.owners('/usr/bin/foo'), ())
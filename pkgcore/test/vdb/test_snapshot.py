@@ -0,0 +1,83 @@
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.test import TestCase
+from pkgcore.vdb import ondisk
+from pkgcore.vdb.snapshot import MetadataSnapshot
+
+
+class TestMetadataSnapshot(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util/foo-1', RDEPEND='dev-libs/bar', SLOT='0')
+        self.add_pkg('dev-libs/bar-2', SLOT='2', USE='x y')
+
+    def add_pkg(self, cpvstr, **metadata):
+        path = pjoin(self.vdb, cpvstr)
+        ensure_dirs(path)
+        for key, val in metadata.iteritems():
+            with open(pjoin(path, key), 'w') as f:
+                f.write(val + '\n')
+        # ensure mtime changes regardless of fs timestamp granularity.
+        category = pjoin(self.vdb, cpvstr.split('/')[0])
+        st = os.stat(category)
+        os.utime(category, (st.st_atime, st.st_mtime + 10))
+
+    def test_load(self):
+        snapshot = MetadataSnapshot(self.vdb, self.cache)
+        self.assertFalse(snapshot.loaded)
+        self.assertIdentical(snapshot.get('dev-util/foo-1'), None)
+        snapshot.load()
+        self.assertTrue(snapshot.loaded)
+        data = snapshot.get('dev-util/foo-1')
+        self.assertEqual(data['RDEPEND'], 'dev-libs/bar\n')
+        self.assertIdentical(data['DEPEND'], None)
+        self.assertEqual(snapshot.get('dev-libs/bar-2')['USE'], 'x y\n')
+        self.assertTrue(os.path.exists(snapshot.cache_path))
+
+        # modifications behind the snapshot's back are only picked up for
+        # categories whose mtime changed.
+        with open(pjoin(self.vdb, 'dev-util/foo-1/RDEPEND'), 'w') as f:
+            f.write('dev-libs/baz\n')
+        self.add_pkg('dev-libs/bar-3', SLOT='3')
+        snapshot = MetadataSnapshot(self.vdb, self.cache)
+        snapshot.load()
+        self.assertEqual(snapshot.get('dev-util/foo-1')['RDEPEND'],
+                         'dev-libs/bar\n')
+        self.assertEqual(snapshot.get('dev-libs/bar-3')['SLOT'], '3\n')
+
+        snapshot.discard(['dev-libs/bar-3'])
+        self.assertIdentical(snapshot.get('dev-libs/bar-3'), None)
+
+    def test_corrupted(self):
+        ensure_dirs(self.cache)
+        with open(pjoin(self.cache, 'metadata.snapshot'), 'w') as f:
+            f.write('garbage\n')
+        snapshot = MetadataSnapshot(self.vdb, self.cache)
+        snapshot.load()
+        self.assertEqual(snapshot.get('dev-libs/bar-2')['SLOT'], '2\n')
+        with open(snapshot.cache_path, 'rb') as f:
+            data = f.read()
+        with open(snapshot.cache_path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        snapshot = MetadataSnapshot(self.vdb, self.cache)
+        snapshot.load()
+        self.assertEqual(snapshot.get('dev-libs/bar-2')['SLOT'], '2\n')
+
+    def test_vdb(self):
+        repo = ondisk.tree(self.vdb, cache_location=self.cache)
+        repo.preload_metadata()
+        os.unlink(pjoin(self.vdb, 'dev-libs/bar-2/USE'))
+        pkg = repo.match(atom('=dev-libs/bar-2'))[0]
+        # served from the snapshot rather than the vdb entry.
+        self.assertEqual(pkg.data['USE'], 'x y\n')
+        self.assertEqual(pkg.data['fullslot'], '2\n')
+        self.assertRaises(KeyError, pkg.data.__getitem__, 'DEPEND')
@@ -25,6 +25,8 @@ demandload(
     'pkgcore.log:logger',
     'pkgcore.vdb:repo_ops',
     'pkgcore.vdb.contents:ContentsFile',
+    'pkgcore.vdb.owners:OwnersIndex',
+    'pkgcore.vdb.snapshot:MetadataSnapshot',
 )
 
 
@@ -67,6 +69,24 @@ class tree(prototype.tree):
 
         self.package_class = self.package_factory(self)
 
+    @klass.jit_attr
+    def owners(self):
+        """path to owning cpvs index; see :obj:`pkgcore.vdb.owners.OwnersIndex`"""
+        return OwnersIndex(self.location, self.cache_location)
+
+    @klass.jit_attr
+    def metadata_snapshot(self):
+        """snapshot of entries' metadata; see :obj:`pkgcore.vdb.snapshot.MetadataSnapshot`"""
+        return MetadataSnapshot(self.location, self.cache_location)
+
+    def preload_metadata(self):
+        """Load the metadata of all entries at once via the metadata snapshot.
+
+        Worthwhile if most installed pkgs are going to be accessed, as the
+        resolver does when preloading the vdb state.
+        """
+        self.metadata_snapshot.load()
+
     def _get_categories(self, *optional_category):
         # return if optional_category is passed... cause it's not yet supported
         if optional_category:
@@ -140,9 +160,22 @@ class tree(prototype.tree):
     }
 
     def _get_metadata(self, pkg):
-        return IndeterminantDict(partial(self._internal_load_key,
-            pjoin(self.location, pkg.category,
-                "%s-%s" % (pkg.package, pkg.fullver))))
+        path = pjoin(self.location, pkg.category,
+            "%s-%s" % (pkg.package, pkg.fullver))
+        snapshot = self.metadata_snapshot.get(pkg.cpvstr)
+        if snapshot is not None:
+            return IndeterminantDict(partial(self._snapshot_load_key,
+                path, snapshot))
+        return IndeterminantDict(partial(self._internal_load_key, path))
+
+    def _snapshot_load_key(self, path, snapshot, key):
+        fkey = self._metadata_rewrites.get(key, key)
+        if fkey not in snapshot:
+            return self._internal_load_key(path, key)
+        data = snapshot[fkey]
+        if data is None:
+            raise KeyError((path, fkey))
+        return data
 
     def _internal_load_key(self, path, key):
         key = self._metadata_rewrites.get(key, key)
@@ -208,5 +241,8 @@ class ConfiguredTree(multiplex.tree):
         multiplex.tree.__init__(self, raw_vdb, self.old_style_virtuals)
 
     frozen = klass.alias_attr("raw_vdb.frozen")
+    owners = klass.alias_attr("raw_vdb.owners")
+    metadata_snapshot = klass.alias_attr("raw_vdb.metadata_snapshot")
+    preload_metadata = klass.alias_attr("raw_vdb.preload_metadata")
 
 tree.configure = ConfiguredTree
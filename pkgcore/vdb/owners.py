@@ -0,0 +1,256 @@
+# License: GPL2/BSD
+
+"""
+path to owning package index for a vdb
+
+The index is kept in memory once built; if the vdb has a cache location
+it's persisted there and validated per category via directory mtimes,
+so only categories modified behind our back have their CONTENTS reparsed.
+"""
+
+__all__ = ("OwnersIndex",)
+
+import os
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs, listdir_dirs, normpath, pjoin
+
+from pkgcore.os_data import portage_gid
+
+demandload(
+    'errno',
+    'pkgcore.log:logger',
+    'pkgcore.vdb.contents:ContentsFile',
+    'pkgcore.vdb.virtuals:_get_mtimes',
+)
+
+CACHE_MAGIC = "pkgcore-owners-1"
+
+
+class OwnersIndex(object):
+
+    """Mapping of merged paths to the cpvs owning them.
+
+    :ivar cache_path: file the index is persisted to; None if the index
+        is memory only.
+    """
+
+    def __init__(self, location, cache_location=None):
+        """
+        :param location: base directory of the vdb to index
+        :param cache_location: directory to persist the index in; if None,
+            the index is only kept in memory
+        """
+        self.location = location
+        if cache_location is not None:
+            cache_location = pjoin(cache_location, 'owners.cache')
+        self.cache_path = cache_location
+        # category -> mtime the category's entries were collected at
+        self._mtimes = None
+        # cpvstr -> tuple of owned paths
+        self._pkgs = None
+        # path -> list of owning cpvstrs
+        self._owners = None
+        self._dirty = False
+
+    @property
+    def loaded(self):
+        return self._pkgs is not None
+
+    @property
+    def in_use(self):
+        """Is this index worth maintaining across vdb modifications?
+
+        True if it's already been loaded, or if a persisted copy exists.
+        """
+        if self.loaded:
+            return True
+        return self.cache_path is not None and os.path.exists(self.cache_path)
+
+    def owners(self, path):
+        """Return a tuple of the cpvstrs owning a path."""
+        self._ensure_loaded()
+        return tuple(self._owners.get(normpath(path), ()))
+
+    def iter_owners(self, paths):
+        """Yield (path, cpvstr) pairs for each owned path of a sequence."""
+        self._ensure_loaded()
+        for path in paths:
+            for cpvstr in self._owners.get(normpath(path), ()):
+                yield path, cpvstr
+
+    def owners_matching(self, predicate):
+        """Return a frozenset of cpvstrs owning any path matching a predicate.
+
+        :param predicate: callable invoked with each indexed path
+        """
+        self._ensure_loaded()
+        return frozenset(
+            cpvstr for path, cpvstrs in self._owners.iteritems()
+            if predicate(path) for cpvstr in cpvstrs)
+
+    def refresh(self):
+        """Validate the index against the vdb, reindexing stale categories.
+
+        This is a noop if the index isn't in use; see :obj:`in_use`.
+        """
+        if self.in_use:
+            self._ensure_loaded()
+
+    def update(self, added=(), removed=()):
+        """Account for pkgs merged to or unmerged from the vdb.
+
+        This is a noop if the index isn't loaded; invoke :obj:`refresh`
+        prior to modifying the vdb to ensure it's loaded.
+
+        :param added: pkgs with contents that were added to the vdb
+        :param removed: pkgs that were removed from the vdb
+        """
+        if not self.loaded:
+            return
+        categories = set()
+        for pkg in removed:
+            self._remove(pkg.cpvstr)
+            categories.add(pkg.category)
+        for pkg in added:
+            self._remove(pkg.cpvstr)
+            self._add(pkg.cpvstr, (obj.location for obj in pkg.contents))
+            categories.add(pkg.category)
+        for category in categories:
+            try:
+                st = os.stat(pjoin(self.location, category))
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                self._mtimes.pop(category, None)
+            else:
+                self._mtimes[category] = st.st_mtime
+        self._dirty = True
+        self.flush()
+
+    def flush(self):
+        """Write the index to disk if it was modified."""
+        if not self._dirty or self.cache_path is None:
+            self._dirty = False
+            return
+        self._dirty = False
+        _write_cache(self.cache_path, self._mtimes, self._pkgs)
+
+    def _add(self, cpvstr, paths):
+        paths = tuple(paths)
+        self._pkgs[cpvstr] = paths
+        owners = self._owners
+        for path in paths:
+            owners.setdefault(path, []).append(cpvstr)
+
+    def _remove(self, cpvstr):
+        paths = self._pkgs.pop(cpvstr, ())
+        owners = self._owners
+        for path in paths:
+            l = owners.get(path)
+            if l is None:
+                continue
+            l.remove(cpvstr)
+            if not l:
+                del owners[path]
+
+    def _ensure_loaded(self):
+        if self._pkgs is not None:
+            return
+        self._pkgs, self._owners = {}, {}
+        cached_mtimes, cached = {}, {}
+        if self.cache_path is not None:
+            cached_mtimes, cached = _read_cache(self.cache_path)
+
+        self._mtimes = existing = _get_mtimes(self.location)
+        for category, mtime in existing.iteritems():
+            pkgs = cached.get(category)
+            if pkgs is not None and cached_mtimes[category] == mtime:
+                for cpvstr, paths in pkgs:
+                    self._add(cpvstr, paths)
+                continue
+            self._dirty = True
+            self._index_category(category)
+
+        if set(cached) - set(existing):
+            self._dirty = True
+        self.flush()
+
+    def _index_category(self, category):
+        base = pjoin(self.location, category)
+        logger.debug("owners index: indexing vdb category %r", base)
+        for pkgdir in listdir_dirs(base):
+            if pkgdir.startswith(".tmp.") or pkgdir.endswith(".lockfile") \
+                    or pkgdir.startswith("-MERGING-"):
+                continue
+            contents_path = pjoin(base, pkgdir, "CONTENTS")
+            if not os.path.exists(contents_path):
+                continue
+            self._add("%s/%s" % (category, pkgdir),
+                (obj.location for obj in ContentsFile(contents_path)))
+
+
+def _read_cache(location):
+    mtimes, data = {}, {}
+    try:
+        with open(location, "r") as f:
+            if f.readline().rstrip("\n") != CACHE_MAGIC:
+                logger.debug("ignoring owners cache of unknown format at %r",
+                    location)
+                return {}, {}
+            category = pkgs = paths = None
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith("/"):
+                    paths.append(line)
+                elif line.startswith("="):
+                    paths = []
+                    pkgs.append(("%s/%s" % (category, line[1:]), paths))
+                elif line:
+                    category, mtime = line.rsplit(None, 1)
+                    mtimes[category] = float(mtime)
+                    pkgs = data[category] = []
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        logger.debug("failed reading owners cache at %r", location)
+        return {}, {}
+    except (ValueError, TypeError, AttributeError):
+        # truncated or hand mangled; reindexing will rewrite it.
+        logger.warning("corrupted owners cache at %r; ignoring it", location)
+        return {}, {}
+    return mtimes, data
+
+
+def _write_cache(location, mtimes, pkgs):
+    by_category = {}
+    for cpvstr, paths in pkgs.iteritems():
+        category, pkgdir = cpvstr.split("/", 1)
+        by_category.setdefault(category, []).append((pkgdir, paths))
+
+    old_umask = os.umask(0113)
+    f = None
+    try:
+        logger.debug("updating owners cache at %r", location)
+        if not ensure_dirs(os.path.dirname(location),
+                           gid=portage_gid, mode=0775):
+            return
+        f = AtomicWriteFile(location, gid=portage_gid, perms=0664)
+        f.write(CACHE_MAGIC + "\n")
+        for category, mtime in sorted(mtimes.iteritems()):
+            f.write("%s %r\n" % (category, mtime))
+            for pkgdir, paths in sorted(by_category.get(category, ())):
+                f.write("=%s\n" % (pkgdir,))
+                for path in paths:
+                    f.write(path + "\n")
+        f.close()
+    except EnvironmentError as e:
+        if f is not None:
+            f.discard()
+        if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+        logger.warning("unable to update vdb owners cache due to "
+            "lacking permissions")
+    finally:
+        os.umask(old_umask)
@@ -42,6 +42,9 @@ class install(repo_ops.install):
         repo_ops.install.__init__(self, repo, newpkg, observer)
 
     def add_data(self, domain):
+        # validate the owners index prior to touching the vdb so our own
+        # modifications don't invalidate it.
+        self.repo.owners.refresh()
         # error checking?
         dirpath = self.tmp_write_path
         ensure_dirs(dirpath, mode=0755, minimal=True)
@@ -121,9 +124,14 @@ class install(repo_ops.install):
         return True
 
     def finalize_data(self):
+        self._add_entry()
+        self.repo.owners.update(added=(self.new_pkg,))
+        self.repo.metadata_snapshot.discard((self.new_pkg.cpvstr,))
+        return True
+
+    def _add_entry(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
-        return True
 
 
 class uninstall(repo_ops.uninstall):
@@ -134,13 +142,19 @@ class uninstall(repo_ops.uninstall):
         repo_ops.uninstall.__init__(self, repo, pkg, observer)
 
     def remove_data(self):
+        self.repo.owners.refresh()
         return True
 
     def finalize_data(self):
+        self._remove_entry()
+        self.repo.owners.update(removed=(self.old_pkg,))
+        self.repo.metadata_snapshot.discard((self.old_pkg.cpvstr,))
+        return True
+
+    def _remove_entry(self):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
-        return True
 
 
 # should convert these to mixins.
@@ -161,8 +175,11 @@ class replace(repo_ops.replace, install, uninstall):
         # literal same fullver replacements), then wipe the unmerge
         # that minimizes the window for races, and gets the data in place
         # should unmerge somehow die.
-        uninstall.finalize_data(self)
-        install.finalize_data(self)
+        uninstall._remove_entry(self)
+        install._add_entry(self)
+        self.repo.owners.update(added=(self.new_pkg,), removed=(self.old_pkg,))
+        self.repo.metadata_snapshot.discard(
+            (self.new_pkg.cpvstr, self.old_pkg.cpvstr))
         return True
 
 
@@ -0,0 +1,157 @@
+# License: GPL2/BSD
+
+"""
+snapshot of the resolver relevant metadata of a vdb
+
+Loading an installed pkg's dependencies, USE, slot, etc reads a file per
+key from its vdb entry; for every installed pkg that's thousands of small
+reads.  The snapshot keeps those keys of every entry in a single file,
+validated per category via directory mtimes like
+:obj:`pkgcore.vdb.owners.OwnersIndex`, so only modified categories are
+read from the vdb itself.
+"""
+
+__all__ = ("MetadataSnapshot",)
+
+import marshal
+import os
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile, readfile
+from snakeoil.osutils import ensure_dirs, listdir_dirs, pjoin
+
+from pkgcore.os_data import portage_gid
+
+demandload(
+    'errno',
+    'pkgcore.log:logger',
+    'pkgcore.vdb.virtuals:_get_mtimes',
+)
+
+CACHE_MAGIC = "pkgcore-vdb-snapshot-1"
+
+# vdb entry files the snapshot holds; absent files are recorded as None.
+snapshot_keys = ("DEPEND", "RDEPEND", "PDEPEND", "EAPI", "SLOT", "USE",
+                 "IUSE", "PROVIDE", "KEYWORDS", "repository")
+
+
+class MetadataSnapshot(object):
+
+    """Mapping of cpvstr to the snapshotted metadata of its vdb entry.
+
+    Nothing is read until :obj:`load` is invoked; till then, and for pkgs
+    modified since, :obj:`get` returns None.
+
+    :ivar cache_path: file the snapshot is persisted to; None if it's
+        memory only.
+    """
+
+    def __init__(self, location, cache_location=None):
+        """
+        :param location: base directory of the vdb
+        :param cache_location: directory to persist the snapshot in; if
+            None, the snapshot is only kept in memory
+        """
+        self.location = location
+        if cache_location is not None:
+            cache_location = pjoin(cache_location, 'metadata.snapshot')
+        self.cache_path = cache_location
+        # cpvstr -> mapping of vdb file name to its content
+        self._pkgs = None
+
+    @property
+    def loaded(self):
+        return self._pkgs is not None
+
+    def get(self, cpvstr):
+        """Return the snapshotted metadata of a pkg, or None if unknown."""
+        if self._pkgs is None:
+            return None
+        return self._pkgs.get(cpvstr)
+
+    def discard(self, cpvstrs):
+        """Forget pkgs whose vdb entries were modified."""
+        if self._pkgs is not None:
+            for cpvstr in cpvstrs:
+                self._pkgs.pop(cpvstr, None)
+
+    def load(self):
+        """Load the snapshot, rereading categories modified since it was made."""
+        mtimes, cached = {}, {}
+        if self.cache_path is not None:
+            mtimes, cached = _read_cache(self.cache_path)
+
+        existing = _get_mtimes(self.location)
+        pkgs = {}
+        dirty = bool(set(mtimes).difference(existing))
+        for category, mtime in existing.iteritems():
+            data = cached.get(category)
+            if data is None or mtimes.get(category) != mtime:
+                dirty = True
+                data = cached[category] = self._read_category(category)
+            for pkgdir, metadata in data.iteritems():
+                pkgs["%s/%s" % (category, pkgdir)] = metadata
+        self._pkgs = pkgs
+
+        if dirty and self.cache_path is not None:
+            _write_cache(self.cache_path, existing,
+                         dict((category, cached[category])
+                              for category in existing))
+
+    def _read_category(self, category):
+        base = pjoin(self.location, category)
+        logger.debug("vdb snapshot: reading vdb category %r", base)
+        d = {}
+        for pkgdir in listdir_dirs(base):
+            if pkgdir.startswith(".tmp.") or pkgdir.endswith(".lockfile") \
+                    or pkgdir.startswith("-MERGING-"):
+                continue
+            path = pjoin(base, pkgdir)
+            d[pkgdir] = dict((key, readfile(pjoin(path, key), True))
+                             for key in snapshot_keys)
+        return d
+
+
+def _read_cache(location):
+    try:
+        with open(location, "rb") as f:
+            if f.readline().rstrip("\n") != CACHE_MAGIC:
+                logger.debug("ignoring vdb snapshot of unknown format at %r",
+                             location)
+                return {}, {}
+            mtimes, categories = marshal.loads(f.read())
+        if not isinstance(mtimes, dict) or not isinstance(categories, dict):
+            raise ValueError("not a snapshot")
+        return mtimes, categories
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        logger.debug("failed reading vdb snapshot at %r", location)
+    except (ValueError, TypeError, EOFError):
+        # truncated or hand mangled; rereading the vdb will rewrite it.
+        logger.warning("corrupted vdb snapshot at %r; ignoring it", location)
+    return {}, {}
+
+
+def _write_cache(location, mtimes, categories):
+    old_umask = os.umask(0113)
+    f = None
+    try:
+        logger.debug("updating vdb snapshot at %r", location)
+        if not ensure_dirs(os.path.dirname(location),
+                           gid=portage_gid, mode=0775):
+            return
+        f = AtomicWriteFile(location, binary=True, gid=portage_gid,
+                            perms=0664)
+        f.write(CACHE_MAGIC + "\n")
+        f.write(marshal.dumps((mtimes, categories), 2))
+        f.close()
+    except EnvironmentError as e:
+        if f is not None:
+            f.discard()
+        if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+        logger.warning("unable to update vdb snapshot due to "
+            "lacking permissions")
+    finally:
+        os.umask(old_umask)